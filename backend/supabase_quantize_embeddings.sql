@@ -0,0 +1,65 @@
+-- Opt-in compact search for an existing destinations table (run with `python scripts/setup_db.py
+-- backend/supabase_quantize_embeddings.sql`). The index is built over an expression on
+-- `embedding`, so the table is not rewritten and no second copy of the vectors is stored.
+-- Needs pgvector >= 0.7 for halfvec and binary_quantize.
+alter extension vector update;
+
+create index if not exists destinations_half_hnsw on destinations
+  using hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops);
+-- For mode => 'binary' build this one instead (smaller, lower recall before re-ranking):
+-- create index if not exists destinations_bit_hnsw on destinations
+--   using hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops);
+
+-- Same search over the compact index: the halfvec (or bit) expression picks candidate_count
+-- candidates, which are re-ranked by exact distance on the full-precision embedding
+create or replace function match_destinations_quantized (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  candidate_count int default 100,
+  mode text default 'halfvec' -- 'halfvec' or 'binary'
+)
+returns table (
+  id bigint,
+  location_name text,
+  located_city text,
+  location_type text,
+  ai_context text,
+  similarity float
+)
+language plpgsql
+as $$
+declare
+  candidate_ids bigint[];
+begin
+  -- HNSW returns at most ef_search rows per scan
+  perform set_config('hnsw.ef_search', greatest(candidate_count, 40)::text, true);
+  if mode = 'binary' then
+    select array_agg(c.id) into candidate_ids from (
+      select destinations.id from destinations
+      order by binary_quantize(destinations.embedding)::bit(1536) <~> binary_quantize(query_embedding)::bit(1536)
+      limit candidate_count
+    ) c;
+  else
+    select array_agg(c.id) into candidate_ids from (
+      select destinations.id from destinations
+      order by destinations.embedding::halfvec(1536) <=> query_embedding::halfvec(1536)
+      limit candidate_count
+    ) c;
+  end if;
+
+  return query
+  select
+    destinations.id,
+    destinations.location_name,
+    destinations.located_city,
+    destinations.location_type,
+    destinations.ai_context,
+    1 - (destinations.embedding <=> query_embedding) as similarity
+  from destinations
+  where destinations.id = any(candidate_ids)
+    and 1 - (destinations.embedding <=> query_embedding) > match_threshold
+  order by destinations.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
@@ -10,7 +10,9 @@ create table destinations (
   location_type text,
   avg_rating numeric,
   ai_context text, -- Validated context string for RAG
-  embedding vector(1536) -- OpenAI text-embedding-3-small generates 1536 dimensions
+  embedding vector(1536), -- OpenAI text-embedding-3-small generates 1536 dimensions
+  source_key text unique, -- hash of name + address; one row per place (scripts/ingest_data.py)
+  content_hash text -- hash of the ingested fields + embedding model; unchanged rows are not re-embedded
 );
 
 -- Create a function to search for destinations
@@ -3,37 +3,71 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAdminUser
 from django.contrib.auth.models import User
-from .models import SavedTrip, ItineraryCache
+from django.db.models import F
+from .models import SavedTrip, TripListVersion, ItineraryCache
+from .services.http_client import http_client, async_http_client
+from .services.cache_metrics import itinerary_cache_metrics
+from .services.job_queue import job_metrics
+from .services.ollama_scheduler import ollama_scheduler
+from .services.weather_cache import weather_cache
+from .services.advice_rules import advice_rules
+from .services.intent_router import intent_router
+from .services.itinerary_repair import itinerary_repair_metrics
+from .services.token_budget import token_budget
+from .services.destinations_index import destinations_index
+from .pagination import keyset_paginate, apply_date_range, estimated_count, PaginationError
+
+def paginated_response(request, queryset, rows, next_cursor):
+    """Shared envelope for the admin list endpoints; the (estimated) total is only computed for the first page."""
+    data = {"results": rows, "next_cursor": next_cursor}
+    if not request.query_params.get("cursor"):
+        data["count"], data["count_is_estimate"] = estimated_count(queryset)
+    return Response(data, status=status.HTTP_200_OK)
 
 class AdminStatsView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        user_count = User.objects.count()
-        trip_count = SavedTrip.objects.count()
-        cache_count = ItineraryCache.objects.count()
+        user_count, _ = estimated_count(User.objects.all())
+        trip_count, _ = estimated_count(SavedTrip.objects.all())
+        cache_count, _ = estimated_count(ItineraryCache.objects.all())
         
         return Response({
             "total_users": user_count,
             "total_trips": trip_count,
-            "total_cached_queries": cache_count
+            "total_cached_queries": cache_count,
+            "http_pools": http_client.pool_stats(),
+            "http_async": async_http_client.stats(),
+            "itinerary_cache": itinerary_cache_metrics.snapshot(),
+            "itinerary_jobs": job_metrics(),
+            "ollama_scheduler": ollama_scheduler.snapshot(),
+            "weather_cache": weather_cache.snapshot(),
+            "advice_rules": advice_rules.snapshot(),
+            "intent_router": intent_router.snapshot(),
+            "itinerary_repair": itinerary_repair_metrics.snapshot(),
+            "token_budget": token_budget.snapshot(),
+            "destinations_index": destinations_index.snapshot()
         }, status=status.HTTP_200_OK)
 
 class AdminUserListView(APIView):
+    """
+    GET /api/v1/admin/users/?cursor=&page_size=&q=<email prefix>&created_after=&created_before=
+    """
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        users = User.objects.all().order_by('-date_joined')
-        data = [
-            {
-                "id": u.id,
-                "email": u.email,
-                "is_staff": u.is_staff,
-                "date_joined": u.date_joined,
-                "last_login": u.last_login
-            } for u in users
-        ]
-        return Response(data, status=status.HTTP_200_OK)
+        users = User.objects.all()
+        prefix = request.query_params.get("q")
+        if prefix:
+            users = users.filter(email__istartswith=prefix)
+        try:
+            users = apply_date_range(users, request, time_field="date_joined")
+            rows, next_cursor = keyset_paginate(
+                users.values("id", "email", "is_staff", "date_joined", "last_login"), request, time_field="date_joined"
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, users, rows, next_cursor)
 
 class AdminUserDetailView(APIView):
     permission_classes = [IsAdminUser]
@@ -49,45 +83,62 @@ class AdminUserDetailView(APIView):
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
 class AdminTripListView(APIView):
+    """
+    GET /api/v1/admin/trips/?cursor=&page_size=&user=<id or email>&q=<title prefix>&created_after=&created_before=
+    Itinerary payloads are never loaded here; open a single trip for the full JSON.
+    """
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        trips = SavedTrip.objects.select_related('user').all().order_by('-created_at')
-        data = [
-            {
-                "id": t.id,
-                "user_email": t.user.email,
-                "title": t.title,
-                "created_at": t.created_at,
-                "itinerary_json": t.itinerary_json
-            } for t in trips
-        ]
-        return Response(data, status=status.HTTP_200_OK)
+        trips = SavedTrip.objects.all()
+        user = request.query_params.get("user")
+        if user:
+            trips = trips.filter(user_id=int(user)) if user.isdigit() else trips.filter(user__email__iexact=user)
+        prefix = request.query_params.get("q")
+        if prefix:
+            trips = trips.filter(title__istartswith=prefix)
+        try:
+            trips = apply_date_range(trips, request)
+            rows, next_cursor = keyset_paginate(
+                trips.values("id", "title", "summary", "day_count", "created_at", user_email=F("user__email")), request
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, trips, rows, next_cursor)
 
 class AdminTripDetailView(APIView):
     permission_classes = [IsAdminUser]
 
     def delete(self, request, pk):
         try:
-            trip = SavedTrip.objects.get(pk=pk)
+            trip = SavedTrip.objects.select_related('user').get(pk=pk)
             trip.delete()
+            # The owner's cached trip list (ETag) must not survive the deletion
+            TripListVersion.bump(trip.user)
             return Response({"message": "Trip deleted successfully"}, status=status.HTTP_200_OK)
         except SavedTrip.DoesNotExist:
             return Response({"error": "Trip not found"}, status=status.HTTP_404_NOT_FOUND)
 
 class AdminCacheListView(APIView):
+    """
+    GET /api/v1/admin/cache/?cursor=&page_size=&q=<query prefix>&created_after=&created_before=
+    """
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        caches = ItineraryCache.objects.all().order_by('-created_at')
-        data = [
-            {
-                "id": c.id,
-                "query_text": c.query_text,
-                "created_at": c.created_at
-            } for c in caches
-        ]
-        return Response(data, status=status.HTTP_200_OK)
+        caches = ItineraryCache.objects.all()
+        prefix = request.query_params.get("q")
+        if prefix:
+            caches = caches.filter(query_text__startswith=prefix)
+        try:
+            caches = apply_date_range(caches, request)
+            # Never pull the embedding or itinerary payload for the listing
+            rows, next_cursor = keyset_paginate(
+                caches.values("id", "query_text", "created_at", "hit_count", "last_hit_at"), request
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, caches, rows, next_cursor)
         
     def delete(self, request):
         ItineraryCache.objects.all().delete()
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class TravelApiConfig(AppConfig):
     name = 'travel_api'
+
+    def ready(self):
+        # Read the prompt tokenizer before any request needs it, so counting never does I/O on the event loop
+        from .services.token_budget import token_budget
+        token_budget.tokenizer.load()
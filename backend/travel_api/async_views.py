@@ -0,0 +1,45 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers may be `async def`.
+
+    DRF's dispatch is synchronous, so this runs the same steps with the blocking
+    parts (JWT user lookup, permission and throttle checks) in the ORM thread and
+    awaits the handler on the event loop. Under an ASGI server the worker keeps
+    serving other requests while a handler waits on Ollama; under WSGI Django runs
+    the view through async_to_sync and behaves as before.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
@@ -0,0 +1,52 @@
+import csv
+import hashlib
+from django.core.management.base import BaseCommand, CommandError
+from travel_api.services.llama_service import LLaMAService
+from travel_api.services.destinations_index import build_index, city_key, document_text, DATASET_PATH, INDEX_DIR
+
+
+class Command(BaseCommand):
+    help = "Offline build of the memory-mapped destinations index used to ground itinerary prompts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--csv", default=DATASET_PATH)
+        parser.add_argument("--out", default=INDEX_DIR)
+        parser.add_argument("--batch-size", type=int, default=64)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["csv"], "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raise CommandError(f"Dataset not found: {options['csv']}")
+
+        rows = []
+        for record in csv.DictReader(raw.decode("utf-8-sig").splitlines()):
+            name = (record.get("Location_Name") or "").strip()
+            if not name:
+                continue
+            try:
+                rating = round(float(record.get("Avg_Rating") or ""), 2)
+            except ValueError:
+                rating = None
+            rows.append({
+                "name": name,
+                "city": city_key(record.get("Located_City"), record.get("Location")),
+                "type": (record.get("Location_Type") or "Other").strip(),
+                "rating": rating,
+                "address": (record.get("Location") or "").strip(),
+                "context": (record.get("AI_Context") or "").strip(),
+            })
+        self.stdout.write(f"Embedding {len(rows)} places...")
+
+        llama = LLaMAService()
+        vectors = llama.get_embeddings([document_text(row) for row in rows], batch_size=options["batch_size"])
+        failed = sum(1 for v in vectors if v is None)
+        if failed == len(rows):
+            raise CommandError("No embeddings returned; is Ollama running?")
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} places could not be embedded and are left out."))
+
+        source = {"path": options["csv"], "sha256": hashlib.sha256(raw).hexdigest(), "rows": len(rows)}
+        path = build_index(rows, vectors, llama.embedding_model, source, options["out"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path} ({len(rows) - failed} places)."))
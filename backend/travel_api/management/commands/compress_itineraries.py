@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from travel_api.models import ItineraryCache, SavedTrip
+from travel_api.services.itinerary_codec import itinerary_fields
+
+
+class Command(BaseCommand):
+    help = "Offline conversion of stored itinerary payloads between JSONB and compressed blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", choices=["cache", "trips", "all"], default="all")
+        parser.add_argument("--decompress", action="store_true", help="Move payloads back from itinerary_blob to itinerary_json")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        models = {"cache": [ItineraryCache], "trips": [SavedTrip], "all": [ItineraryCache, SavedTrip]}[options["table"]]
+        compress = not options["decompress"]
+
+        for model in models:
+            # Only rows still in the other representation
+            pending = model.objects.filter(itinerary_blob__isnull=compress).order_by('pk')
+            converted = 0
+            last_pk = 0
+            while True:
+                batch = list(pending.filter(pk__gt=last_pk).only('pk', 'itinerary_json', 'itinerary_blob')[:options["batch_size"]])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    for row in batch:
+                        model.objects.filter(pk=row.pk).update(**itinerary_fields(row.get_itinerary(), compress=compress))
+                converted += len(batch)
+                last_pk = batch[-1].pk
+                self.stdout.write(f"{model.__name__}: {converted} rows converted...")
+
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: done, {converted} rows {'compressed' if compress else 'decompressed'}."))
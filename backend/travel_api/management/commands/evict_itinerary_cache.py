@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from travel_api.services.cache_eviction import CacheEvictor, EVICTION_POLICY, MAX_ROWS, MAX_BYTES
+
+
+class Command(BaseCommand):
+    help = "Trim ItineraryCache to its row/byte budget by evicting the coldest entries (LRU, LFU or age)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", default=EVICTION_POLICY, choices=sorted(CacheEvictor.ORDERINGS))
+        parser.add_argument("--max-rows", type=int, default=MAX_ROWS, help="0 disables the row limit")
+        parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help="Budget for the live row data; 0 disables it")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many rows would be evicted")
+        parser.add_argument("--loop", type=int, default=0, metavar="SECONDS", help="Keep running, evicting every SECONDS")
+
+    def handle(self, *args, **options):
+        try:
+            evictor = CacheEvictor(
+                policy=options["policy"],
+                max_rows=options["max_rows"],
+                max_bytes=options["max_bytes"],
+                batch_size=options["batch_size"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        while True:
+            removed = evictor.evict(dry_run=options["dry_run"])
+            verb = "Would evict" if options["dry_run"] else "Evicted"
+            self.stdout.write(f"{verb} {removed} cache entries (policy={evictor.policy}).")
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,83 @@
+import time
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from travel_api.services import job_queue
+from travel_api.services.registry import get_llama_service
+
+STALE_SWEEP_SECONDS = 30
+
+
+class Command(BaseCommand):
+    help = "Run a pool of itinerary generation workers against the ItineraryJob queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=2, help="Jobs generated in parallel by this process")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self._stop())
+
+        llama_service = get_llama_service()
+        threads = [
+            threading.Thread(target=self._work, args=(index, llama_service, options), name=f"itinerary-worker-{index}")
+            for index in range(max(1, options["concurrency"]))
+        ]
+        self.stdout.write(f"👷 Starting {len(threads)} itinerary worker(s)...")
+        for thread in threads:
+            thread.start()
+
+        # Keep the main thread free for signals while it recovers jobs from dead workers
+        next_sweep = time.monotonic()
+        while not self.stopping.is_set() and any(thread.is_alive() for thread in threads):
+            if time.monotonic() >= next_sweep:
+                self._requeue_stale()
+                next_sweep = time.monotonic() + STALE_SWEEP_SECONDS
+            self.stopping.wait(1.0)
+
+        # Stopping: no more sweeps, just wait for the in-flight jobs
+        for thread in threads:
+            thread.join()
+        connection.close()
+        self.stdout.write("Workers stopped.")
+
+    def _requeue_stale(self):
+        try:
+            requeued, failed = job_queue.requeue_stale()
+        except Exception as e:
+            print(f"Stale Job Sweep Error: {e}")
+        else:
+            if requeued or failed:
+                self.stdout.write(f"♻️ Expired worker leases: {requeued} job(s) requeued, {failed} out of attempts and failed.")
+        close_old_connections()
+
+    def _stop(self):
+        self.stdout.write("Stopping after in-flight jobs finish...")
+        self.stopping.set()
+
+    def _work(self, index, llama_service, options):
+        worker = job_queue.worker_name(index)
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    job = job_queue.claim(worker)
+                except Exception as e:
+                    print(f"Job Claim Error: {e}")
+                    job = None
+
+                if job is None:
+                    if options["once"]:
+                        return
+                    self.stopping.wait(options["poll_interval"])
+                    continue
+
+                print(f"🛠️ {worker} picked up job {job.pk} (attempt {job.attempts}/{job.max_attempts})")
+                job_queue.run_job(job, llama_service)
+        finally:
+            # close_old_connections() keeps a healthy connection open; this thread is done with it
+            connection.close()
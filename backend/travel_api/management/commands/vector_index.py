@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from travel_api.models import ItineraryCache
+from travel_api.services.itinerary_store import SEARCH_MODES, EMBEDDING_DIMENSIONS
+
+HNSW_PARAMS = "WITH (m = 16, ef_construction = 64)"
+# layout: (index name, indexed expression + opclass). The compact layouts index an
+# expression over `embedding`, so no second copy of the vectors is stored in the table.
+LAYOUTS = {
+    "full": ("itinerarycache_embedding_hnsw", "embedding vector_cosine_ops"),
+    "halfvec": ("itinerarycache_half_hnsw", f"((embedding::halfvec({EMBEDDING_DIMENSIONS}))) halfvec_cosine_ops"),
+    "binary": ("itinerarycache_bit_hnsw", f"((binary_quantize(embedding)::bit({EMBEDDING_DIMENSIONS}))) bit_hamming_ops"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch the ItineraryCache similarity index between the float32 HNSW index and a compact "
+        "halfvec/binary expression index (re-ranked at full precision), then set PGVECTOR_SEARCH to match. "
+        "To switch without a gap: build with --keep-others, deploy the new PGVECTOR_SEARCH, then run again without it. "
+        "The model still declares the float32 index, so `migrate` on a fresh database recreates it; rerun this command afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("layout", nargs="?", choices=SEARCH_MODES, help="Index layout to build; omit to show the current one")
+        parser.add_argument("--keep-others", action="store_true", help="Do not drop the other layouts' indexes")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("vector_index needs PostgreSQL with pgvector >= 0.7.")
+
+        layout = options["layout"]
+        if layout:
+            self._build(layout)
+            if not options["keep_others"]:
+                for other, (name, _) in LAYOUTS.items():
+                    if other != layout:
+                        self._drop(name)
+        self._status()
+        if layout:
+            self.stdout.write(f"Set PGVECTOR_SEARCH={layout} on the web workers.")
+
+    def _state(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT i.indisvalid, pg_relation_size(i.indexrelid) FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s
+            """, [name])
+            return cursor.fetchone()
+
+    def _build(self, layout):
+        name, definition = LAYOUTS[layout]
+        state = self._state(name)
+        if state and not state[0]:
+            # Left behind by an interrupted CONCURRENTLY build
+            self._drop(name)
+            state = None
+        if state:
+            self.stdout.write(f"{name} already exists.")
+            return
+        self.stdout.write(f"Building {name} concurrently (the table stays writable)...")
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE INDEX CONCURRENTLY {name} ON {ItineraryCache._meta.db_table} USING hnsw ({definition}) {HNSW_PARAMS}")
+
+    def _drop(self, name):
+        if self._state(name):
+            self.stdout.write(f"Dropping {name}...")
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    def _status(self):
+        for layout, (name, _) in LAYOUTS.items():
+            state = self._state(name)
+            if state:
+                self.stdout.write(f"  {layout:<8} {name}: {state[1] / 2 ** 20:.1f} MiB{'' if state[0] else ' (INVALID)'}")
+            else:
+                self.stdout.write(f"  {layout:<8} {name}: not built")
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 17:36
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0003_alter_itinerarycache_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the embedded text', max_length=64)),
+                ('model', models.CharField(help_text='Embedding model that produced the vector', max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField(help_text='Embedding vector (dimension depends on the model)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'model'), name='uniq_embedding_hash_model')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0004_embeddingcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Canonical hash of structured preferences + model + prompt version', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='model_name',
+            field=models.CharField(blank=True, default='', help_text='LLM that produced the itinerary', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='prompt_version',
+            field=models.CharField(blank=True, default='', help_text='Prompt template version that produced the itinerary', max_length=50),
+        ),
+    ]
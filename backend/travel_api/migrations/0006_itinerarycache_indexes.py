@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 18:30
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built CONCURRENTLY so a large cache table stays writable during the build
+    atomic = False
+
+    dependencies = [
+        ('travel_api', '0005_itinerarycache_versioned_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='query_digest',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.MD5('query_text'), help_text='md5(query_text), hash-indexed for exact lookups', output_field=models.CharField(max_length=32)),
+        ),
+        AddIndexConcurrently(
+            model_name='itinerarycache',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='itinerarycache_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='itinerarycache',
+            index=django.contrib.postgres.indexes.HashIndex(fields=['query_digest'], name='itinerarycache_digest_hash'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0006_itinerarycache_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0, help_text='Times this entry was served (flushed in batches)'),
+        ),
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='last_hit_at',
+            field=models.DateTimeField(blank=True, help_text='Last time this entry was served (flushed in batches)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='itinerarycache',
+            index=models.Index(fields=['last_hit_at'], name='itinerarycache_last_hit'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerarycache',
+            index=models.Index(fields=['hit_count', 'last_hit_at'], name='itinerarycache_hits'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0007_itinerarycache_hit_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itinerarycache',
+            name='itinerary_blob',
+            field=models.BinaryField(blank=True, help_text='Compressed itinerary payload (see services/itinerary_codec.py)', null=True),
+        ),
+        migrations.AddField(
+            model_name='savedtrip',
+            name='itinerary_blob',
+            field=models.BinaryField(blank=True, help_text='Compressed itinerary payload (see services/itinerary_codec.py)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='itinerarycache',
+            name='itinerary_json',
+            field=models.JSONField(blank=True, help_text='The generated itinerary response', null=True),
+        ),
+        migrations.AlterField(
+            model_name='savedtrip',
+            name='itinerary_json',
+            field=models.JSONField(blank=True, help_text='The full structured trip data', null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+from travel_api.services.itinerary_codec import decompress_itinerary
+
+
+def backfill_trip_summaries(apps, schema_editor):
+    SavedTrip = apps.get_model('travel_api', 'SavedTrip')
+    for trip in SavedTrip.objects.only('pk', 'itinerary_json', 'itinerary_blob').iterator(chunk_size=500):
+        data = decompress_itinerary(trip.itinerary_blob) if trip.itinerary_blob is not None else trip.itinerary_json
+        data = data if isinstance(data, dict) else {}
+        SavedTrip.objects.filter(pk=trip.pk).update(
+            summary=str(data.get('summary') or ''),
+            day_count=len(data.get('days') or [])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0008_compressed_itinerary_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedtrip',
+            name='day_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of days in the itinerary'),
+        ),
+        migrations.AddField(
+            model_name='savedtrip',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Copied from the itinerary so listings never load the payload'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerarycache',
+            index=models.Index(fields=['-created_at', '-id'], name='itinerarycache_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='savedtrip',
+            index=models.Index(fields=['-created_at', '-id'], name='savedtrip_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='savedtrip',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='savedtrip_user_created_id'),
+        ),
+        migrations.RunPython(backfill_trip_summaries, migrations.RunPython.noop),
+    ]
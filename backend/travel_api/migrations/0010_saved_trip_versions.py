@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from travel_api.services.itinerary_codec import decompress_itinerary
+
+
+def backfill_trip_cities(apps, schema_editor):
+    SavedTrip = apps.get_model('travel_api', 'SavedTrip')
+    for trip in SavedTrip.objects.only('pk', 'itinerary_json', 'itinerary_blob').iterator(chunk_size=500):
+        data = decompress_itinerary(trip.itinerary_blob) if trip.itinerary_blob is not None else trip.itinerary_json
+        data = data if isinstance(data, dict) else {}
+        locations = [day.get('location') for day in data.get('days') or [] if isinstance(day, dict)]
+        SavedTrip.objects.filter(pk=trip.pk).update(cities=list(dict.fromkeys(str(loc) for loc in locations if loc)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0009_listing_projections'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripListVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trip_list_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='savedtrip',
+            name='cities',
+            field=models.JSONField(blank=True, default=list, help_text='Ordered, de-duplicated day locations'),
+        ),
+        migrations.RunPython(backfill_trip_cities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 21:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0010_saved_trip_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItineraryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preferences', models.JSONField(help_text='Structured preferences dict or free-text query, as posted to /plan/')),
+                ('mode', models.CharField(blank=True, default='', help_text="single | chunked | '' (auto)", max_length=10)),
+                ('use_cache', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Not claimable before this time (retry backoff)')),
+                ('locked_by', models.CharField(blank=True, default='', help_text='Worker that claimed the job', max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, help_text='First time a worker picked the job up', null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itinerary_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['run_after', 'id'], name='itineraryjob_claimable'), models.Index(condition=models.Q(('status', 'running')), fields=['locked_at'], name='itineraryjob_running'), models.Index(fields=['-finished_at'], name='itineraryjob_finished')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0011_itinerary_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grid_key', models.CharField(help_text="Snapped 'lat,lon' of the grid cell", max_length=40, unique=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('payload', models.JSONField(help_text='Open-Meteo `current` block')),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
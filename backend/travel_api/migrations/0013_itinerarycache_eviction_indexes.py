@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 18:33
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0012_weather_snapshots'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='itinerarycache',
+            name='itinerarycache_last_hit',
+        ),
+        migrations.RemoveIndex(
+            model_name='itinerarycache',
+            name='itinerarycache_hits',
+        ),
+        migrations.AddIndex(
+            model_name='itinerarycache',
+            index=models.Index(django.db.models.functions.comparison.Coalesce('last_hit_at', 'created_at'), models.F('id'), name='itinerarycache_lru'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerarycache',
+            index=models.Index(models.F('hit_count'), django.db.models.functions.comparison.Coalesce('last_hit_at', 'created_at'), models.F('id'), name='itinerarycache_lfu'),
+        ),
+    ]
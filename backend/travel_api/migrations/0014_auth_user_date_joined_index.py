@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 20:40
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index for keyset pagination of the admin user list, which walks auth_user
+    newest first on (date_joined, id). auth.User is not our model, so the index
+    is created in SQL rather than declared in Meta.indexes.
+    """
+
+    dependencies = [
+        ('travel_api', '0013_itinerarycache_eviction_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS auth_user_date_joined_id ON auth_user (date_joined DESC, id DESC);',
+            reverse_sql='DROP INDEX IF EXISTS auth_user_date_joined_id;',
+        ),
+    ]
@@ -1,21 +1,179 @@
 from django.db import models
 from django.contrib.auth.models import User
-from pgvector.django import VectorField
+from django.contrib.postgres.indexes import HashIndex
+from django.db.models.functions import MD5, Coalesce
+from django.utils import timezone
+from pgvector.django import VectorField, HnswIndex
+from .services.itinerary_codec import decompress_itinerary, itinerary_fields
 
-class ItineraryCache(models.Model):
+class CompressedItineraryMixin(models.Model):
+    """
+    An itinerary payload lives either in `itinerary_json` (JSONB) or, when
+    ITINERARY_COMPRESSION is on, in `itinerary_blob` (zlib + preset dictionary).
+    Always read and write it through get_itinerary()/set_itinerary().
+    """
+    itinerary_blob = models.BinaryField(null=True, blank=True, editable=False, help_text="Compressed itinerary payload (see services/itinerary_codec.py)")
+
+    class Meta:
+        abstract = True
+
+    def get_itinerary(self):
+        if self.itinerary_blob is not None:
+            return decompress_itinerary(self.itinerary_blob)
+        return self.itinerary_json
+
+    def set_itinerary(self, data):
+        for field, value in itinerary_fields(data).items():
+            setattr(self, field, value)
+
+class ItineraryCache(CompressedItineraryMixin):
     query_text = models.TextField(help_text="The exact query string used")
+    query_digest = models.GeneratedField(
+        expression=MD5('query_text'),
+        output_field=models.CharField(max_length=32),
+        db_persist=True,
+        help_text="md5(query_text), hash-indexed for exact lookups"
+    )
     embedding = VectorField(dimensions=768, help_text="Nomic embed-text embedding vector")
-    itinerary_json = models.JSONField(help_text="The generated itinerary response")
+    itinerary_json = models.JSONField(null=True, blank=True, help_text="The generated itinerary response")
+    cache_key = models.CharField(max_length=64, null=True, blank=True, db_index=True, help_text="Canonical hash of structured preferences + model + prompt version")
+    prompt_version = models.CharField(max_length=50, blank=True, default='', help_text="Prompt template version that produced the itinerary")
+    model_name = models.CharField(max_length=100, blank=True, default='', help_text="LLM that produced the itinerary")
     created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True, help_text="Last time this entry was served (flushed in batches)")
+    hit_count = models.PositiveIntegerField(default=0, help_text="Times this entry was served (flushed in batches)")
+
+    class Meta(CompressedItineraryMixin.Meta):
+        indexes = [
+            models.Index(name='itinerarycache_created_id', fields=['-created_at', '-id']),
+            # Eviction orderings (services/cache_eviction.py): an unhit entry was last used when it was generated
+            models.Index(Coalesce('last_hit_at', 'created_at'), 'id', name='itinerarycache_lru'),
+            models.Index('hit_count', Coalesce('last_hit_at', 'created_at'), 'id', name='itinerarycache_lfu'),
+            # Declared for the default "full" layout. `manage.py vector_index halfvec|binary` drops it
+            # outside migrations, so on such databases the migration state still lists it: `migrate` on a
+            # fresh database recreates it (rerun `vector_index` afterwards), and a migration that removes
+            # or alters it has to use DROP INDEX IF EXISTS instead of RemoveIndex.
+            HnswIndex(name='itinerarycache_embedding_hnsw', fields=['embedding'], m=16, ef_construction=64, opclasses=['vector_cosine_ops']),
+            HashIndex(name='itinerarycache_digest_hash', fields=['query_digest']),
+        ]
 
     def __str__(self):
         return f"Cache for: {self.query_text[:50]}"
 
-class SavedTrip(models.Model):
+class EmbeddingCache(models.Model):
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the embedded text")
+    model = models.CharField(max_length=100, help_text="Embedding model that produced the vector")
+    embedding = VectorField(help_text="Embedding vector (dimension depends on the model)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'model'], name='uniq_embedding_hash_model'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.content_hash[:12]}"
+
+class WeatherSnapshot(models.Model):
+    """Latest Open-Meteo reading per grid cell, shared by every worker (see services/weather_cache.py)."""
+    grid_key = models.CharField(max_length=40, unique=True, help_text="Snapped 'lat,lon' of the grid cell")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    payload = models.JSONField(help_text="Open-Meteo `current` block")
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Weather {self.grid_key} @ {self.fetched_at:%Y-%m-%d %H:%M}"
+
+class SavedTrip(CompressedItineraryMixin):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_trips')
     title = models.CharField(max_length=255, help_text="Title of the trip (e.g. 7 Days in Colombo)")
-    itinerary_json = models.JSONField(help_text="The full structured trip data")
+    itinerary_json = models.JSONField(null=True, blank=True, help_text="The full structured trip data")
+    summary = models.TextField(blank=True, default='', help_text="Copied from the itinerary so listings never load the payload")
+    day_count = models.PositiveSmallIntegerField(default=0, help_text="Number of days in the itinerary")
+    cities = models.JSONField(default=list, blank=True, help_text="Ordered, de-duplicated day locations")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(name='savedtrip_created_id', fields=['-created_at', '-id']),
+            models.Index(name='savedtrip_user_created_id', fields=['user', '-created_at', '-id']),
+        ]
+
+    def set_itinerary(self, data):
+        super().set_itinerary(data)
+        data = data if isinstance(data, dict) else {}
+        self.summary = str(data.get("summary") or "")
+        self.day_count = len(data.get("days") or [])
+        locations = [day.get("location") for day in data.get("days") or [] if isinstance(day, dict)]
+        self.cities = list(dict.fromkeys(str(loc) for loc in locations if loc))
+
     def __str__(self):
         return f"{self.user.username}'s Trip: {self.title}"
+
+class TripListVersion(models.Model):
+    """
+    Per-user counter bumped whenever the user's saved trips change.
+    The trips API derives ETag/Last-Modified from it, so a repeat dashboard load
+    is answered with 304 after one tiny lookup, without touching SavedTrip.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='trip_list_version')
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def bump(cls, user):
+        updated = cls.objects.filter(user=user).update(version=models.F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(user=user, defaults={'version': 1})
+
+    @classmethod
+    def current(cls, user):
+        """Return (version, updated_at); (0, None) if the user has never saved a trip."""
+        row = cls.objects.filter(user=user).values_list('version', 'updated_at').first()
+        return row if row else (0, None)
+
+    def __str__(self):
+        return f"{self.user_id}: v{self.version}"
+
+class ItineraryJob(models.Model):
+    """
+    Durable itinerary generation request, claimed by `run_itinerary_worker`
+    with SELECT ... FOR UPDATE SKIP LOCKED (see services/job_queue.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='itinerary_jobs')
+    preferences = models.JSONField(help_text="Structured preferences dict or free-text query, as posted to /plan/")
+    mode = models.CharField(max_length=10, blank=True, default='', help_text="single | chunked | '' (auto)")
+    use_cache = models.BooleanField(default=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimable before this time (retry backoff)")
+    locked_by = models.CharField(max_length=100, blank=True, default='', help_text="Worker that claimed the job")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text="First time a worker picked the job up")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever scan claimable rows, so keep the index to those
+            models.Index(name='itineraryjob_claimable', fields=['run_after', 'id'], condition=models.Q(status='queued')),
+            models.Index(name='itineraryjob_running', fields=['locked_at'], condition=models.Q(status='running')),
+            models.Index(name='itineraryjob_finished', fields=['-finished_at']),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status})"
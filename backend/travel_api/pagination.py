@@ -0,0 +1,120 @@
+import os
+import json
+import base64
+from django.db import connection
+from django.db.models import Q
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Above this many rows, COUNT(*) is replaced by the planner's estimate
+EXACT_COUNT_LIMIT = int(os.environ.get("ADMIN_EXACT_COUNT_LIMIT", "10000"))
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise PaginationError("Invalid cursor.")
+
+
+def page_size_from(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(request.query_params.get("page_size", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_paginate(queryset, request, time_field="created_at", page_size=None):
+    """
+    Newest-first keyset pagination on (time_field, id).
+
+    Unlike OFFSET, each page is an index range scan starting right after the last
+    row of the previous page, so page 500 costs the same as page 1. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    page_size = page_size or page_size_from(request)
+    queryset = queryset.order_by(f"-{time_field}", "-id")
+
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        position = decode_cursor(cursor)
+        moment = parse_datetime(str(position.get("t", "")))
+        if moment is None or not isinstance(position.get("id"), int):
+            raise PaginationError("Invalid cursor.")
+        queryset = queryset.filter(
+            Q(**{f"{time_field}__lt": moment}) | Q(**{time_field: moment, "id__lt": position["id"]})
+        )
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        last_time = last[time_field] if isinstance(last, dict) else getattr(last, time_field)
+        last_id = last["id"] if isinstance(last, dict) else last.id
+        next_cursor = encode_cursor({"t": last_time.isoformat(), "id": last_id})
+    return rows, next_cursor
+
+
+def _start_of(day):
+    # Compare against datetimes rather than created_at::date so the (created_at, id) index still applies
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def apply_date_range(queryset, request, time_field="created_at"):
+    """Filter by ?created_after=YYYY-MM-DD / ?created_before=YYYY-MM-DD (inclusive dates)."""
+    after = request.query_params.get("created_after")
+    before = request.query_params.get("created_before")
+    if after:
+        day = parse_date(after)
+        if day is None:
+            raise PaginationError("created_after must be YYYY-MM-DD.")
+        queryset = queryset.filter(**{f"{time_field}__gte": _start_of(day)})
+    if before:
+        day = parse_date(before)
+        if day is None:
+            raise PaginationError("created_before must be YYYY-MM-DD.")
+        queryset = queryset.filter(**{f"{time_field}__lt": _start_of(day + timedelta(days=1))})
+    return queryset
+
+
+def estimated_count(queryset):
+    """
+    Exact COUNT(*) for small tables; the planner's row estimate for big ones.
+    Returns (count, is_estimate).
+    """
+    if connection.vendor != "postgresql":
+        return queryset.count(), False
+
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        row = cursor.fetchone()
+    table_estimate = row[0] if row else -1
+
+    # reltuples is -1 before the first ANALYZE
+    if table_estimate < EXACT_COUNT_LIMIT:
+        return queryset.count(), False
+    if not queryset.query.where:
+        return table_estimate, True
+
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"]), True
@@ -0,0 +1,209 @@
+import os
+import re
+import threading
+
+# Rules below this confidence defer to the LLM
+MIN_CONFIDENCE = float(os.environ.get("ADVICE_RULES_MIN_CONFIDENCE", "0.8"))
+RULES_ENABLED = os.environ.get("ADVICE_RULES_ENABLED", "true").lower() != "false"
+
+# Activity classes, first match wins (so "temple museum" counts as a temple)
+ACTIVITY_KEYWORDS = [
+    ("water", ["surf", "snorkel", "diving", "dive", "whale", "dolphin", "kayak", "rafting", "boat", "swim", "lagoon"]),
+    ("beach", ["beach", "sunbath", "seaside", "coast"]),
+    ("hike", ["hike", "hiking", "trek", "climb", "peak", "rock", "trail", "waterfall", "falls", "summit", "mountain"]),
+    ("wildlife", ["safari", "national park", "wildlife", "elephant", "leopard", "bird"]),
+    ("temple", ["temple", "dagoba", "stupa", "vihara", "kovil", "mosque", "church", "shrine", "relic", "buddha", "sacred"]),
+    ("indoor", ["museum", "gallery", "spa", "cooking class", "mall", "shopping", "cafe", "restaurant", "dinner", "lunch", "breakfast", "tea factory", "workshop"]),
+    ("outdoor", ["walk", "tour", "garden", "park", "fort", "market", "ride", "train", "cycling", "sunset", "viewpoint", "village", "plantation", "ruins", "lake"]),
+]
+EXPOSED = {"water", "beach", "hike", "wildlife", "outdoor"}
+
+# Questions the rules can answer; anything else ("where can I eat?") goes to the LLM
+QUERY_KEYWORDS = {
+    "weather": ["weather", "rain", "sunny", "storm", "hot", "cold", "wet", "umbrella"],
+    "crowd": ["crowd", "busy", "queue", "packed", "people", "rush"],
+    "go": ["should i", "go now", "good time", "good idea", "is it ok", "okay to", "safe", "worth", "still go", "go ahead", "right now", "check"],
+}
+OFF_TOPIC = ["eat", "food", "restaurant", "hotel", "stay", "how far", "how long", "transport", "tuk", "taxi", "bus", "price", "cost", "ticket", "open", "recommend", "where", "what to", "history"]
+
+INDOOR_BY_THEME = [
+    ("beach", "a café or spa in town, or a visit to the nearest fort museum"),
+    ("adventure", "an indoor climbing wall, a cooking class, or a tea factory tour"),
+    ("culture", "a museum or a covered temple complex"),
+    ("heritage", "a museum or a covered temple complex"),
+    ("wildlife", "a nature interpretation centre, or a later game drive once the weather clears"),
+    ("nature", "a tea factory tour or a botanical conservatory"),
+    ("food", "a cooking class or a long lunch at a local restaurant"),
+]
+DEFAULT_INDOOR = "a museum, café or cooking class nearby"
+
+_ACTIVITY_PATTERNS = [(kind, re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + ")")) for kind, words in ACTIVITY_KEYWORDS]
+_OFF_TOPIC_PATTERN = re.compile(r"\b(?:" + "|".join(map(re.escape, OFF_TOPIC)) + r")\b")
+
+
+def classify_weather(code):
+    """Coarse weather class for a WMO code."""
+    if code is None:
+        return None
+    if code >= 95:
+        return "storm"
+    if code in (65, 80, 81, 82):
+        return "heavy_rain"
+    if code in (51, 53, 55, 61, 63):
+        return "rain"
+    if code in (45, 48):
+        return "fog"
+    if code == 0:
+        return "clear"
+    if code in (1, 2, 3):
+        return "cloudy"
+    return None
+
+
+def classify_activity(*texts):
+    text = " ".join(str(t) for t in texts if t).lower()
+    if not text:
+        return None
+    for kind, pattern in _ACTIVITY_PATTERNS:
+        if pattern.search(text):
+            return kind
+    return None
+
+
+def classify_query(query):
+    """"weather", "crowd", "go" or None when the question needs the LLM."""
+    text = str(query or "").lower()
+    if _OFF_TOPIC_PATTERN.search(text):
+        return None
+    for intent, words in QUERY_KEYWORDS.items():
+        if any(w in text for w in words):
+            return intent
+    return None
+
+
+def _alternative(theme):
+    theme = str(theme or "").lower()
+    for key, text in INDOOR_BY_THEME:
+        if key in theme:
+            return text
+    return DEFAULT_INDOOR
+
+
+def _crowd_note(day, kind):
+    """(sentence, confidence) describing crowds for this activity on this calendar day."""
+    if day["is_poya"]:
+        if kind == "temple":
+            return "It's a Poya day, so expect very heavy crowds at the temple; go early, dress in white and keep your visit short.", 1.0
+        return "It's a Poya day: temples will be packed, alcohol isn't sold and some shops close.", 0.9
+    if day["is_public_holiday"]:
+        return f"It's a public holiday ({', '.join(day['holidays'])}), so expect heavy crowds at popular spots; arrive early.", 0.9
+    if day["crowd_score"] >= 2:
+        return f"Crowds will be {day['crowd_level'].replace('_', ' ')} ({'; '.join(day['reasons']).lower()}); arrive early.", 0.9
+    if day["is_weekend"]:
+        return "It's the weekend, so expect moderate crowds at popular spots.", 0.9
+    return "", 0.95
+
+
+def _weather_verdict(weather_class, kind, activity, theme, temp):
+    """(sentence, confidence) for the activity under this weather class."""
+    name = activity or "your plan"
+    exposed = kind in EXPOSED
+    if weather_class == "storm":
+        if exposed:
+            return f"Thunderstorms are overhead, so {name} isn't safe right now; switch to {_alternative(theme)} until it passes.", 1.0
+        if kind in ("indoor", "temple"):
+            return f"There's a thunderstorm, but {name} keeps you under cover; travel there by car rather than on foot or tuk-tuk.", 0.85
+    if weather_class == "heavy_rain":
+        if kind in ("water", "beach", "hike"):
+            return f"Heavy rain makes {name} unpleasant and unsafe (rough sea, slippery trails); try {_alternative(theme)} instead.", 0.95
+        if kind == "indoor":
+            return f"It's pouring, which makes this a good time for {name}.", 0.9
+    if weather_class == "rain":
+        if kind in ("water", "beach"):
+            return f"It's raining, so {name} won't be much fun right now; try {_alternative(theme)} and check again later.", 0.9
+        if kind == "hike":
+            return f"Rain makes trails slippery and brings out leeches; postpone {name} or go well prepared with proper shoes.", 0.85
+        if kind == "indoor":
+            return f"It's raining, so {name} is a good choice right now.", 0.9
+    if weather_class == "fog" and kind == "hike":
+        return f"Fog will hide the views on {name}; if you can, wait for it to lift later in the morning.", 0.85
+    if weather_class in ("clear", "cloudy"):
+        sky = "clear skies" if weather_class == "clear" else "dry, partly cloudy weather"
+        if kind in ("hike", "outdoor", "wildlife") and temp is not None and temp >= 33:
+            return f"It's dry but {temp}°C, so start {name} early or late, carry water and rest in the shade.", 0.85
+        if kind in EXPOSED:
+            return f"With {sky}, the weather is great for {name} right now. Wear sunscreen and stay hydrated.", 0.95
+        if kind in ("indoor", "temple"):
+            return f"With {sky}, it's a good time for {name}.", 0.9
+    return None, 0.0
+
+
+class AdviceRuleEngine:
+    """
+    Deterministic fast path for live advice.
+
+    Maps (weather class x activity class x crowd status) to a templated answer
+    with a confidence. Only confident matches for weather/crowd/go-ahead
+    questions are answered here; anything ambiguous (unknown weather, stale
+    readings, unclassified activities, open questions) returns None so the caller
+    asks the LLM. Counts which path served each request.
+    """
+
+    def __init__(self, min_confidence=MIN_CONFIDENCE, enabled=RULES_ENABLED):
+        self.min_confidence = min_confidence
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts = {"rules": 0, "llm": 0}
+        self._by_rule = {}
+
+    def evaluate(self, query, weather, day, activity=None, description=None, theme=None):
+        """Returns {"advice", "rule", "confidence"} or None to defer to the LLM."""
+        if not self.enabled:
+            return None
+        intent = classify_query(query)
+        if intent is None:
+            return None
+        kind = classify_activity(activity, description) or (classify_activity(query) if intent == "go" else None)
+        crowd, crowd_conf = _crowd_note(day, kind)
+        status = "poya" if day["is_poya"] else day["crowd_level"]
+
+        if intent == "crowd":
+            # Answered from the calendar alone
+            parts, confidence, weather_class = [crowd or "It's a regular weekday, so crowds should be manageable."], crowd_conf, "any"
+        else:
+            if not weather or weather.get("stale"):
+                return None
+            weather_class = classify_weather(weather.get("weather_code"))
+            if weather_class is None or kind is None:
+                return None
+            verdict, weather_conf = _weather_verdict(weather_class, kind, activity, theme, weather.get("temperature_2m"))
+            if verdict is None:
+                return None
+            parts, confidence = [verdict, crowd], min(weather_conf, crowd_conf)
+
+        if confidence < self.min_confidence:
+            return None
+        return {
+            "advice": " ".join(p for p in parts if p),
+            "rule": f"{intent}:{weather_class}:{kind or 'any'}:{status}",
+            "confidence": round(confidence, 2),
+        }
+
+    def record(self, source, rule=None):
+        with self._lock:
+            self._counts[source] += 1
+            if rule:
+                self._by_rule[rule] = self._by_rule.get(rule, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+            top = sorted(self._by_rule.items(), key=lambda kv: -kv[1])[:10]
+        total = counts["rules"] + counts["llm"]
+        counts["hit_rate"] = round(counts["rules"] / total, 4) if total else None
+        counts["top_rules"] = dict(top)
+        counts["enabled"] = self.enabled
+        return counts
+
+
+advice_rules = AdviceRuleEngine()
@@ -0,0 +1,120 @@
+import os
+import math
+import time
+import atexit
+import threading
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from travel_api.models import ItineraryCache
+
+MAX_ROWS = int(os.environ.get("ITINERARY_CACHE_MAX_ROWS", "10000"))
+MAX_BYTES = int(os.environ.get("ITINERARY_CACHE_MAX_BYTES", "0")) # 0 = no byte budget
+EVICTION_POLICY = os.environ.get("ITINERARY_CACHE_EVICTION_POLICY", "lru")
+HIT_FLUSH_SECONDS = float(os.environ.get("ITINERARY_CACHE_HIT_FLUSH_SECONDS", "30"))
+
+
+class HitRecorder:
+    """
+    Buffers cache hits in memory and writes them back in one batch.
+
+    Serving a cached itinerary should not cost an UPDATE per request, so hits are
+    aggregated per row and flushed at most every `flush_seconds`, and once more
+    when the process exits. The buffer is per process: other processes (such as
+    the eviction CronJob) only see hits once the serving worker has flushed them.
+    """
+
+    def __init__(self, flush_seconds=HIT_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, pk):
+        with self._lock:
+            count, _ = self._pending.get(pk, (0, None))
+            self._pending[pk] = (count + 1, timezone.now())
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                for pk, (count, last_hit) in pending.items():
+                    ItineraryCache.objects.filter(pk=pk).update(
+                        hit_count=F('hit_count') + count,
+                        last_hit_at=last_hit
+                    )
+        except Exception as e:
+            print(f"Cache Hit Flush Error: {e}")
+
+
+class CacheEvictor:
+    """Trims ItineraryCache to a row count and/or byte budget, coldest entries first."""
+
+    ORDERINGS = {
+        # Being generated counts as a use, so a fresh entry is not evicted before its first hit
+        "lru": (Coalesce('last_hit_at', 'created_at').asc(), 'id'),
+        "lfu": ('hit_count', Coalesce('last_hit_at', 'created_at').asc(), 'id'),
+        "age": ('created_at', 'id'),
+    }
+
+    def __init__(self, policy=EVICTION_POLICY, max_rows=MAX_ROWS, max_bytes=MAX_BYTES, batch_size=500):
+        if policy not in self.ORDERINGS:
+            raise ValueError(f"Unknown eviction policy '{policy}'. Choose from: {', '.join(self.ORDERINGS)}")
+        self.policy = policy
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+
+    def _live_bytes(self):
+        # Size of the live rows rather than of the relation: the files only shrink on
+        # VACUUM FULL, so after a DELETE they would still look over budget.
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT coalesce(sum(pg_column_size(t.*)), 0) FROM {ItineraryCache._meta.db_table} t")
+            return cursor.fetchone()[0]
+
+    def excess_rows(self):
+        """How many rows must go to satisfy both budgets."""
+        total = ItineraryCache.objects.count()
+        excess = max(0, total - self.max_rows) if self.max_rows else 0
+
+        if self.max_bytes and total and connection.vendor == "postgresql":
+            live_bytes = self._live_bytes()
+            if live_bytes > self.max_bytes:
+                per_row = live_bytes / total
+                excess = max(excess, math.ceil((live_bytes - self.max_bytes) / per_row))
+        return min(excess, total)
+
+    def evict(self, dry_run=False):
+        """Delete the coldest entries in batches. Returns the number of rows removed (or that would be)."""
+        # Only hits buffered in this process; the web workers flush their own at most
+        # HIT_FLUSH_SECONDS apart, so a row first hit within that window can still look cold.
+        hit_recorder.flush()
+
+        to_remove = self.excess_rows()
+        if dry_run or not to_remove:
+            return to_remove
+
+        removed = 0
+        ordering = self.ORDERINGS[self.policy]
+        while removed < to_remove:
+            batch = min(self.batch_size, to_remove - removed)
+            ids = list(ItineraryCache.objects.order_by(*ordering).values_list('id', flat=True)[:batch])
+            if not ids:
+                break
+            deleted, _ = ItineraryCache.objects.filter(pk__in=ids).delete()
+            removed += deleted
+        return removed
+
+
+hit_recorder = HitRecorder()
+# Keep the last window of hits when a worker is stopped or recycled
+atexit.register(hit_recorder.flush)
@@ -0,0 +1,25 @@
+import threading
+
+
+class CacheMetrics:
+    """Thread-safe per-process counters for the itinerary cache tiers."""
+
+    NAMES = ("hit_key", "hit_semantic", "miss", "bypass")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in self.NAMES}
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hit_key"] + counts["hit_semantic"] + counts["miss"]
+        counts["hit_rate"] = round((counts["hit_key"] + counts["hit_semantic"]) / lookups, 4) if lookups else None
+        return counts
+
+
+itinerary_cache_metrics = CacheMetrics()
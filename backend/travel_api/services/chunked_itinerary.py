@@ -0,0 +1,280 @@
+import os
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from .ollama_scheduler import AdmissionRejected
+from .token_budget import token_budget
+from .itinerary_repair import salvage, strip_fences, valid_day, itinerary_repair_metrics
+
+# Trips at least this long use the skeleton + parallel batches path by default
+CHUNKED_MIN_DAYS = int(os.environ.get("ITINERARY_CHUNKED_MIN_DAYS", "8"))
+# Days generated per batch request
+CHUNK_DAYS = int(os.environ.get("ITINERARY_CHUNK_DAYS", "3"))
+# Max batch requests in flight against Ollama (pair with OLLAMA_NUM_PARALLEL on the server)
+CHUNK_CONCURRENCY = int(os.environ.get("ITINERARY_CHUNK_CONCURRENCY", "3"))
+
+
+class ChunkedItineraryGenerator:
+    """
+    Two-phase itinerary generation for long trips.
+
+    1. Ask the model for a compact route skeleton (day -> location, theme).
+    2. Generate the full day details in small batches, concurrently.
+
+    The batches are merged back into the same schema the single-shot prompt produces,
+    so the frontend cannot tell the difference. Wall-clock time tracks the slowest
+    batch rather than the total number of days. Days lost to a failed or truncated
+    batch are requested again on their own before falling back to the bare skeleton.
+    """
+
+    def __init__(self, llama_service, chunk_days=CHUNK_DAYS, concurrency=CHUNK_CONCURRENCY):
+        self.llama = llama_service
+        self.chunk_days = max(1, chunk_days)
+        self.concurrency = max(1, concurrency)
+
+    def _chat_payload(self, system_prompt, user_message, kind, units):
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+        return {
+            "model": self.llama.model,
+            "messages": messages,
+            "stream": False,
+            "format": "json",
+            "options": {"temperature": 0.4, **token_budget.plan(kind, messages, units)}
+        }
+
+    def _parse_json(self, response, kind, units):
+        content = self.llama._itinerary_content(response, kind, units)
+        if kind == "batch":
+            # Keep the days that closed before a cut-off; the rest are continued later
+            return salvage(content)[0]
+        return json.loads(strip_fences(content))
+
+    def _chat_json(self, system_prompt, user_message, kind, units):
+        payload = self._chat_payload(system_prompt, user_message, kind, units)
+        response = self.llama._ollama_chat("generation", payload)
+        return self._parse_json(response, kind, units)
+
+    async def _achat_json(self, system_prompt, user_message, kind, units):
+        payload = self._chat_payload(system_prompt, user_message, kind, units)
+        response = await self.llama._aollama_chat("generation", payload)
+        return self._parse_json(response, kind, units)
+
+    def generate_skeleton(self, prefs, total_days):
+        """Return {"title", "summary", "route": [{"day", "location", "theme"}, ...]} with exactly total_days entries."""
+        skeleton = self._chat_json(*self._skeleton_prompt(prefs, total_days))
+        return self._normalise_route(skeleton, prefs, total_days)
+
+    async def agenerate_skeleton(self, prefs, total_days):
+        skeleton = await self._achat_json(*self._skeleton_prompt(prefs, total_days))
+        return self._normalise_route(skeleton, prefs, total_days)
+
+    def _skeleton_prompt(self, prefs, total_days):
+        start_loc = prefs["start_loc"]
+        trip_type = prefs["trip_type"]
+        system_prompt = "You are an expert Sri Lanka Travel Agent. Plan only the high-level route of a trip. Be brief."
+        user_message = f"""
+        TASK: Plan the day-by-day route for a {total_days}-Day trip: "{prefs['query_text']}"
+
+        REQUIRED JSON FORMAT:
+        {{
+          "title": "Unique and catchy trip title",
+          "summary": "Compelling 1-sentence summary of the trip",
+          "route": [
+            {{"day": 1, "location": "{start_loc}", "theme": "Short day theme related to {trip_type}"}},
+            {{"day": 2, "location": "Next City", "theme": "Short day theme"}}
+          ]
+        }}
+
+        RULES:
+        1. Day 1 location MUST be "{start_loc}".
+        2. The "route" array MUST contain EXACTLY {total_days} entries, one per day, using real Sri Lankan cities.
+        3. Keep the route geographically sensible (no back-and-forth across the island).
+        """
+        return system_prompt, user_message, "skeleton", total_days
+
+    def _normalise_route(self, skeleton, prefs, total_days):
+        # The skeleton is the source of truth for day count, so force it to match the request
+        route = [stop for stop in skeleton.get("route", []) if isinstance(stop, dict)][:total_days]
+        if not route:
+            route = [{"location": prefs["start_loc"], "theme": prefs["trip_type"]}]
+        while len(route) < total_days:
+            route.append({"location": route[-1].get("location"), "theme": prefs["trip_type"]})
+
+        for index, stop in enumerate(route):
+            stop["day"] = index + 1
+            stop.setdefault("location", route[index - 1].get("location") if index else prefs["start_loc"])
+            stop.setdefault("theme", prefs["trip_type"])
+        if prefs["start_loc"] != "Sri Lanka":
+            route[0]["location"] = prefs["start_loc"]
+
+        return {
+            "title": skeleton.get("title") or f"{total_days}-Day Sri Lanka {prefs['trip_type']} Trip",
+            "summary": skeleton.get("summary", ""),
+            "route": route,
+        }
+
+    def generate_batch(self, prefs, skeleton, batch):
+        """Generate the full day objects for one slice of the route."""
+        return self._batch_days(self._chat_json(*self._batch_prompt(prefs, skeleton, batch)))
+
+    async def agenerate_batch(self, prefs, skeleton, batch):
+        return self._batch_days(await self._achat_json(*self._batch_prompt(prefs, skeleton, batch)))
+
+    def _batch_days(self, result):
+        return result.get("days", []) if isinstance(result, dict) else []
+
+    def _batch_prompt(self, prefs, skeleton, batch):
+        trip_type = prefs["trip_type"]
+        full_route = "; ".join(f"Day {stop['day']}: {stop['location']}" for stop in skeleton["route"])
+        wanted = "\n".join(
+            f"        - Day {stop['day']}: location \"{stop['location']}\", theme \"{stop['theme']}\"" for stop in batch
+        )
+        system_prompt = "You are an expert Sri Lanka Travel Agent. Write detailed itinerary days for the given route stops only."
+        user_message = f"""
+        TRIP: "{skeleton['title']}" ({prefs['query_text']})
+        FULL ROUTE (for context only): {full_route}
+
+        Write ONLY these days:
+{wanted}
+
+        REQUIRED JSON FORMAT:
+        {{
+          "days": [
+            {{
+                "day": {batch[0]['day']},
+                "location": "{batch[0]['location']}",
+                "theme": "{batch[0]['theme']}",
+                "activities": [
+                    {{"time": "Morning", "activity": "Specific Activity Name", "description": "Write a detailed description of what they will do"}},
+                    {{"time": "Afternoon", "activity": "Specific Activity Name", "description": "Write a detailed description of what they will do"}}
+                ],
+                "suggested_restaurants": ["Name of a real restaurant in this city", "Another real restaurant"],
+                "narrative": "Write a full descriptive paragraph about the day's experiences."
+            }}
+          ]
+        }}
+
+        RULES:
+        1. Output EXACTLY {len(batch)} day objects with the day numbers, locations and themes listed above.
+        2. Use real, factual Sri Lankan activities and restaurant names relevant to a "{trip_type}" style trip.
+        3. Maintain strict JSON formatting. DO NOT include code comments in the output JSON.
+        """
+        wanted_days = {stop["day"] for stop in batch}
+        calendar = [(day, line) for day, line in prefs.get("calendar", []) if day in wanted_days]
+        if calendar:
+            user_message += self.llama._calendar_rule(calendar)
+        user_message += self.llama._grounding_rule([(stop["day"], stop["location"]) for stop in batch], {**prefs, "calendar": calendar})
+        return system_prompt, user_message, "batch", len(batch)
+
+    def _placeholder_day(self, stop):
+        return {
+            "day": stop["day"],
+            "location": stop["location"],
+            "theme": stop["theme"],
+            "activities": [],
+            "suggested_restaurants": [],
+            "narrative": "",
+        }
+
+    def _batches(self, skeleton):
+        route = skeleton["route"]
+        batches = [route[i:i + self.chunk_days] for i in range(0, len(route), self.chunk_days)]
+        print(f"⚡ Generating {len(batches)} batches with concurrency {self.concurrency}...")
+        return batches
+
+    def _collect(self, generated, batch, days, error=None):
+        if isinstance(error, AdmissionRejected):
+            raise error
+        if error is not None:
+            print(f"Batch Error (days {batch[0]['day']}-{batch[-1]['day']}): {error}")
+            days = []
+        # Match generated days back onto the skeleton positionally; the model sometimes renumbers
+        for stop, day in zip(batch, [d for d in days if isinstance(d, dict)]):
+            if valid_day(day):
+                day["day"] = stop["day"]
+                generated[stop["day"]] = day
+
+    def _collect_all(self, batches, results):
+        """{day number: day} from each batch's days or the exception it raised."""
+        generated = {}
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                self._collect(generated, batch, [], error=result)
+            else:
+                self._collect(generated, batch, result)
+        return generated
+
+    def _total_days(self, prefs):
+        total_days = self.llama._duration(prefs)
+        print(f"🧭 Chunked generation: skeleton for {total_days} days...")
+        return total_days
+
+    def _route(self, skeleton):
+        return {stop["day"]: stop for stop in skeleton["route"]}
+
+    def generate(self, prefs):
+        total_days = self._total_days(prefs)
+        skeleton = self.generate_skeleton(prefs, total_days)
+        batches = self._batches(skeleton)
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            # Copy the request context so batches are scheduled as the calling user
+            futures = [pool.submit(contextvars.copy_context().run, self.generate_batch, prefs, skeleton, batch) for batch in batches]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        generated = self._collect_all(batches, results)
+
+        if generated:
+            self.llama._continue_missing(prefs, generated, total_days, self._route(skeleton))
+        return self._merge(prefs, skeleton, generated, total_days)
+
+    async def agenerate(self, prefs):
+        """generate() for the ASGI path: batches run as concurrent coroutines instead of threads."""
+        total_days = self._total_days(prefs)
+        skeleton = await self.agenerate_skeleton(prefs, total_days)
+        batches = self._batches(skeleton)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch):
+            async with limit:
+                return await self.agenerate_batch(prefs, skeleton, batch)
+
+        results = await asyncio.gather(*(run(batch) for batch in batches), return_exceptions=True)
+        generated = self._collect_all(batches, results)
+
+        if generated:
+            await self.llama._acontinue_missing(prefs, generated, total_days, self._route(skeleton))
+        return self._merge(prefs, skeleton, generated, total_days)
+
+    def _merge(self, prefs, skeleton, generated, total_days):
+        route = skeleton["route"]
+        if not generated:
+            raise RuntimeError("All day batches failed to generate")
+        missing = len(route) - len(generated)
+        if missing:
+            itinerary_repair_metrics.incr("incomplete")
+            print(f"⚠️ {missing} day(s) still missing after continuation; filled from the route skeleton.")
+
+        merged_days = []
+        for stop in route:
+            day = generated.get(stop["day"]) or self._placeholder_day(stop)
+            day["day"] = stop["day"]
+            day["location"] = stop["location"]
+            day.setdefault("theme", stop["theme"])
+            merged_days.append(day)
+
+        return {
+            "title": skeleton["title"],
+            "summary": skeleton["summary"],
+            "trip_theme": prefs["trip_type"],
+            "total_days": total_days,
+            "days": merged_days,
+        }
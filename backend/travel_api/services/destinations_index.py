@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from . import locations
+
+DATASET_PATH = os.environ.get("DESTINATIONS_CSV", str(settings.BASE_DIR.parent / "data" / "SriLanka_Travel_Dataset_Final.csv"))
+# Built by `manage.py build_destinations_index`; workers only ever read it
+INDEX_DIR = os.environ.get("DESTINATIONS_INDEX_DIR", str(settings.BASE_DIR / "artifacts"))
+MANIFEST_NAME = "destinations.json"
+# 2: rows keyed on Located_City (city_key); older indexes must be rebuilt
+FORMAT_VERSION = 2
+
+RESTAURANT_TYPES = {"Restaurants"}
+# Places per location injected into a day's prompt
+PROMPT_RESTAURANTS = int(os.environ.get("DESTINATIONS_PROMPT_RESTAURANTS", "3"))
+PROMPT_PLACES = int(os.environ.get("DESTINATIONS_PROMPT_PLACES", "3"))
+
+
+def city_key(city, address=None):
+    """
+    Index key for a dataset row: its Located_City matched against the gazetteer
+    ("Colombo 03." -> "colombo"), else the trailing town of its address, else the
+    cleaned Located_City itself ("Pannipitiya" -> "pannipitiya").
+    """
+    key = locations.town(city, last=True) or locations.town(address, last=True)
+    if key:
+        return key
+    return " ".join(re.sub(r"[^a-z ]+", " ", str(city or "").lower()).split()) or "unknown"
+
+
+def location_key(location):
+    """Index key for a day's location; its first town wins ("Kandy to Ella" -> "kandy")."""
+    return locations.town(location) or city_key(location)
+
+
+def document_text(row):
+    """Text embedded for a dataset row."""
+    return f"{row['name']} ({row['type']}, {row['city']}). {row['context']}"[:1000]
+
+
+def build_index(rows, vectors, model, source, out_dir=INDEX_DIR):
+    """
+    Write a versioned index: an L2-normalised float32 matrix (.npy) with rows sorted
+    by (city, type) so each city and city/type pair is one contiguous slice, plus a
+    JSON manifest with the row metadata and offset tables. Returns the manifest path.
+    """
+    keep = [i for i, v in enumerate(vectors) if v is not None]
+    order = sorted(keep, key=lambda i: (rows[i]["city"], rows[i]["type"], -(rows[i]["rating"] or 0), rows[i]["name"]))
+    matrix = np.asarray([vectors[i] for i in order], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+
+    meta = [{k: rows[i][k] for k in ("name", "city", "type", "rating", "address")} for i in order]
+    cities, city_types, types = {}, {}, {}
+    for position, row in enumerate(meta):
+        for table, key in ((cities, row["city"]), (city_types, f"{row['city']}|{row['type']}")):
+            start, _ = table.get(key, (position, position))
+            table[key] = (start, position + 1)
+        types.setdefault(row["type"], []).append(position)
+
+    version = f"v{FORMAT_VERSION}-{model.replace(':', '_').replace('/', '_')}-{source['sha256'][:12]}"
+    os.makedirs(out_dir, exist_ok=True)
+    matrix_name = f"destinations-{version}.npy"
+    np.save(os.path.join(out_dir, matrix_name), matrix)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "model": model,
+        "dim": int(matrix.shape[1]) if len(matrix) else 0,
+        "count": len(meta),
+        "built_at": timezone.now().isoformat(),
+        "source": source,
+        "matrix": matrix_name,
+        "rows": meta,
+        "cities": cities,
+        "city_types": city_types,
+        "types": types,
+    }
+    # Write then rename so a worker never reads a half-written manifest
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+class DestinationsIndex:
+    """
+    Read-only, per-worker view of the destinations dataset for grounding prompts.
+
+    The embedding matrix is memory-mapped, so every worker process on a host
+    shares the same page-cache copy and startup does no embedding work. A city
+    lookup is a dict hit to a contiguous slice; ranking it against a theme vector
+    is one small matrix-vector product.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.manifest = None
+        self.matrix = None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return self.matrix is not None
+        with self._lock:
+            if not self._loaded:
+                try:
+                    with open(os.path.join(self.index_dir, MANIFEST_NAME), encoding="utf-8") as f:
+                        manifest = json.load(f)
+                    if manifest.get("format") != FORMAT_VERSION:
+                        raise ValueError(f"unsupported index format {manifest.get('format')}")
+                    self.matrix = np.load(os.path.join(self.index_dir, manifest["matrix"]), mmap_mode="r")
+                    self.manifest = manifest
+                    print(f"🗺️ Destinations index {manifest['version']} loaded ({manifest['count']} places).")
+                except FileNotFoundError:
+                    print(f"Warning: No destinations index in {self.index_dir}. Run `manage.py build_destinations_index`.")
+                except Exception as e:
+                    print(f"Error loading destinations index: {e}")
+                self._loaded = True
+        return self.matrix is not None
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+            self.manifest = self.matrix = None
+        return self._ensure_loaded()
+
+    @property
+    def model(self):
+        return self.manifest["model"] if self._ensure_loaded() else None
+
+    def top(self, location, theme_vector=None, k=5, types=None, exclude_types=None):
+        """Best `k` places in the location's city, ranked by theme similarity (then rating)."""
+        if not self._ensure_loaded():
+            return []
+        city = location_key(location)
+        if types:
+            ranges = [self.manifest["city_types"].get(f"{city}|{t}") for t in types]
+            positions = [p for r in ranges if r for p in range(*r)]
+        else:
+            span = self.manifest["cities"].get(city)
+            positions = list(range(*span)) if span else []
+        rows = self.manifest["rows"]
+        if exclude_types:
+            positions = [p for p in positions if rows[p]["type"] not in exclude_types]
+        if not positions:
+            return []
+
+        if theme_vector is not None and len(theme_vector) == self.matrix.shape[1]:
+            query = np.asarray(theme_vector, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            scores = dict(zip(positions, (self.matrix[positions] @ query).tolist()))
+            ranked = sorted(positions, key=lambda p: -scores[p])
+        else:
+            # Rows are stored best-rated first within each city/type slice
+            ranked = sorted(positions, key=lambda p: -(rows[p]["rating"] or 0))
+        return [rows[p] for p in ranked[:k]]
+
+    def grounding(self, location, theme_vector=None):
+        """Real restaurants and places for one day's location, or None when the city is not indexed."""
+        restaurants = self.top(location, theme_vector, PROMPT_RESTAURANTS, types=RESTAURANT_TYPES)
+        places = self.top(location, theme_vector, PROMPT_PLACES, exclude_types=RESTAURANT_TYPES)
+        if not restaurants and not places:
+            return None
+        return {"restaurants": restaurants, "places": places}
+
+    def prompt_lines(self, locations_by_day, theme_vector=None):
+        """Prompt lines listing indexed places for each (day, location)."""
+        lines = []
+        for day, location in locations_by_day:
+            found = self.grounding(location, theme_vector)
+            if not found:
+                continue
+            parts = []
+            if found["restaurants"]:
+                parts.append("restaurants: " + ", ".join(r["name"] for r in found["restaurants"]))
+            if found["places"]:
+                parts.append("places: " + ", ".join(f"{p['name']} ({p['type']})" for p in found["places"]))
+            lines.append(f"Day {day} ({location}): {'; '.join(parts)}")
+        return lines
+
+    def snapshot(self):
+        if not self._ensure_loaded():
+            return {"loaded": False}
+        return {"loaded": True, "version": self.manifest["version"], "count": self.manifest["count"], "cities": len(self.manifest["cities"])}
+
+
+destinations_index = DestinationsIndex()
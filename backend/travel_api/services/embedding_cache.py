@@ -0,0 +1,68 @@
+import os
+import hashlib
+import threading
+from cachetools import LRUCache
+from travel_api.models import EmbeddingCache as EmbeddingCacheModel
+
+# Max embeddings kept in memory per worker (768 floats each, roughly 6 KB in Python lists)
+MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_ENTRIES", "5000"))
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache keyed on (sha256(text), model).
+
+    Level 1 is a bounded in-process LRU; level 2 is the EmbeddingCache table so
+    every worker and replica shares vectors. Keying on the model name means a
+    change of embedding model never serves vectors from the old one.
+    """
+
+    def __init__(self, max_entries=MEMORY_ENTRIES):
+        self._lock = threading.Lock()
+        self._memory = LRUCache(maxsize=max_entries)
+
+    def get_many(self, texts, model):
+        """Return {text: embedding} for every text already cached."""
+        hashes = {content_hash(text): text for text in texts}
+        found = {}
+        missing = []
+        with self._lock:
+            for digest, text in hashes.items():
+                embedding = self._memory.get((digest, model))
+                if embedding is not None:
+                    found[text] = embedding
+                else:
+                    missing.append(digest)
+
+        if missing:
+            try:
+                # Run the query before taking the lock, so other threads never wait on the database
+                rows = [(digest, list(embedding)) for digest, embedding in EmbeddingCacheModel.objects.filter(
+                    model=model, content_hash__in=missing).values_list('content_hash', 'embedding')]
+                with self._lock:
+                    for digest, embedding in rows:
+                        self._memory[(digest, model)] = embedding
+                        found[hashes[digest]] = embedding
+            except Exception as e:
+                print(f"Embedding Cache Read Error: {e}")
+        return found
+
+    def put_many(self, embeddings, model):
+        """Store {text: embedding} in memory and persist new rows to PostgreSQL."""
+        rows = []
+        with self._lock:
+            for text, embedding in embeddings.items():
+                digest = content_hash(text)
+                self._memory[(digest, model)] = embedding
+                rows.append(EmbeddingCacheModel(content_hash=digest, model=model, embedding=embedding))
+        try:
+            EmbeddingCacheModel.objects.bulk_create(rows, ignore_conflicts=True, batch_size=500)
+        except Exception as e:
+            print(f"Embedding Cache Write Error: {e}")
+
+
+embedding_cache = EmbeddingCache()
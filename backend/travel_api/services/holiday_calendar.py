@@ -0,0 +1,209 @@
+import os
+import json
+import glob
+import threading
+from datetime import date, datetime, timedelta
+
+HOLIDAYS_DIR = os.path.join(os.path.dirname(__file__), "srilanka_holidays/json")
+
+# Approximate government school vacation windows (MM-DD..MM-DD, inclusive).
+# Override with SCHOOL_VACATIONS="04-05:04-20,08-01:08-31,12-15:01-01".
+DEFAULT_SCHOOL_VACATIONS = "04-05:04-20,08-01:08-31,12-15:01-01"
+
+CROWD_LEVELS = ("low", "moderate", "high", "very_high")
+
+
+def _parse_vacations(spec):
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        start, _, end = part.partition(":")
+        windows.append((tuple(map(int, start.split("-"))), tuple(map(int, end.split("-")))))
+    return windows
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+class HolidayCalendar:
+    """
+    Date-keyed Sri Lanka calendar built once from every year in srilanka_holidays/json.
+
+    Each date carries its holidays plus a precomputed crowd level (weekend, public
+    holiday, Poya, school vacation, long weekend), so a single day is a dict lookup
+    and a range query costs O(days). Dates outside the loaded years still get the
+    weekend and school-vacation part of the score. The files are re-read when the
+    calendar year rolls over, so a long-running worker picks up the new year's file.
+    """
+
+    def __init__(self, holidays_dir=HOLIDAYS_DIR, school_vacations=None):
+        self.holidays_dir = holidays_dir
+        self.school_vacations = _parse_vacations(school_vacations or os.environ.get("SCHOOL_VACATIONS", DEFAULT_SCHOOL_VACATIONS))
+        self._lock = threading.Lock()
+        self._days = None
+        self._loaded_year = None
+        self._holidays = {}
+        self.years = []
+
+    def _load_files(self):
+        holidays = {}
+        years = []
+        for path in sorted(glob.glob(os.path.join(self.holidays_dir, "*.json"))):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except Exception as e:
+                print(f"Error loading holiday data from {path}: {e}")
+                continue
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name.isdigit():
+                years.append(int(name))
+            for entry in entries:
+                try:
+                    start = _as_date(entry["start"])
+                    # iCal-style end dates are exclusive; single-day entries may omit them
+                    end = _as_date(entry["end"]) if entry.get("end") else start + timedelta(days=1)
+                except (KeyError, ValueError):
+                    continue
+                day = start
+                while day < max(end, start + timedelta(days=1)):
+                    holidays.setdefault(day, []).append({
+                        "name": entry.get("summary", "Holiday"),
+                        "categories": entry.get("categories", []),
+                    })
+                    day += timedelta(days=1)
+        if not years:
+            print(f"Warning: No holiday files found in {self.holidays_dir}. Crowd levels use weekends and school vacations only.")
+        return holidays, sorted(years)
+
+    def _in_school_vacation(self, day):
+        key = (day.month, day.day)
+        for start, end in self.school_vacations:
+            if start <= end and start <= key <= end:
+                return True
+            if start > end and (key >= start or key <= end): # Window wraps over New Year
+                return True
+        return False
+
+    def _off_run(self, day, holidays):
+        """Length of the run of consecutive days off (weekends/holidays) containing `day`."""
+        def off(d):
+            return d.weekday() >= 5 or d in holidays
+        if not off(day):
+            return 0
+        run = 1
+        for step in (-1, 1):
+            d = day + timedelta(days=step)
+            while off(d) and run < 7:
+                run += 1
+                d += timedelta(days=step)
+        return run
+
+    def _build_day(self, day, holidays):
+        entries = holidays.get(day, [])
+        is_poya = any("poya" in h["name"].lower() or "Poya" in h["categories"] for h in entries)
+        is_public = any(not h["categories"] or "Public" in h["categories"] for h in entries)
+        is_weekend = day.weekday() >= 5
+        school = self._in_school_vacation(day)
+        # Three or more days off in a row (e.g. a Friday holiday) sends locals travelling
+        long_weekend = self._off_run(day, holidays) >= 3
+
+        reasons = []
+        score = 0
+        if is_poya:
+            score += 2
+            reasons.append("Poya day: temples crowded, alcohol sales banned")
+        elif entries and is_public:
+            score += 2
+            reasons.append(f"Public holiday ({', '.join(h['name'] for h in entries)})")
+        elif entries:
+            score += 1
+            reasons.append(f"Holiday ({', '.join(h['name'] for h in entries)})")
+        if is_weekend:
+            score += 1
+            reasons.append("Weekend")
+        if long_weekend:
+            score += 1
+            reasons.append("Long weekend")
+        if school:
+            score += 1
+            reasons.append("School vacation")
+
+        return {
+            "date": day.isoformat(),
+            "weekday": day.strftime("%A"),
+            "holidays": [h["name"] for h in entries],
+            "is_poya": is_poya,
+            "is_public_holiday": bool(entries) and is_public,
+            "is_weekend": is_weekend,
+            "school_vacation": school,
+            "crowd_score": score,
+            "crowd_level": CROWD_LEVELS[min(score, len(CROWD_LEVELS) - 1)],
+            "reasons": reasons,
+        }
+
+    def _is_current(self):
+        return self._days is not None and self._loaded_year == date.today().year
+
+    def _ensure_loaded(self):
+        if self._is_current():
+            return
+        with self._lock:
+            if self._is_current():
+                return
+            holidays, years = self._load_files()
+            days = {}
+            if years:
+                day, last = date(years[0], 1, 1), date(years[-1], 12, 31)
+                while day <= last:
+                    days[day] = self._build_day(day, holidays)
+                    day += timedelta(days=1)
+            self._holidays = holidays
+            self.years = years
+            self._days = days
+            self._loaded_year = date.today().year
+
+    def reload(self):
+        """Pick up newly added year files."""
+        with self._lock:
+            self._days = None
+        self._ensure_loaded()
+
+    def day(self, value):
+        """Calendar info for one date (date, datetime or 'YYYY-MM-DD')."""
+        self._ensure_loaded()
+        day = _as_date(value)
+        info = self._days.get(day)
+        return info if info is not None else self._build_day(day, self._holidays)
+
+    def range(self, start, end):
+        """Calendar info for every date from start to end inclusive."""
+        start, end = _as_date(start), _as_date(end)
+        result = []
+        day = start
+        while day <= end:
+            result.append(self.day(day))
+            day += timedelta(days=1)
+        return result
+
+    def holiday_name(self, value):
+        names = self.day(value)["holidays"]
+        return ", ".join(names) if names else None
+
+    def covers(self, value):
+        """True if holiday data exists for the date's year (otherwise only weekends/school terms are known)."""
+        self._ensure_loaded()
+        return _as_date(value).year in self.years
+
+    def busy_days(self, start, days):
+        """(day number, info) for each busy day (high crowds or any holiday) of a trip starting on `start`."""
+        start = _as_date(start)
+        trip = self.range(start, start + timedelta(days=max(1, days) - 1))
+        return [(index + 1, info) for index, info in enumerate(trip) if info["crowd_score"] >= 2 or info["holidays"]]
+
+
+holiday_calendar = HolidayCalendar()
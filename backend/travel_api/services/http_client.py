@@ -0,0 +1,207 @@
+import os
+import random
+import asyncio
+import weakref
+import threading
+from contextlib import asynccontextmanager
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Upstream names used throughout the services
+OLLAMA = "ollama"
+OPEN_METEO = "open_meteo"
+
+
+class SharedHTTPClient:
+    """
+    Process-wide pooled HTTP client.
+
+    Keeps one keep-alive requests.Session per upstream (Ollama, Open-Meteo) so
+    embedding, chat and weather calls reuse TCP connections instead of opening a
+    fresh one per request. Every call gets a (connect, read) timeout and a bounded
+    retry policy with jittered backoff.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._counters = {}
+        self.connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+        self.read_timeouts = {
+            # Must stay below the server's request timeout so the worker reports the error itself
+            OLLAMA: float(os.environ.get("OLLAMA_READ_TIMEOUT", "280")),
+            OPEN_METEO: float(os.environ.get("OPEN_METEO_READ_TIMEOUT", "10")),
+        }
+        self.max_retries = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+        self.backoff_factor = float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.5"))
+        self.backoff_jitter = float(os.environ.get("HTTP_BACKOFF_JITTER", "0.3"))
+        self.pool_maxsize = int(os.environ.get("HTTP_POOL_MAXSIZE", "20"))
+
+    def _build_session(self):
+        # Only retry failures where the upstream never started work: connection errors
+        # and gateway/overload statuses. Read timeouts are not retried, since repeating
+        # a multi-minute generation would just double the wait.
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=retry, pool_block=False)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session(self, upstream):
+        """Return the shared session for an upstream, creating it on first use."""
+        session = self._sessions.get(upstream)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(upstream)
+                if session is None:
+                    session = self._build_session()
+                    self._sessions[upstream] = session
+                    self._counters[upstream] = {"requests": 0, "errors": 0}
+        return session
+
+    def timeout(self, upstream):
+        return (self.connect_timeout, self.read_timeouts.get(upstream, 30.0))
+
+    def request(self, upstream, method, url, **kwargs):
+        session = self.session(upstream)
+        kwargs.setdefault("timeout", self.timeout(upstream))
+        with self._lock:
+            self._counters[upstream]["requests"] += 1
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._counters[upstream]["errors"] += 1
+            raise
+
+    def get(self, upstream, url, **kwargs):
+        return self.request(upstream, "GET", url, **kwargs)
+
+    def post(self, upstream, url, **kwargs):
+        return self.request(upstream, "POST", url, **kwargs)
+
+    def pool_stats(self):
+        """Report request counters and live connection-pool usage per upstream."""
+        stats = {}
+        with self._lock:
+            items = list(self._sessions.items())
+            counters = {name: dict(values) for name, values in self._counters.items()}
+
+        for upstream, session in items:
+            pools = []
+            adapter = session.get_adapter("https://")
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections_opened": pool.num_connections,
+                    "requests_served": pool.num_requests,
+                    "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                    "max_size": self.pool_maxsize,
+                })
+            stats[upstream] = {**counters.get(upstream, {}), "pools": pools}
+        return stats
+
+
+class AsyncHTTPClient:
+    """
+    Async counterpart of SharedHTTPClient for the ASGI request path.
+
+    Uses one httpx.AsyncClient per upstream per event loop, with the same timeouts
+    and retry rules as the sync client, so a worker can hold hundreds of pending
+    Ollama generations on one thread. Under ASGI there is a single loop per worker,
+    so the pools are shared by every request the worker serves.
+    """
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, config):
+        self.config = config
+        self.max_connections = int(os.environ.get("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+        self._lock = threading.Lock()
+        self._clients = weakref.WeakKeyDictionary() # event loop -> {upstream: AsyncClient}
+        self._counters = {}
+
+    def client(self, upstream):
+        """Return the shared AsyncClient for an upstream on the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(upstream)
+            if client is None:
+                connect, read = self.config.timeout(upstream)
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(read, connect=connect),
+                    limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.config.pool_maxsize),
+                    # Transport-level retries only cover failed connects, matching read=0 on the sync side
+                    transport=httpx.AsyncHTTPTransport(retries=self.config.max_retries),
+                )
+                clients[upstream] = client
+                self._counters.setdefault(upstream, {"requests": 0, "errors": 0})
+        return client
+
+    def _backoff(self, attempt):
+        return self.config.backoff_factor * (2 ** attempt) + random.uniform(0, self.config.backoff_jitter)
+
+    async def request(self, upstream, method, url, **kwargs):
+        client = self.client(upstream)
+        with self._lock:
+            self._counters[upstream]["requests"] += 1
+        try:
+            for attempt in range(self.config.max_retries + 1):
+                response = await client.request(method, url, **kwargs)
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.config.max_retries:
+                    return response
+                await response.aclose()
+                await asyncio.sleep(self._backoff(attempt))
+        except httpx.HTTPError:
+            with self._lock:
+                self._counters[upstream]["errors"] += 1
+            raise
+
+    @asynccontextmanager
+    async def stream(self, upstream, method, url, **kwargs):
+        """Streamed response for the block; not retried, since the body is consumed as it arrives."""
+        client = self.client(upstream)
+        with self._lock:
+            self._counters[upstream]["requests"] += 1
+        try:
+            async with client.stream(method, url, **kwargs) as response:
+                yield response
+        except httpx.HTTPError:
+            with self._lock:
+                self._counters[upstream]["errors"] += 1
+            raise
+
+    async def get(self, upstream, url, **kwargs):
+        return await self.request(upstream, "GET", url, **kwargs)
+
+    async def post(self, upstream, url, **kwargs):
+        return await self.request(upstream, "POST", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "event_loops": len(self._clients),
+                "max_connections": self.max_connections,
+                **{name: dict(values) for name, values in self._counters.items()},
+            }
+
+
+http_client = SharedHTTPClient()
+async_http_client = AsyncHTTPClient(http_client)
@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+import numpy as np
+
+# Below this cosine similarity to the nearest centroid, or this margin over the
+# runner-up, the embedding is not trusted and the keyword heuristic decides
+MIN_CONFIDENCE = float(os.environ.get("INTENT_ROUTER_MIN_CONFIDENCE", "0.55"))
+MIN_MARGIN = float(os.environ.get("INTENT_ROUTER_MIN_MARGIN", "0.02"))
+# After a failed centroid build (embedder down), wait this long before trying again
+RETRY_SECONDS = 60
+
+ITINERARY = "itinerary"
+CHAT = "chat"
+ADVICE = "advice"
+MODIFY_ITINERARY = "modify_itinerary"
+
+# Seed utterances per intent; each centroid is the normalised mean of its examples
+INTENT_EXAMPLES = {
+    ITINERARY: [
+        "Plan a 7 day trip to Sri Lanka",
+        "Create a 5 day itinerary starting from Colombo",
+        "I want a honeymoon itinerary for 10 days in the hill country",
+        "Plan a family vacation covering Kandy, Ella and the south coast",
+        "Make me a two week backpacking route around the island",
+        "Suggest a 3 day beach holiday in Mirissa and Galle",
+        "Build a cultural triangle tour for 4 days",
+        "We have 6 days, plan a wildlife trip with Yala and Udawalawe",
+        "Itinerary for a solo traveller, 8 days, adventure activities",
+        "Plan our anniversary getaway for a long weekend",
+    ],
+    CHAT: [
+        "What is the best time of year to visit Sri Lanka?",
+        "Do I need a visa to enter Sri Lanka?",
+        "What currency is used in Sri Lanka?",
+        "Tell me about the history of Sigiriya",
+        "What is kottu roti?",
+        "How do I get from the airport to Colombo?",
+        "Is Sri Lanka safe for solo female travellers?",
+        "What should I pack for the hill country?",
+        "Hello, who are you?",
+        "What are the famous dishes I should try?",
+        "How much does a tuk-tuk ride usually cost?",
+    ],
+    ADVICE: [
+        "Is it going to rain in Ella today?",
+        "Should I go to the beach now?",
+        "Is the Temple of the Tooth crowded today?",
+        "Is it a good time to climb Adam's Peak right now?",
+        "What is the weather like in Kandy at the moment?",
+        "Is today a Poya day?",
+        "Will it be too hot to hike Sigiriya this afternoon?",
+        "Are the roads to Nuwara Eliya safe in this weather?",
+        "Is it busy at Galle Fort this weekend?",
+    ],
+    MODIFY_ITINERARY: [
+        "Swap day 3 and day 4 in my itinerary",
+        "Make my trip more relaxing",
+        "Add a whale watching tour to my plan",
+        "Replace the hike on day 2 with something indoors",
+        "Remove Jaffna from my itinerary",
+        "Can you change the last day to a beach day?",
+        "Add one more day in Ella to my trip",
+        "Shorten my itinerary to 5 days",
+        "Put a cooking class into my plan instead of the museum",
+    ],
+}
+
+# The original substring heuristic, kept as the fallback when embeddings are unavailable or unsure
+ITINERARY_KEYWORDS = ["plan", "trip", "itinerary", "day", "honeymoon", "vacation", "visit"]
+
+
+def keyword_intent(text):
+    text_lower = text.lower()
+    return ITINERARY if any(word in text_lower for word in ITINERARY_KEYWORDS) else CHAT
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IntentRouter:
+    """
+    Routes free-text messages by nearest intent centroid in embedding space.
+
+    Centroids are built once per worker from INTENT_EXAMPLES through the same
+    (cached) embedder the itinerary lookup uses, so after the first boot they come
+    from the embedding cache table. The message's own embedding is reused by the
+    semantic cache lookup that follows, so routing adds a matrix-vector product,
+    not an extra Ollama call. Low-confidence or failed embeddings fall back to
+    the keyword heuristic.
+    """
+
+    def __init__(self, examples=INTENT_EXAMPLES, min_confidence=MIN_CONFIDENCE, min_margin=MIN_MARGIN):
+        self.examples = examples
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self._lock = threading.Lock()
+        self._intents = None
+        self._centroids = None
+        self._failed_at = None
+        self._counts = {"embedding": 0, "fallback": 0}
+        self._by_intent = {}
+
+    def _build(self, vectors_by_intent):
+        intents, centroids = [], []
+        for intent, vectors in vectors_by_intent.items():
+            vectors = [v for v in vectors if v is not None]
+            if not vectors:
+                self._failed_at = time.monotonic()
+                return False
+            intents.append(intent)
+            centroids.append(_normalise(np.asarray(vectors, dtype=np.float32)).mean(axis=0))
+        self._intents = intents
+        self._centroids = _normalise(np.stack(centroids))
+        return True
+
+    def _example_texts(self):
+        return [(intent, text) for intent, texts in self.examples.items() for text in texts]
+
+    def _group(self, pairs, vectors):
+        grouped = {intent: [] for intent in self.examples}
+        for (intent, _), vector in zip(pairs, vectors):
+            grouped[intent].append(vector)
+        return grouped
+
+    def _backing_off(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_SECONDS
+
+    def ensure_centroids(self, embed_many):
+        """Build centroids with `embed_many(texts)`; returns False if the embedder is unavailable."""
+        if self._centroids is not None:
+            return True
+        if self._backing_off():
+            return False
+        with self._lock:
+            if self._centroids is not None:
+                return True
+            pairs = self._example_texts()
+            return self._build(self._group(pairs, embed_many([text for _, text in pairs])))
+
+    async def aensure_centroids(self, aembed_many):
+        if self._centroids is not None:
+            return True
+        if self._backing_off():
+            return False
+        pairs = self._example_texts()
+        grouped = self._group(pairs, await aembed_many([text for _, text in pairs]))
+        with self._lock:
+            return self._centroids is not None or self._build(grouped)
+
+    def scores(self, vector):
+        """{intent: cosine similarity} for an embedding."""
+        query = _normalise(np.asarray(vector, dtype=np.float32))
+        return dict(zip(self._intents, (self._centroids @ query).tolist()))
+
+    def classify(self, text, vector):
+        """(intent, confidence, method); method is "embedding" or "keyword"."""
+        if vector is None or self._centroids is None:
+            return self._record(keyword_intent(text), None, "keyword")
+        ranked = sorted(self.scores(vector).items(), key=lambda kv: -kv[1])
+        (best, top), runner_up = ranked[0], ranked[1][1] if len(ranked) > 1 else -1.0
+        if top < self.min_confidence or top - runner_up < self.min_margin:
+            return self._record(keyword_intent(text), round(top, 4), "keyword")
+        return self._record(best, round(top, 4), "embedding")
+
+    def route(self, text, embed_many):
+        started = time.perf_counter()
+        vector = embed_many([text])[0] if self.ensure_centroids(embed_many) else None
+        result = self.classify(text, vector)
+        print(f"🧭 Routed as {result[0]} via {result[2]} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return result
+
+    async def aroute(self, text, aembed_many):
+        started = time.perf_counter()
+        vector = (await aembed_many([text]))[0] if await self.aensure_centroids(aembed_many) else None
+        result = self.classify(text, vector)
+        print(f"🧭 Routed as {result[0]} via {result[2]} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return result
+
+    def _record(self, intent, confidence, method):
+        with self._lock:
+            self._counts["embedding" if method == "embedding" else "fallback"] += 1
+            self._by_intent[intent] = self._by_intent.get(intent, 0) + 1
+        return intent, confidence, method
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "ready": self._centroids is not None,
+                "routed": dict(self._counts),
+                "by_intent": dict(self._by_intent),
+                "min_confidence": self.min_confidence,
+            }
+
+
+intent_router = IntentRouter()
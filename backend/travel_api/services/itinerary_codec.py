@@ -0,0 +1,57 @@
+import os
+import json
+import zlib
+
+# Store new itinerary payloads compressed in itinerary_blob instead of the JSONB column
+COMPRESSION_ENABLED = os.environ.get("ITINERARY_COMPRESSION", "False") == "True"
+
+# Preset dictionaries for zlib, keyed by the version byte at the start of each blob.
+# Every itinerary repeats the same keys and phrasing, so priming the compressor with them
+# roughly doubles the ratio on small documents. NEVER edit an existing entry: rows
+# compressed with it could no longer be read. Add a new version instead.
+_ZDICT_V1_SAMPLE = {
+    "title": "Sri Lanka Adventure",
+    "summary": "A journey through Sri Lanka's beaches, hill country, temples and wildlife.",
+    "trip_theme": "Beach Culture Adventure Nature Wildlife Honeymoon",
+    "total_days": 7,
+    "days": [
+        {
+            "day": 1,
+            "location": "Colombo Kandy Ella Galle Sigiriya Nuwara Eliya Mirissa Yala Trincomalee",
+            "theme": "Arrival and city exploration",
+            "activities": [
+                {"time": "Morning", "activity": "Visit the Temple of the Tooth", "description": "Explore the historic temple and learn about the local culture and traditions of the area."},
+                {"time": "Afternoon", "activity": "Tea plantation tour", "description": "Take a guided tour of the beach, the national park and the famous train ride through the hills."},
+                {"time": "Evening", "activity": "Dinner", "description": "Enjoy a traditional Sri Lankan rice and curry dinner at a local restaurant."}
+            ],
+            "suggested_restaurants": ["Ministry of Crab", "The Gallery Cafe", "Cafe", "Restaurant"],
+            "narrative": "Start your day with breakfast before heading out to explore the stunning scenery. In the afternoon you will visit the beautiful beaches, ancient temples and lush tea plantations, then relax in the evening."
+        }
+    ]
+}
+ZDICTS = {
+    1: json.dumps(_ZDICT_V1_SAMPLE, separators=(",", ":")).encode("utf-8"),
+}
+CURRENT_VERSION = 1
+
+
+def compress_itinerary(data, version=CURRENT_VERSION):
+    """Serialise an itinerary dict to a versioned, dictionary-primed zlib blob."""
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    compressor = zlib.compressobj(level=9, zdict=ZDICTS[version])
+    return bytes([version]) + compressor.compress(raw) + compressor.flush()
+
+
+def decompress_itinerary(blob):
+    blob = bytes(blob)
+    decompressor = zlib.decompressobj(zdict=ZDICTS[blob[0]])
+    return json.loads(decompressor.decompress(blob[1:]) + decompressor.flush())
+
+
+def itinerary_fields(data, compress=None):
+    """Column values for storing `data`, in whichever representation is configured."""
+    if compress is None:
+        compress = COMPRESSION_ENABLED
+    if compress:
+        return {"itinerary_json": None, "itinerary_blob": compress_itinerary(data)}
+    return {"itinerary_json": data, "itinerary_blob": None}
@@ -0,0 +1,111 @@
+import json
+import threading
+from .json_stream import IncrementalItineraryParser
+
+# Continuation rounds before giving up on the missing days
+MAX_CONTINUATIONS = 2
+
+
+def strip_fences(content):
+    return (content or "").replace("```json", "").replace("```", "").strip()
+
+
+def salvage(content):
+    """
+    Parse model output into an itinerary dict, tolerating truncation and junk.
+    Returns (data, salvaged); when the document does not parse, `data` holds the
+    top-level meta fields and every day object that closed before the break.
+    """
+    cleaned = strip_fences(content)
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            return data, False
+    except json.JSONDecodeError:
+        pass
+
+    parser = IncrementalItineraryParser()
+    data = {"days": []}
+    for event, value in parser.feed(cleaned):
+        if event == "meta":
+            data.update(value)
+        else:
+            data["days"].append(value)
+    return data, True
+
+
+def valid_day(day):
+    """True if `day` matches the itinerary day schema well enough to show and cache."""
+    if not isinstance(day, dict):
+        return False
+    if not isinstance(day.get("location"), str) or not day["location"].strip():
+        return False
+    activities = day.get("activities")
+    if not isinstance(activities, list) or not activities:
+        return False
+    if not all(isinstance(a, dict) and isinstance(a.get("activity"), str) and a["activity"].strip() for a in activities):
+        return False
+    restaurants = day.get("suggested_restaurants", [])
+    return isinstance(restaurants, list) and isinstance(day.get("narrative", ""), str)
+
+
+def index_days(days, duration, offset=0):
+    """{day number: day} for valid days within 1..duration; falls back to position when "day" is unusable."""
+    indexed = {}
+    for position, day in enumerate(days or []):
+        if not valid_day(day):
+            continue
+        number = day.get("day")
+        if not isinstance(number, int) or not 1 <= number <= duration:
+            number = offset + position + 1
+        if 1 <= number <= duration and number not in indexed:
+            day["day"] = number
+            indexed[number] = day
+    return indexed
+
+
+def missing_days(indexed, duration):
+    return [n for n in range(1, duration + 1) if n not in indexed]
+
+
+def assemble(data, indexed, prefs, duration):
+    """Itinerary dict with the salvaged days in order and the meta fields filled in."""
+    return {
+        **data,
+        "title": data.get("title") or f"{duration}-Day {prefs['trip_type']} Trip",
+        "summary": data.get("summary") or "",
+        "trip_theme": data.get("trip_theme") or prefs["trip_type"],
+        "total_days": duration,
+        "days": [indexed[n] for n in sorted(indexed)],
+    }
+
+
+def continuation_context(indexed):
+    """Compact one-line-per-day view of the days already generated."""
+    lines = []
+    for number in sorted(indexed):
+        day = indexed[number]
+        activities = "; ".join(a["activity"] for a in day["activities"])
+        lines.append(f"Day {number} - {day['location']}: {activities}")
+    return "\n".join(lines)
+
+
+class RepairMetrics:
+    """Thread-safe per-process counters for itinerary parsing and repair."""
+
+    NAMES = ("clean", "salvaged", "continuations", "continued_days", "incomplete", "unusable")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in self.NAMES}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+itinerary_repair_metrics = RepairMetrics()
@@ -1,50 +1,173 @@
+import os
+import re
 import json
+import hashlib
+from django.db import connection, transaction
+from django.db.models import Func
+from django.db.models.functions import Cast
+from django.utils import timezone
 from travel_api.models import ItineraryCache
-from pgvector.django import CosineDistance
+from pgvector import HalfVector
+from pgvector.django import CosineDistance, HammingDistance, HalfVectorField, BitField
+from .cache_eviction import hit_recorder
+from .itinerary_codec import itinerary_fields
+
+# HNSW candidate list size per query: higher = better recall, slower lookups
+EF_SEARCH = int(os.environ.get("PGVECTOR_EF_SEARCH", "40"))
+# Which HNSW index answers similarity lookups: "full" (float32 vectors), or "halfvec" / "binary",
+# which take RERANK_CANDIDATES from a compact expression index and re-rank them at full
+# precision. Must match the layout built by `manage.py vector_index`.
+VECTOR_SEARCH = os.environ.get("PGVECTOR_SEARCH", "full")
+RERANK_CANDIDATES = int(os.environ.get("PGVECTOR_RERANK_CANDIDATES", "40"))
+SEARCH_MODES = ("full", "halfvec", "binary")
+EMBEDDING_DIMENSIONS = 768
+
+
+def query_digest(query_text):
+    """Python mirror of the query_digest generated column (md5 of the UTF-8 text)."""
+    return hashlib.md5(query_text.encode("utf-8")).hexdigest()
+
+
+def binary_quantize(vector):
+    """Python mirror of pgvector's binary_quantize(): one bit per dimension, set when positive."""
+    return "".join("1" if x > 0 else "0" for x in vector)
+
+
+def compact_distance(mode, query_embedding):
+    """
+    Distance on the compact form of `embedding` that `mode` searches. The expressions
+    match the vector_index command's index definitions, so Postgres can use them.
+    """
+    if mode == "halfvec":
+        return CosineDistance(Cast('embedding', HalfVectorField(dimensions=EMBEDDING_DIMENSIONS)), HalfVector(query_embedding))
+    if mode == "binary":
+        quantized = Func('embedding', function='binary_quantize', output_field=BitField())
+        return HammingDistance(Cast(quantized, BitField(length=EMBEDDING_DIMENSIONS)), binary_quantize(query_embedding))
+    raise ValueError(f"Unknown vector search mode {mode!r}; expected one of {SEARCH_MODES}")
+
+
+def exact_query(queryset, query_text):
+    # Filter on the hash-indexed digest first; the text comparison only guards against collisions
+    return queryset.filter(query_digest=query_digest(query_text), query_text=query_text)
 
 class ItineraryStore:
     def __init__(self, data_dir=None):
         pass # Data dir is obsolete, we use PostgreSQL natively now
 
-    def save(self, query, embedding, itinerary_data):
+    def save(self, query, embedding, itinerary_data, cache_key=None, prompt_version='', model_name=''):
         """Save a new itinerary and its pgvector embedding to PostgreSQL."""
-        # Optional: check if exact query already exists to avoid duplicate logic
-        if not ItineraryCache.objects.filter(query_text=query).exists():
+        # Refresh the existing row for this key (or exact query) instead of duplicating it
+        existing = ItineraryCache.objects.filter(cache_key=cache_key) if cache_key else exact_query(ItineraryCache.objects, query)
+        updated = existing.update(
+            query_text=query,
+            embedding=embedding,
+            **itinerary_fields(itinerary_data),
+            prompt_version=prompt_version,
+            model_name=model_name,
+            created_at=timezone.now()
+        )
+        if not updated:
             ItineraryCache.objects.create(
                 query_text=query,
                 embedding=embedding,
-                itinerary_json=itinerary_data
+                **itinerary_fields(itinerary_data),
+                cache_key=cache_key,
+                prompt_version=prompt_version,
+                model_name=model_name
             )
-            print("💾 Saved new vector embedding to PostgreSQL ItineraryCache.")
+        print("💾 Saved new vector embedding to PostgreSQL ItineraryCache.")
+
+    def get_by_key(self, cache_key, max_age=None, since=None):
+        """Tier 1: canonical-key lookup for structured preferences, optionally only entries created after `since`."""
+        matches = ItineraryCache.objects.filter(cache_key=cache_key)
+        if max_age is not None:
+            matches = matches.filter(created_at__gte=timezone.now() - max_age)
+        if since is not None:
+            matches = matches.filter(created_at__gte=since)
+        match = matches.only('itinerary_json', 'itinerary_blob').first()
+        if match:
+            print("✅ Canonical Key Cache Hit! (PostgreSQL)")
+            hit_recorder.record(match.pk)
+        return match.get_itinerary() if match else None
+
+    def get_exact(self, query_text, since=None):
+        """Return the newest cached itinerary for this exact query, optionally only if created after `since`."""
+        matches = exact_query(ItineraryCache.objects, query_text)
+        if since is not None:
+            matches = matches.filter(created_at__gte=since)
+        match = matches.order_by('-created_at').first()
+        return match.get_itinerary() if match else None
+
+    def find_similar(self, query_text, query_embedding, threshold=0.995, prompt_version='', model_name='', max_age=None):
+        """
+        Tier 2: find an itinerary with high cosine similarity natively via pgvector.
+        Only entries produced by the same model and prompt version are considered.
+        """
+        candidates = ItineraryCache.objects.filter(prompt_version=prompt_version, model_name=model_name)
+        if max_age is not None:
+            candidates = candidates.filter(created_at__gte=timezone.now() - max_age)
 
-    def find_similar(self, query_text, query_embedding, threshold=0.995):
-        """Find an itinerary with high cosine similarity natively via pgvector."""
-        
         # Fast path exact match (bypassing expensive vector ops)
-        exact_match = ItineraryCache.objects.filter(query_text=query_text).first()
+        exact_match = exact_query(candidates, query_text).first()
         if exact_match:
             print(f"✅ Exact String Match Cache Hit! (PostgreSQL)")
-            return exact_match.itinerary_json
+            hit_recorder.record(exact_match.pk)
+            return exact_match.get_itinerary()
 
         # In pgvector, CosineDistance represents (1 - cosine_similarity).
         # Therefore, to check for similarity >= 0.995, we check distance <= 0.005
         max_distance = 1.0 - threshold
         
-        # Native pgvector cosine distance calculation in the database
-        match = ItineraryCache.objects.annotate(
-            distance=CosineDistance('embedding', query_embedding)
-        ).order_by('distance').first()
+        # ORDER BY distance LIMIT 1 with no distance predicate in WHERE, so pgvector can
+        # answer it from the HNSW index; the threshold is checked on the returned row
+        match = self._nearest(candidates, query_embedding)
         
         if match:
             print(f"DEBUG: Best cache match distance: {match.distance:.4f} (Required <= {max_distance:.4f})")
             
             if match.distance <= max_distance:
-                # We reached the vector threshold, but strictly verify string equivalence mapping
-                if match.query_text == query_text:
+                # Near-identical phrasings embed almost identically even when the day count differs,
+                # so the numbers in both queries must agree before we trust the vector hit
+                if re.findall(r'\d+', match.query_text) == re.findall(r'\d+', query_text):
                     print(f"✅ Cache Hit! Vector Match Verified. (Distance: {match.distance:.4f})")
-                    return match.itinerary_json
+                    hit_recorder.record(match.pk)
+                    return match.get_itinerary()
                 else:
-                    print(f"❌ False Positive Vector Hit! Distance: {match.distance:.4f}, but text '{query_text}' != '{match.query_text}'. Rejecting.")
+                    print(f"❌ False Positive Vector Hit! Distance: {match.distance:.4f}, but numbers in '{query_text}' != '{match.query_text}'. Rejecting.")
                     return None
             
         return None
+
+    def _nearest(self, queryset, query_embedding, ef_search=EF_SEARCH, mode=VECTOR_SEARCH):
+        """
+        Approximate nearest neighbour via an HNSW index, with a per-query ef_search.
+        In the compact modes the halfvec/bit index only picks candidates; their exact
+        distances on the stored float32 column decide the match, so the threshold
+        check is unaffected.
+        """
+        distance = CosineDistance('embedding', query_embedding)
+        if mode == "full":
+            queryset = queryset.annotate(distance=distance).order_by('distance').only('query_text', 'itinerary_json', 'itinerary_blob')
+            return self._with_ef_search(ef_search, queryset.first)
+
+        candidates = queryset.annotate(distance=distance).order_by(compact_distance(mode, query_embedding)).values_list('pk', 'distance')[:RERANK_CANDIDATES]
+        # HNSW returns at most ef_search rows, so it has to cover the candidate list
+        ranked = self._with_ef_search(max(ef_search, RERANK_CANDIDATES), lambda: list(candidates))
+        if not ranked:
+            return None
+        pk, best = min(ranked, key=lambda row: row[1])
+        match = ItineraryCache.objects.filter(pk=pk).only('query_text', 'itinerary_json', 'itinerary_blob').first()
+        if match:
+            match.distance = best
+        return match
+
+    def _with_ef_search(self, ef_search, fetch):
+        """Run `fetch()` with hnsw.ef_search set for its query."""
+        if connection.vendor != "postgresql":
+            return fetch()
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # SET LOCAL scopes the setting to this transaction only
+                cursor.execute("SET LOCAL hnsw.ef_search = %s", [int(ef_search)])
+            return fetch()
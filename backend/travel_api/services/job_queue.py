@@ -0,0 +1,185 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from travel_api.models import ItineraryJob
+from .ollama_scheduler import ollama_caller
+
+MAX_ATTEMPTS = int(os.environ.get("ITINERARY_JOB_MAX_ATTEMPTS", "3"))
+# Delay before retry n is RETRY_BACKOFF_SECONDS * 2 ** (n - 1)
+RETRY_BACKOFF_SECONDS = float(os.environ.get("ITINERARY_JOB_RETRY_BACKOFF_SECONDS", "30"))
+# A running job whose worker has been silent this long is assumed dead and requeued
+LEASE_SECONDS = float(os.environ.get("ITINERARY_JOB_LEASE_SECONDS", "900"))
+# How often a busy worker renews its lease (locked_at); must stay well below LEASE_SECONDS
+HEARTBEAT_SECONDS = float(os.environ.get("ITINERARY_JOB_HEARTBEAT_SECONDS", str(LEASE_SECONDS / 5)))
+
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def enqueue(user, preferences, mode=None, use_cache=True, max_attempts=MAX_ATTEMPTS):
+    return ItineraryJob.objects.create(
+        user=user,
+        preferences=preferences,
+        mode=mode or '',
+        use_cache=use_cache,
+        max_attempts=max(1, max_attempts),
+    )
+
+
+def claim(worker):
+    """
+    Atomically take the oldest claimable job, or return None.
+
+    FOR UPDATE SKIP LOCKED lets any number of workers poll the same table without
+    blocking on, or double-claiming, a row another worker is in the middle of taking.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            ItineraryJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ItineraryJob.QUEUED, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ItineraryJob.RUNNING
+        job.attempts += 1
+        job.locked_by = worker
+        job.locked_at = now
+        job.started_at = job.started_at or now
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at', 'started_at'])
+    return job
+
+
+def complete(job, result):
+    ItineraryJob.objects.filter(pk=job.pk, status=ItineraryJob.RUNNING, locked_by=job.locked_by).update(
+        status=ItineraryJob.SUCCEEDED,
+        result=result,
+        error='',
+        finished_at=timezone.now(),
+    )
+
+
+def fail(job, error):
+    """Requeue with exponential backoff, or mark failed once max_attempts is used up."""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+        fields = {"status": ItineraryJob.QUEUED, "run_after": now + timedelta(seconds=delay), "locked_by": '', "locked_at": None}
+    else:
+        fields = {"status": ItineraryJob.FAILED, "finished_at": now}
+    ItineraryJob.objects.filter(pk=job.pk, status=ItineraryJob.RUNNING, locked_by=job.locked_by).update(error=str(error)[:2000], **fields)
+    return fields["status"]
+
+
+def heartbeat(job):
+    """Renew the job's lease. False once the job is no longer held by this worker."""
+    return ItineraryJob.objects.filter(pk=job.pk, status=ItineraryJob.RUNNING, locked_by=job.locked_by).update(locked_at=timezone.now()) > 0
+
+
+@contextmanager
+def lease_heartbeat(job, interval=HEARTBEAT_SECONDS):
+    """Keep renewing the job's lease from a side thread while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    if not heartbeat(job):
+                        print(f"⚠️ Job {job.pk} lease lost; its result will be discarded.")
+                        return
+                except Exception as e:
+                    print(f"Job Heartbeat Error: {e}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(lease_seconds=LEASE_SECONDS):
+    """
+    Recover jobs whose worker stopped renewing its lease (crashed or killed).
+    Jobs with attempts left go back to the queue; the rest are marked failed, so a
+    job that keeps killing its worker is not retried forever. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    stale = ItineraryJob.objects.filter(status=ItineraryJob.RUNNING, locked_at__lt=now - timedelta(seconds=lease_seconds))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=ItineraryJob.FAILED, finished_at=now, locked_by='', locked_at=None,
+        error='Worker lease expired on the last attempt',
+    )
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=ItineraryJob.QUEUED, run_after=now, locked_by='', locked_at=None,
+        error='Worker lease expired',
+    )
+    return requeued, failed
+
+
+def run_job(job, llama_service):
+    """Run one claimed job through generate_itinerary and record the outcome."""
+    try:
+        # Background class: waits for a slot behind interactive traffic instead of being rejected
+        with ollama_caller(job.user_id, background=True), lease_heartbeat(job):
+            result = llama_service.generate_itinerary(job.preferences, mode=job.mode or None, use_cache=job.use_cache)
+    except Exception as e:
+        result = {"error": str(e)}
+
+    if isinstance(result, dict) and "error" in result:
+        status = fail(job, result["error"])
+        print(f"⚠️ Job {job.pk} attempt {job.attempts}/{job.max_attempts} failed ({status}): {result['error']}")
+        return status
+
+    complete(job, result)
+    print(f"✅ Job {job.pk} finished on attempt {job.attempts}.")
+    return ItineraryJob.SUCCEEDED
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 2)
+
+
+def job_metrics(window_minutes=60, sample=1000):
+    """Queue depth by status plus wait/run/total latency percentiles for recently finished jobs."""
+    depth = dict(ItineraryJob.objects.values_list('status').annotate(n=Count('id')).order_by())
+    since = timezone.now() - timedelta(minutes=window_minutes)
+    oldest = ItineraryJob.objects.filter(status=ItineraryJob.QUEUED).order_by('created_at').values_list('created_at', flat=True).first()
+
+    rows = list(
+        ItineraryJob.objects
+        .filter(finished_at__gte=since, started_at__isnull=False)
+        .order_by('-finished_at')
+        .values_list('status', 'attempts', 'created_at', 'started_at', 'finished_at')[:sample]
+    )
+    wait = [(started - created).total_seconds() for _, _, created, started, _ in rows]
+    total = [(finished - created).total_seconds() for _, _, created, _, finished in rows]
+    run = [(finished - started).total_seconds() for _, _, _, started, finished in rows]
+
+    return {
+        "depth": {status: depth.get(status, 0) for status, _ in ItineraryJob.STATUS_CHOICES},
+        "oldest_queued_seconds": round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+        "window_minutes": window_minutes,
+        "finished": len(rows),
+        "failed": sum(1 for status, *_ in rows if status == ItineraryJob.FAILED),
+        "retried": sum(1 for _, attempts, *_ in rows if attempts > 1),
+        "wait_seconds": {"p50": _percentile(wait, 0.5), "p95": _percentile(wait, 0.95)},
+        "run_seconds": {"p50": _percentile(run, 0.5), "p95": _percentile(run, 0.95)},
+        "total_seconds": {"p50": _percentile(total, 0.5), "p95": _percentile(total, 0.95)},
+    }
@@ -0,0 +1,93 @@
+import json
+
+
+class IncrementalItineraryParser:
+    """
+    Incremental parser for the itinerary JSON as it streams out of Ollama.
+
+    Feed it raw content chunks; it returns the pieces of the itinerary that have
+    fully closed so far (top-level strings like title/summary and each finished
+    object in the "days" array) without waiting for the whole document.
+    """
+
+    META_FIELDS = ("title", "summary", "trip_theme")
+
+    def __init__(self):
+        self.buffer = ""
+        self.days_emitted = 0
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = False
+        self._current_key = None
+        self._day_start = None
+
+    def feed(self, chunk):
+        """Append a chunk and return a list of (event, data) tuples for newly completed parts."""
+        self.buffer += chunk
+        events = []
+
+        while self._pos < len(self.buffer):
+            i = self._pos
+            ch = self.buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._close_string(i, events)
+                continue
+
+            # Anything before the root object (e.g. stray ``` fences) is ignored
+            if not self._stack and ch != "{":
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._stack.append(ch)
+                depth = len(self._stack)
+                if depth == 1:
+                    self._expect_key = True
+                elif depth == 3 and ch == "{" and self._in_days_array():
+                    self._day_start = i
+            elif ch in "}]":
+                depth = len(self._stack)
+                if depth == 3 and ch == "}" and self._day_start is not None:
+                    self._emit_day(i, events)
+                if self._stack:
+                    self._stack.pop()
+            elif ch == "," and len(self._stack) == 1:
+                self._expect_key = True
+
+        return events
+
+    def _in_days_array(self):
+        return len(self._stack) == 3 and self._stack[1] == "[" and self._current_key == "days"
+
+    def _close_string(self, end, events):
+        if len(self._stack) != 1:
+            return
+        value = json.loads(self.buffer[self._string_start:end + 1])
+        if self._expect_key:
+            self._current_key = value
+            self._expect_key = False
+        elif self._current_key in self.META_FIELDS:
+            events.append(("meta", {self._current_key: value}))
+
+    def _emit_day(self, end, events):
+        raw = self.buffer[self._day_start:end + 1]
+        self._day_start = None
+        try:
+            day = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        self.days_emitted += 1
+        events.append(("day", day))
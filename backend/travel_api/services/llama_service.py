@@ -1,80 +1,279 @@
 import os
+import re
+import copy
 import json
-import requests
+import hashlib
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.utils import timezone
 
-# Initialize Clients
-# Note: In production these should be singletons or managed better
+# Texts per /api/embed request in get_embeddings
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+
+# Bump whenever the itinerary prompts or output schema change so old cache entries are never served
+PROMPT_VERSION = "itinerary-v3"
+# Cached itineraries older than this are regenerated (0 disables expiry)
+CACHE_TTL_HOURS = float(os.environ.get("ITINERARY_CACHE_TTL_HOURS", "168"))
+# Longest trip we plan; larger requested durations are clamped to this
+MAX_TRIP_DAYS = int(os.environ.get("MAX_TRIP_DAYS", "30"))
+
+# Request handlers obtain a shared instance via services.registry.get_llama_service()
 
 from .itinerary_store import ItineraryStore
+from .holiday_calendar import holiday_calendar
+from .json_stream import IncrementalItineraryParser
+from .itinerary_repair import (
+    salvage, index_days, missing_days, assemble, continuation_context,
+    itinerary_repair_metrics, MAX_CONTINUATIONS,
+)
+from .http_client import http_client, async_http_client, OLLAMA
+from .chunked_itinerary import ChunkedItineraryGenerator, CHUNKED_MIN_DAYS
+from .embedding_cache import embedding_cache
+from .token_budget import token_budget
+from .destinations_index import destinations_index
+from .cache_metrics import itinerary_cache_metrics
+from .ollama_scheduler import ollama_scheduler, AdmissionRejected
+from .intent_router import intent_router, ITINERARY, CHAT, ADVICE, MODIFY_ITINERARY
+from .single_flight import itinerary_flights, itinerary_async_flights, advisory_lease, async_advisory_lease, normalise_key
 
 class LLaMAService:
     def __init__(self):
         # Ollama Configuration
         ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
         self.ollama_url = f"{ollama_host}/api/chat"
-        self.embedding_url = f"{ollama_host}/api/embeddings"
+        self.embed_batch_url = f"{ollama_host}/api/embed"
         self.model = "srilanka-llama" 
         self.fallback_model = "llama3.2"
         self.embedding_model = "nomic-embed-text"
         self.store = ItineraryStore()
 
     def get_embedding(self, text):
-        """Generate embedding using Ollama."""
-        payload = {
-            "model": self.embedding_model,
-            "prompt": text
-        }
-        try:
-            response = requests.post(self.embedding_url, json=payload)
-            response.raise_for_status()
-            return response.json()["embedding"]
-        except Exception as e:
-            print(f"Ollama Embedding Error: {e}")
-            return None
+        """Generate embedding using Ollama (served from the embedding cache when possible)."""
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts, batch_size=EMBED_BATCH_SIZE):
+        """
+        Embed many texts, returning a list aligned with `texts` (None where embedding failed).
+        Cached vectors are reused; the rest go to Ollama's /api/embed in batches.
+        """
+        results = embedding_cache.get_many(texts, self.embedding_model)
+        for batch, payload in self._embed_batches(texts, results, batch_size):
+            try:
+                response = http_client.post(OLLAMA, self.embed_batch_url, json=payload)
+                fresh = self._parse_embeddings(batch, response)
+            except Exception as e:
+                print(f"Ollama Embedding Error: {e}")
+                continue
+            embedding_cache.put_many(fresh, self.embedding_model)
+            results.update(fresh)
+
+        return [results.get(text) for text in texts]
+
+    async def aget_embedding(self, text):
+        return (await self.aget_embeddings([text]))[0]
+
+    async def aget_embeddings(self, texts, batch_size=EMBED_BATCH_SIZE):
+        """get_embeddings for the ASGI path; cache reads/writes run in the ORM thread."""
+        results = await sync_to_async(embedding_cache.get_many)(texts, self.embedding_model)
+        for batch, payload in self._embed_batches(texts, results, batch_size):
+            try:
+                response = await async_http_client.post(OLLAMA, self.embed_batch_url, json=payload)
+                fresh = self._parse_embeddings(batch, response)
+            except Exception as e:
+                print(f"Ollama Embedding Error: {e}")
+                continue
+            await sync_to_async(embedding_cache.put_many)(fresh, self.embedding_model)
+            results.update(fresh)
+
+        return [results.get(text) for text in texts]
+
+    def _embed_batches(self, texts, cached, batch_size):
+        """(batch, /api/embed payload) for each slice of the distinct texts missing from `cached`."""
+        pending = list(dict.fromkeys(text for text in texts if text not in cached))
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            yield batch, {"model": self.embedding_model, "input": batch}
+
+    def _parse_embeddings(self, batch, response):
+        response.raise_for_status()
+        return dict(zip(batch, response.json()["embeddings"]))
+
+    def _ollama_chat(self, slot, payload):
+        """POST `payload` to /api/chat inside an Ollama scheduler slot of the given kind."""
+        with ollama_scheduler.slot(slot):
+            return http_client.post(OLLAMA, self.ollama_url, json=payload)
+
+    async def _aollama_chat(self, slot, payload):
+        async with ollama_scheduler.aslot(slot):
+            return await async_http_client.post(OLLAMA, self.ollama_url, json=payload)
 
-    def generate_itinerary(self, user_preferences):
+    def _parse_preferences(self, user_preferences):
         """
-        Generate itinerary with Semantic Cache (Vector Bank).
+        Normalise structured (dict) or free-text preferences into prompt variables.
+        Free text should already have been routed as an itinerary request (see _route).
         """
-        # 0. Parse Input
         if isinstance(user_preferences, dict):
-             duration = str(user_preferences.get('duration', '7'))
+             duration = self._clamp_duration(user_preferences.get('duration', '7'))
              start_loc = str(user_preferences.get('startLocation', 'Colombo')).strip()
              group = str(user_preferences.get('groupSize', 'Couple')).strip()
              trip_type = str(user_preferences.get('tripType', 'Beach')).strip()
              
              # Create a highly explicit, unique string for the embedding model
              query_text = f"Duration: {duration} Days | Start Location: {start_loc} | Group: {group} | Style: {trip_type}"
+             start_date = user_preferences.get('startDate')
+             calendar = self._calendar_notes(start_date, duration)
+             cache_key = self._canonical_cache_key(duration, start_loc, group, trip_type, calendar)
         else:
-             import re
              query_text = user_preferences
              text_lower = query_text.lower()
              
              # Fallback DEFAULTS so raw chat inputs do not crash the prompt variables
              # Extract duration dynamically using regex
              duration_match = re.search(r'(\d+)\s*days?', text_lower)
-             duration = str(duration_match.group(1)) if duration_match else str(5)
+             duration = self._clamp_duration(duration_match.group(1)) if duration_match else str(5)
              
              start_loc = "Sri Lanka"
              group = "Traveler"
              trip_type = "Sightseeing"
-             
-             # Improved heuristic: detection words for itineraries
-             itinerary_keywords = ["plan", "trip", "itinerary", "day", "honeymoon", "vacation", "visit"]
-             if not any(word in text_lower for word in itinerary_keywords):
-                 return self.generate_chat_response(query_text)
-
-        # 1. Semantic Cache Lookup
-        print(f"🔍 Checking Vector Bank for: \"{query_text}\"")
-        query_embedding = self.get_embedding(query_text)
+             date_match = re.search(r'\b(\d{4}-\d{2}-\d{2})\b', query_text)
+             calendar = self._calendar_notes(date_match.group(1) if date_match else None, duration)
+             # Free text has no canonical form; it only uses the semantic tier
+             cache_key = None
+
+        return {
+            "query_text": query_text,
+            "duration": duration,
+            "start_loc": start_loc,
+            "group": group,
+            "trip_type": trip_type,
+            "cache_key": cache_key,
+            "calendar": calendar,
+        }
+
+    def _route(self, user_preferences):
+        """Intent of the request. Structured preferences are always itineraries; free text goes through the router."""
+        if isinstance(user_preferences, dict):
+            return ITINERARY
+        # Embeds through the shared cache, so the semantic lookup that follows reuses the vector
+        return intent_router.route(user_preferences, self.get_embeddings)[0]
+
+    async def _aroute(self, user_preferences):
+        if isinstance(user_preferences, dict):
+            return ITINERARY
+        return (await intent_router.aroute(user_preferences, self.aget_embeddings))[0]
+
+    def _clamp_duration(self, duration):
+        """Duration as a string, capped at MAX_TRIP_DAYS; non-numeric values pass through (see _duration)."""
+        try:
+            return str(min(MAX_TRIP_DAYS, max(1, int(duration))))
+        except (TypeError, ValueError):
+            return str(duration)
+
+    def _calendar_notes(self, start_date, duration):
+        """[(day number, prompt line)] for the busy days of a dated trip; [] when undated."""
+        if not start_date:
+            return []
+        try:
+            busy = holiday_calendar.busy_days(start_date, min(MAX_TRIP_DAYS, int(duration)))
+        except (ValueError, OverflowError):
+            return []
+        return [
+            (day, f"Day {day} ({info['date']}, {info['weekday']}): {info['crowd_level'].replace('_', ' ')} crowds - {'; '.join(info['reasons'])}")
+            for day, info in busy
+        ]
+
+    def _canonical_cache_key(self, duration, start_loc, group, trip_type, calendar=()):
+        """Hash of the normalised structured preferences, the model and the prompt version."""
+        def norm(value):
+            return " ".join(str(value).lower().split())
+        canonical = {
+            "duration": int(duration) if str(duration).strip().isdigit() else norm(duration),
+            "start": norm(start_loc),
+            "group": norm(group),
+            "style": norm(trip_type),
+            "model": self.model,
+            "prompt_version": PROMPT_VERSION,
+        }
+        if calendar:
+            # Key on which trip days are busy and why, not the dates, so undated and quiet-week trips still share entries
+            canonical["calendar"] = [line.split(" crowds - ", 1)[-1] + f"@{day}" for day, line in calendar]
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _lookup_cache(self, prefs, use_cache=True):
+        """
+        Tiered itinerary cache lookup. Returns (cached itinerary or None, query embedding).
+        Tier 1 is the canonical key for structured preferences; tier 2 is the semantic
+        (pgvector) match, used only for free-text queries.
+        """
+        key_query = self._key_query(prefs, use_cache)
+        if key_query:
+            cached = self.store.get_by_key(**key_query)
+            if cached:
+                return self._lookup_result(use_cache, cached, None, "hit_key")
+
+        query_embedding = self.get_embedding(prefs["query_text"])
+        similar_query = self._similar_query(prefs, use_cache, query_embedding)
+        cached = self.store.find_similar(**similar_query) if similar_query else None
+        return self._lookup_result(use_cache, cached, query_embedding)
+
+    async def _alookup_cache(self, prefs, use_cache=True):
+        """_lookup_cache for the ASGI path."""
+        key_query = self._key_query(prefs, use_cache)
+        if key_query:
+            cached = await sync_to_async(self.store.get_by_key)(**key_query)
+            if cached:
+                return self._lookup_result(use_cache, cached, None, "hit_key")
+
+        query_embedding = await self.aget_embedding(prefs["query_text"])
+        similar_query = self._similar_query(prefs, use_cache, query_embedding)
+        cached = await sync_to_async(self.store.find_similar)(**similar_query) if similar_query else None
+        return self._lookup_result(use_cache, cached, query_embedding)
+
+    def _cache_max_age(self):
+        return timedelta(hours=CACHE_TTL_HOURS) if CACHE_TTL_HOURS > 0 else None
+
+    def _key_query(self, prefs, use_cache):
+        """store.get_by_key arguments for tier 1, or None when it does not apply."""
+        if not use_cache or not prefs["cache_key"]:
+            return None
+        return {"cache_key": prefs["cache_key"], "max_age": self._cache_max_age()}
+
+    def _similar_query(self, prefs, use_cache, query_embedding):
+        """store.find_similar arguments for tier 2, or None when it does not apply."""
+        if not use_cache:
+            return None
+        print(f"🔍 Checking Vector Bank for: \"{prefs['query_text']}\"")
+        if not query_embedding or prefs["cache_key"]:
+            return None
+        return {
+            "query_text": prefs["query_text"],
+            "query_embedding": query_embedding,
+            "prompt_version": PROMPT_VERSION,
+            "model_name": self.model,
+            "max_age": self._cache_max_age(),
+        }
+
+    def _lookup_result(self, use_cache, cached, query_embedding, tier="hit_semantic"):
+        """Count the lookup outcome and return (cached itinerary or None, query embedding)."""
+        itinerary_cache_metrics.incr(tier if cached else "miss" if use_cache else "bypass")
+        return cached, query_embedding
+
+    def _save_to_cache(self, prefs, query_embedding, itinerary_data):
         if query_embedding:
-            cached_itinerary = self.store.find_similar(query_text, query_embedding)
-            if cached_itinerary:
-                print("⚠️ Found Cache, but BYPASSING to force 7-day LLaMA regeneration.")
-                # return cached_itinerary
+            print("💾 Saving new itinerary to Vector Bank...")
+            self.store.save(
+                prefs["query_text"], query_embedding, itinerary_data,
+                cache_key=prefs["cache_key"], prompt_version=PROMPT_VERSION, model_name=self.model
+            )
+
+    def _build_itinerary_payload(self, prefs, stream=False):
+        """Build the Ollama /api/chat payload for a full itinerary generation."""
+        query_text = prefs["query_text"]
+        duration = prefs["duration"]
+        start_loc = prefs["start_loc"]
+        trip_type = prefs["trip_type"]
 
-        # 2. Cache Miss - Prompt Construction
         system_prompt = f"You are an expert Sri Lanka Travel Agent. Generate a highly detailed, unique travel itinerary. You MUST generate the complete itinerary for the full {duration} days requested. DO NOT STOP EARLY."
         user_message = f"""
         TASK: Create a {duration}-Day itinerary for: "{query_text}"
@@ -116,58 +315,449 @@ class LLaMAService:
         3. Replace ALL placeholder text with real, factual Sri Lankan locations, activities, and restaurant names relevant to a "{trip_type}" style trip.
         4. Maintain strict JSON formatting. DO NOT include code comments in the output JSON.
         """
+        if prefs.get("calendar"):
+            user_message += self._calendar_rule(prefs["calendar"])
+        # The model picks the rest of the route itself, so only the start is known up front
+        user_message += self._grounding_rule([(1, start_loc)], prefs)
 
-        # 3. LLaMA Generation
-        payload = {
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+        return {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            "stream": False,
+            "messages": messages,
+            "stream": stream,
             "format": "json",
-            "options": {"temperature": 0.4, "num_ctx": 8192, "num_predict": 4096} # Forced high generation output limit
+            # Context and output limits sized to the prompt and the trip length
+            "options": {"temperature": 0.4, **token_budget.plan("itinerary", messages, self._duration(prefs))}
         }
 
+    def _calendar_rule(self, calendar):
+        lines = "\n".join(f"        - {line}" for _, line in calendar)
+        return f"""
+        5. CALENDAR: These trip days are busy in Sri Lanka. Plan around them (visit temples and popular sites early or on quieter days, book ahead, mention the holiday in that day's narrative):
+{lines}
+        """
+
+    def _grounding_rule(self, locations_by_day, prefs):
+        """Prompt rule listing real indexed places for the given (day, location) pairs, or ""."""
+        lines = destinations_index.prompt_lines(locations_by_day, prefs.get("theme_vector"))
+        if not lines:
+            return ""
+        lines = "\n".join(f"        - {line}" for line in lines)
+        return f"""
+        {6 if prefs.get("calendar") else 5}. REAL PLACES: Prefer these verified places for "suggested_restaurants" and activities on the listed days (do not invent restaurant names there):
+{lines}
+        """
+
+    def _theme_text(self, prefs):
+        """Text embedded to rank indexed places for this trip, or None without a compatible index."""
+        if destinations_index.model != self.embedding_model:
+            return None
+        return f"{prefs['trip_type']} travel in Sri Lanka: {prefs['query_text']}"
+
+    def _theme_vector(self, prefs):
+        text = self._theme_text(prefs)
+        return self.get_embedding(text) if text else None
+
+    async def _atheme_vector(self, prefs):
+        text = self._theme_text(prefs)
+        return await self.aget_embedding(text) if text else None
+
+    def _use_chunked(self, prefs, mode):
+        if mode in ("single", "chunked"):
+            return mode == "chunked"
         try:
-            print(f"🚀 Cache Miss. Generating with {payload['model']}...")
-            response = requests.post(self.ollama_url, json=payload)
-            response.raise_for_status()
-            
-            content = response.json().get("message", {}).get("content", "").replace("```json", "").replace("```", "").strip()
-            itinerary_data = json.loads(content)
+            return int(prefs["duration"]) >= CHUNKED_MIN_DAYS
+        except ValueError:
+            return False
+
+    def generate_itinerary(self, user_preferences, mode=None, use_cache=True):
+        """
+        Generate itinerary with the tiered cache (canonical key, then Vector Bank).
+        mode: "single" (one full-length generation), "chunked" (route skeleton, then
+        days in parallel batches) or None to pick by trip length.
+        use_cache=False skips the lookup and forces a fresh generation.
+        """
+        # 0. Route and parse input
+        intent = self._route(user_preferences)
+        if intent != ITINERARY:
+            return self.generate_chat_response(user_preferences, intent)
+        prefs = self._parse_preferences(user_preferences)
+
+        # 1. Cache Lookup
+        cached_itinerary, query_embedding = self._lookup_cache(prefs, use_cache)
+        if cached_itinerary:
+            return cached_itinerary
+
+        # 2. Coalesce identical in-flight requests (threads in this worker, then other workers/replicas)
+        flight_key = self._flight_key(prefs, mode)
+
+        def lead():
+            wait_started = timezone.now()
+            with advisory_lease(flight_key) as first:
+                if not first:
+                    shared = self._shared_result(prefs, wait_started)
+                    if shared:
+                        print("🤝 Reusing itinerary generated by another worker.")
+                        return shared
+                return self._generate_uncached(prefs, mode, query_embedding)
+
+        return self._coalesced(*itinerary_flights.do(flight_key, lead))
+
+    def _flight_key(self, prefs, mode):
+        """
+        Coalescing key. Structured requests use the canonical cache key, which covers the
+        calendar, so the same trip on different dates is never shared; free text embeds its date.
+        """
+        return normalise_key(f"{mode or 'auto'}|{prefs['cache_key'] or prefs['query_text']}")
+
+    def _coalesced(self, itinerary_data, shared):
+        """A flight's result for this caller; followers get their own copy."""
+        if shared:
+            print("🤝 Coalesced with an identical in-flight request.")
+            return copy.deepcopy(itinerary_data)
+        return itinerary_data
 
-            # 4. Save to Cache
-            if query_embedding:
-                print("💾 Saving new itinerary to Vector Bank...")
-                self.store.save(query_text, query_embedding, itinerary_data)
+    def _shared_result(self, prefs, since):
+        """Itinerary another worker saved for the same flight key after `since`."""
+        if prefs["cache_key"]:
+            return self.store.get_by_key(prefs["cache_key"], since=since)
+        return self.store.get_exact(prefs["query_text"], since=since)
+
+    def _generate_uncached(self, prefs, mode, query_embedding):
+        """Run the LLM generation and save the result to the Vector Bank."""
+        try:
+            prefs["theme_vector"] = self._theme_vector(prefs)
+            # 2. Cache Miss - Prompt Construction (None for the chunked path)
+            payload = self._generation_payload(prefs, mode)
+            if payload is None:
+                itinerary_data = ChunkedItineraryGenerator(self).generate(prefs)
+            else:
+                # 3. LLaMA Generation
+                response = self._ollama_chat("generation", payload)
+                itinerary_data = self._repair_itinerary(prefs, self._itinerary_content(response, "itinerary", self._duration(prefs)))
+
+            # 4. Save to Cache (skip short itineraries and days that fell back to the bare skeleton)
+            if self._is_complete(itinerary_data, prefs):
+                self._save_to_cache(prefs, query_embedding, itinerary_data)
                 
             return itinerary_data
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             print(f"LLaMA Error: {e}")
             return {"error": str(e)}
 
-    def generate_chat_response(self, user_text):
+    def _generation_payload(self, prefs, mode):
+        """Single-shot itinerary payload, or None when the trip is generated in chunks."""
+        if self._use_chunked(prefs, mode):
+            print(f"🚀 Cache Miss. Generating in parallel chunks with {self.model}...")
+            return None
+        payload = self._build_itinerary_payload(prefs)
+        print(f"🚀 Cache Miss. Generating with {payload['model']}...")
+        return payload
+
+    def _itinerary_content(self, response, kind, units):
+        response.raise_for_status()
+        body = response.json()
+        token_budget.record(kind, units, body)
+        return body.get("message", {}).get("content", "")
+
+    def _duration(self, prefs):
+        try:
+            return min(MAX_TRIP_DAYS, max(1, int(prefs["duration"])))
+        except ValueError:
+            return 1
+
+    def _is_complete(self, itinerary_data, prefs=None):
+        days = itinerary_data.get("days", [])
+        if prefs is not None and len(days) < self._duration(prefs):
+            return False
+        return all(day.get("activities") for day in days)
+
+    def _start_repair(self, prefs, content):
+        """Salvage and validate the model output. Returns (data, {day number: day}, duration)."""
+        duration = self._duration(prefs)
+        data, salvaged = salvage(content)
+        raw_days = data.get("days") if isinstance(data.get("days"), list) else []
+        indexed = index_days(raw_days, duration)
+        if not indexed:
+            itinerary_repair_metrics.incr("unusable")
+            raise ValueError("The model returned no usable itinerary days.")
+        if salvaged or len(indexed) < len(raw_days):
+            itinerary_repair_metrics.incr("salvaged")
+            print(f"🩹 Salvaged {len(indexed)} valid day(s) from malformed output.")
+        else:
+            itinerary_repair_metrics.incr("clean")
+        return data, indexed, duration
+
+    def _continuation_payload(self, prefs, indexed, missing, route=None):
+        """Ask for only the missing days, with the existing days (and any planned stops) as route context."""
+        numbers = ", ".join(str(n) for n in missing)
+        stops = [f"Day {n}: {route[n]['location']} ({route[n]['theme']})" for n in missing if route and n in route]
+        task = f"keeping each day at its planned stop: {'; '.join(stops)}" if stops else "continuing the route sensibly from the neighbouring days"
+        user_message = f"""
+        We are writing a {prefs['duration']}-Day "{prefs['trip_type']}" itinerary for: "{prefs['query_text']}"
+        These days are already planned:
+{continuation_context(indexed)}
+
+        TASK: Write ONLY day(s) {numbers}, {task}. Do not repeat planned activities.
+
+        REQUIRED JSON FORMAT:
+        {{"days": [{{"day": {missing[0]}, "location": "City", "theme": "Day theme", "activities": [{{"time": "Morning", "activity": "Specific Activity Name", "description": "Details"}}], "suggested_restaurants": ["Real restaurant"], "narrative": "Paragraph."}}]}}
+        Return exactly {len(missing)} object(s) in "days", numbered {numbers}. Use real Sri Lankan places. No comments.
         """
-        Handle natural language chat queries.
+        messages = [
+            {"role": "system", "content": "You are an expert Sri Lanka Travel Agent completing an unfinished itinerary."},
+            {"role": "user", "content": user_message}
+        ]
+        return {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "format": "json",
+            "options": {"temperature": 0.4, **token_budget.plan("continuation", messages, len(missing))}
+        }
+
+    def _next_continuation(self, prefs, indexed, duration, route=None):
+        """(missing day numbers, payload) for the next continuation request, or None when nothing is missing."""
+        missing = missing_days(indexed, duration)
+        if not missing:
+            return None
+        print(f"🧩 Continuing itinerary for missing day(s) {missing}...")
+        itinerary_repair_metrics.incr("continuations")
+        return missing, self._continuation_payload(prefs, indexed, missing, route)
+
+    def _merge_continuation(self, indexed, response, missing, duration):
+        """Add the requested days from a continuation response to `indexed`; returns how many were added."""
+        data, _ = salvage(self._itinerary_content(response, "continuation", len(missing)))
+        fresh = index_days(data.get("days") if isinstance(data.get("days"), list) else [], duration, offset=missing[0] - 1)
+        added = {n: day for n, day in fresh.items() if n in missing}
+        indexed.update(added)
+        itinerary_repair_metrics.incr("continued_days", len(added))
+        return len(added)
+
+    def _finish_repair(self, prefs, data, indexed, duration):
+        missing = missing_days(indexed, duration)
+        if missing:
+            itinerary_repair_metrics.incr("incomplete")
+            print(f"⚠️ Itinerary still missing day(s) {missing}; it will not be cached.")
+        return assemble(data, indexed, prefs, duration)
+
+    def _repair_itinerary(self, prefs, content):
+        """
+        Turn raw model output into a validated itinerary: keep every complete day,
+        then request only the missing days (with the existing ones as context)
+        instead of regenerating the whole trip.
+        """
+        data, indexed, duration = self._start_repair(prefs, content)
+        self._continue_missing(prefs, indexed, duration)
+        return self._finish_repair(prefs, data, indexed, duration)
+
+    async def _arepair_itinerary(self, prefs, content):
+        data, indexed, duration = self._start_repair(prefs, content)
+        await self._acontinue_missing(prefs, indexed, duration)
+        return self._finish_repair(prefs, data, indexed, duration)
+
+    def _continue_missing(self, prefs, indexed, duration, route=None):
+        """Fill the gaps in `indexed` in place, up to MAX_CONTINUATIONS requests. `route` maps day number to planned stop."""
+        for _ in range(MAX_CONTINUATIONS):
+            step = self._next_continuation(prefs, indexed, duration, route)
+            if step is None:
+                break
+            missing, payload = step
+            try:
+                response = self._ollama_chat("generation", payload)
+                added = self._merge_continuation(indexed, response, missing, duration)
+            except Exception as e:
+                # A partial itinerary beats an error after minutes of generation
+                print(f"Continuation Error: {e}")
+                break
+            if not added:
+                break
+
+    async def _acontinue_missing(self, prefs, indexed, duration, route=None):
+        for _ in range(MAX_CONTINUATIONS):
+            step = self._next_continuation(prefs, indexed, duration, route)
+            if step is None:
+                break
+            missing, payload = step
+            try:
+                response = await self._aollama_chat("generation", payload)
+                added = self._merge_continuation(indexed, response, missing, duration)
+            except Exception as e:
+                print(f"Continuation Error: {e}")
+                break
+            if not added:
+                break
+
+    async def agenerate_itinerary(self, user_preferences, mode=None, use_cache=True):
+        """
+        generate_itinerary for the ASGI path. Ollama calls are awaited on the event
+        loop and ORM work runs in the thread pool, so a waiting generation does not
+        occupy a worker thread.
+        """
+        intent = await self._aroute(user_preferences)
+        if intent != ITINERARY:
+            return await self.agenerate_chat_response(user_preferences, intent)
+        prefs = self._parse_preferences(user_preferences)
+
+        cached_itinerary, query_embedding = await self._alookup_cache(prefs, use_cache)
+        if cached_itinerary:
+            return cached_itinerary
+
+        # Same coalescing as the sync path: coroutines on this loop, then other workers/replicas
+        flight_key = self._flight_key(prefs, mode)
+
+        async def lead():
+            wait_started = timezone.now()
+            async with async_advisory_lease(flight_key) as first:
+                if not first:
+                    shared = await sync_to_async(self._shared_result)(prefs, wait_started)
+                    if shared:
+                        print("🤝 Reusing itinerary generated by another worker.")
+                        return shared
+                return await self._agenerate_uncached(prefs, mode, query_embedding)
+
+        return self._coalesced(*await itinerary_async_flights.do(flight_key, lead))
+
+    async def _agenerate_uncached(self, prefs, mode, query_embedding):
+        try:
+            prefs["theme_vector"] = await self._atheme_vector(prefs)
+            payload = self._generation_payload(prefs, mode)
+            if payload is None:
+                itinerary_data = await ChunkedItineraryGenerator(self).agenerate(prefs)
+            else:
+                response = await self._aollama_chat("generation", payload)
+                itinerary_data = await self._arepair_itinerary(prefs, self._itinerary_content(response, "itinerary", self._duration(prefs)))
+
+            if self._is_complete(itinerary_data, prefs):
+                await sync_to_async(self._save_to_cache)(prefs, query_embedding, itinerary_data)
+
+            return itinerary_data
+
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"LLaMA Error: {e}")
+            return {"error": str(e)}
+
+    async def astream_itinerary(self, user_preferences, use_cache=True):
         """
+        Streaming variant of agenerate_itinerary, as an async generator so each event
+        reaches the client as soon as it is parsed (Django buffers sync iterators
+        under ASGI). Yields (event, data) tuples: "meta" for title/summary/theme,
+        "day" for each completed day, then "done" with the full itinerary (or
+        "chat"/"error").
+        """
+        intent = await self._aroute(user_preferences)
+        if intent != ITINERARY:
+            result = await self.agenerate_chat_response(user_preferences, intent)
+            yield ("error", result) if "error" in result else ("chat", result)
+            return
+        prefs = self._parse_preferences(user_preferences)
+
+        cached_itinerary, query_embedding = await self._alookup_cache(prefs, use_cache)
+        if cached_itinerary:
+            # Replay the cached itinerary through the same events a live generation produces
+            for field in IncrementalItineraryParser.META_FIELDS:
+                if field in cached_itinerary:
+                    yield ("meta", {field: cached_itinerary[field]})
+            for day in cached_itinerary.get("days", []):
+                yield ("day", day)
+            yield ("done", cached_itinerary)
+            return
+
+        prefs["theme_vector"] = await self._atheme_vector(prefs)
+        payload = self._build_itinerary_payload(prefs, stream=True)
+        parser = IncrementalItineraryParser()
+        emitted = set()
+
+        try:
+            print(f"🚀 Cache Miss. Streaming with {payload['model']}...")
+            async with ollama_scheduler.aslot("generation"), async_http_client.stream(OLLAMA, "POST", self.ollama_url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    for event in parser.feed(chunk.get("message", {}).get("content", "")):
+                        if event[0] == "day":
+                            emitted.add(event[1].get("day"))
+                        yield event
+                    if chunk.get("done"):
+                        token_budget.record("itinerary", self._duration(prefs), chunk)
+                        break
+
+            print(f"✅ Stream complete: {parser.days_emitted} days emitted incrementally.")
+            itinerary_data = await self._arepair_itinerary(prefs, parser.buffer)
+            # Days recovered by continuation were never streamed
+            for day in itinerary_data["days"]:
+                if day["day"] not in emitted:
+                    yield ("day", day)
+
+            if self._is_complete(itinerary_data, prefs):
+                await sync_to_async(self._save_to_cache)(prefs, query_embedding, itinerary_data)
+
+            yield ("done", itinerary_data)
+
+        except AdmissionRejected as e:
+            yield ("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"LLaMA Stream Error: {e}")
+            yield ("error", {"error": str(e)})
+
+    def _chat_payload(self, user_text, intent=CHAT):
         system_prompt = "You are a helpful Sri Lanka Travel Assistant. Keep answers concise."
-        
+        if intent == MODIFY_ITINERARY:
+            system_prompt += " The user wants to change a trip you cannot see: suggest the concrete changes and tell them to regenerate the plan with their updated preferences."
+        elif intent == ADVICE:
+            system_prompt += " For live weather and crowd updates, suggest the Live Journey assistant, which has real-time data."
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text}
+        ]
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_text}
-            ],
-            "stream": False
+            "messages": messages,
+            "stream": False,
+            "options": token_budget.plan("chat", messages)
         }
+        print(f"Sending CHAT request to Ollama ({payload['model']})...")
+        return payload
+
+    def _chat_result(self, response, intent):
+        response.raise_for_status()
+        body = response.json()
+        token_budget.record("chat", 1, body)
+        return {"chat_response": body.get("message", {}).get("content", ""), "intent": intent}
+
+    def generate_chat_response(self, user_text, intent=CHAT):
+        """
+        Handle natural language chat queries.
+        """
+        payload = self._chat_payload(user_text, intent)
         
         try:
-            print(f"Sending CHAT request to Ollama ({payload['model']})...")
-            response = requests.post(self.ollama_url, json=payload)
-            response.raise_for_status()
-            content = response.json().get("message", {}).get("content", "")
-            return {"chat_response": content}
+            response = self._ollama_chat("chat", payload)
+            return self._chat_result(response, intent)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def agenerate_chat_response(self, user_text, intent=CHAT):
+        payload = self._chat_payload(user_text, intent)
+
+        try:
+            response = await self._aollama_chat("chat", payload)
+            return self._chat_result(response, intent)
+        except AdmissionRejected:
+            raise
         except Exception as e:
             return {"error": str(e)}
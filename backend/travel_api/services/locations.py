@@ -0,0 +1,172 @@
+import re
+
+# Town centres for the places itineraries are built around (lat, lon).
+# Itinerary days only carry a location name, so weather lookups resolve it here.
+TOWNS = {
+    "colombo": (6.9271, 79.8612),
+    "negombo": (7.2083, 79.8358),
+    "kandy": (7.2906, 80.6337),
+    "peradeniya": (7.2690, 80.5970),
+    "galle": (6.0535, 80.2210),
+    "unawatuna": (6.0100, 80.2490),
+    "hikkaduwa": (6.1395, 80.1063),
+    "bentota": (6.4210, 79.9980),
+    "mirissa": (5.9483, 80.4716),
+    "weligama": (5.9747, 80.4296),
+    "matara": (5.9549, 80.5550),
+    "tangalle": (6.0243, 80.7941),
+    "ella": (6.8667, 81.0466),
+    "nuwara eliya": (6.9497, 80.7891),
+    "hatton": (6.8916, 80.5955),
+    "adams peak": (6.8096, 80.4994),
+    "haputale": (6.7656, 80.9510),
+    "badulla": (6.9934, 81.0550),
+    "sigiriya": (7.9570, 80.7603),
+    "dambulla": (7.8742, 80.6511),
+    "habarana": (8.0347, 80.7497),
+    "polonnaruwa": (7.9403, 81.0188),
+    "anuradhapura": (8.3114, 80.4037),
+    "mihintale": (8.3500, 80.5167),
+    "trincomalee": (8.5874, 81.2152),
+    "nilaveli": (8.6833, 81.2000),
+    "batticaloa": (7.7310, 81.6747),
+    "pasikudah": (7.9290, 81.5610),
+    "arugam bay": (6.8390, 81.8350),
+    "jaffna": (9.6615, 80.0255),
+    "yala": (6.3725, 81.5185),
+    "tissamaharama": (6.2790, 81.2870),
+    "kataragama": (6.4134, 81.3346),
+    "udawalawe": (6.4740, 80.8980),
+    "sinharaja": (6.4000, 80.5000),
+    "ratnapura": (6.6828, 80.3992),
+    "kitulgala": (6.9890, 80.4180),
+    "wilpattu": (8.4570, 80.0140),
+    "kalpitiya": (8.2295, 79.7594),
+    "kurunegala": (7.4818, 80.3609),
+    "minneriya": (8.0330, 80.9000),
+    "matale": (7.4675, 80.6234),
+    "beruwala": (6.4788, 79.9828),
+    "ahungalla": (6.3150, 80.0330),
+    "mount lavinia": (6.8389, 79.8653),
+    "moratuwa": (6.7730, 79.8816),
+    "kelaniya": (6.9553, 79.9220),
+    "ja ela": (7.0744, 79.8919),
+    "maharagama": (6.8480, 79.9265),
+    "battaramulla": (6.8994, 79.9180),
+    "avissawella": (6.9533, 80.2100),
+    # Towns in the destinations dataset (services/destinations_index.py)
+    "dehiwala": (6.8511, 79.8659),
+    "ratmalana": (6.8200, 79.8800),
+    "nugegoda": (6.8722, 79.8883),
+    "rajagiriya": (6.9094, 79.8938),
+    "kotte": (6.8868, 79.9187),
+    "boralesgamuwa": (6.8400, 79.9000),
+    "pannipitiya": (6.8467, 79.9486),
+    "malabe": (6.9048, 79.9580),
+    "kaduwela": (6.9306, 79.9843),
+    "homagama": (6.8441, 80.0024),
+    "wattala": (6.9897, 79.8917),
+    "kiribathgoda": (6.9781, 79.9275),
+    "ragama": (7.0290, 79.9219),
+    "gampaha": (7.0917, 79.9942),
+    "seeduwa": (7.1300, 79.8800),
+    "katunayake": (7.1700, 79.8833),
+    "kochchikade": (7.2600, 79.8600),
+    "wennappuwa": (7.3498, 79.8456),
+    "panadura": (6.7133, 79.9026),
+    "wadduwa": (6.6667, 79.9250),
+    "kalutara": (6.5854, 79.9607),
+    "aluthgama": (6.4340, 80.0030),
+    "kosgoda": (6.3330, 80.0270),
+    "ambalangoda": (6.2355, 80.0538),
+    "ahangama": (5.9733, 80.3622),
+    "akuressa": (6.0969, 80.4781),
+    "deniyaya": (6.3427, 80.5597),
+    "hambantota": (6.1241, 81.1185),
+    "kegalle": (7.2513, 80.3464),
+    "mawanella": (7.2522, 80.4453),
+    "warakapola": (7.2268, 80.1963),
+    "rambukkana": (7.3236, 80.3947),
+    "pinnawala": (7.3000, 80.3886),
+    "gampola": (7.1640, 80.5770),
+    "talawakele": (6.9370, 80.6580),
+    "wellawaya": (6.7369, 81.1025),
+    "monaragala": (6.8728, 81.3507),
+    "kilinochchi": (9.3803, 80.3770),
+    "mullaitivu": (9.2671, 80.8142),
+    "kandana": (7.0480, 79.8970),
+    "kadawatha": (7.0016, 79.9530),
+    "kottawa": (6.8412, 79.9654),
+    "piliyandala": (6.8018, 79.9227),
+    "chilaw": (7.5758, 79.7953),
+    "puttalam": (8.0362, 79.8283),
+    "ampara": (7.2975, 81.6820),
+}
+
+# Spellings seen in generated itineraries and in the dataset's addresses
+ALIASES = {
+    "adam's peak": "adams peak",
+    "sri pada": "adams peak",
+    "nuwaraeliya": "nuwara eliya",
+    "arugambay": "arugam bay",
+    "trinco": "trincomalee",
+    "tissa": "tissamaharama",
+    "yala national park": "yala",
+    "udawalawe national park": "udawalawe",
+    "minneriya national park": "minneriya",
+    "mt lavinia": "mount lavinia",
+    "negambo": "negombo",
+    "a pura": "anuradhapura",
+    "kurunagala": "kurunegala",
+    "kalaniya": "kelaniya",
+    "baththaramulla": "battaramulla",
+    "ahungalle": "ahungalla",
+    "dehiwela": "dehiwala",
+    "rathmalana": "ratmalana",
+    "kaluthara": "kalutara",
+    "katunayaka": "katunayake",
+    "mullativu": "mullaitivu",
+    "mulaitivu": "mullaitivu",
+    "kaluthra": "kalutara",
+    "beruwela": "beruwala",
+    "rathnapura": "ratnapura",
+    "kithulgala": "kitulgala",
+    "passikudah": "pasikudah",
+    "passikuda": "pasikudah",
+    "bambalapitiya": "colombo",
+    # Colombo's seafront, not the southern town
+    "galle face": "colombo",
+}
+# "Galle Road, Colombo 03" is in Colombo: a town name followed by one of these is a street
+STREET_WORDS = ("road", "rd", "street", "mawatha", "highway")
+
+
+def _normalise(name):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z' ]+", " ", str(name).lower())).strip()
+
+
+_ALIAS_RE = re.compile(r"\b(" + "|".join(re.escape(a) for a in sorted(ALIASES, key=len, reverse=True)) + r")\b")
+_TOWN_NAMES = "|".join(re.escape(t) for t in sorted(TOWNS, key=len, reverse=True))
+_STREET_RE = re.compile(rf"\b(?:{_TOWN_NAMES}) (?:{'|'.join(STREET_WORDS)})\b")
+_TOWN_RE = re.compile(rf"\b({_TOWN_NAMES})\b")
+
+
+def town(name, last=False):
+    """
+    Gazetteer key for a location name such as "Kandy" or "Galle Fort & Unawatuna", or None.
+    The earliest mention wins, so "Kandy to Nuwara Eliya" resolves to where the day starts;
+    with last=True the trailing one does, as in addresses ("Kandy Road, Kelaniya").
+    """
+    if not name:
+        return None
+    text = _ALIAS_RE.sub(lambda m: ALIASES[m.group(1)], _normalise(name))
+    mentions = _TOWN_RE.findall(_STREET_RE.sub(" ", text))
+    if not mentions:
+        return None
+    return mentions[-1] if last else mentions[0]
+
+
+def resolve(name):
+    """(lat, lon) for a location name, or None."""
+    key = town(name)
+    return TOWNS[key] if key else None
@@ -0,0 +1,219 @@
+import os
+import math
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+
+# Upstream generations one worker process lets run at once. Across the deployment,
+# processes x this should roughly equal Ollama's OLLAMA_NUM_PARALLEL.
+MAX_CONCURRENT = int(os.environ.get("OLLAMA_MAX_CONCURRENT", "2"))
+# Generations one user may have running or queued in this process at once
+PER_USER_LIMIT = int(os.environ.get("OLLAMA_PER_USER_LIMIT", "2"))
+# Reject when the estimated queue wait exceeds these (seconds)
+CHAT_DEADLINE = float(os.environ.get("OLLAMA_CHAT_DEADLINE_SECONDS", "20"))
+GENERATION_DEADLINE = float(os.environ.get("OLLAMA_GENERATION_DEADLINE_SECONDS", "240"))
+
+# Lower value = served first
+CHAT = 0
+GENERATION = 1
+BACKGROUND = 2
+CLASS_NAMES = {CHAT: "chat", GENERATION: "generation", BACKGROUND: "background"}
+
+# (user key, is background worker, request id) for the request currently calling Ollama
+_caller = ContextVar("ollama_caller", default=(None, False, None))
+_request_ids = itertools.count(1)
+
+
+class AdmissionRejected(Exception):
+    """The scheduler will not queue this call; the API should answer `status_code` with Retry-After."""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+@contextmanager
+def ollama_caller(user_key, background=False):
+    """
+    Attribute Ollama calls made inside the block to `user_key` for fair share.
+    All calls in the block count as one request towards the per-user limit, so a
+    chunked generation's parallel batches do not trip it.
+    """
+    token = _caller.set((str(user_key), background, next(_request_ids)))
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+class _Ticket:
+    def __init__(self, priority, user, request, seq):
+        self.priority = priority
+        self.user = user
+        self.request = request
+        self.seq = seq
+        self.granted = False
+        self.started = None
+        self._event = None
+        self._loop = None
+        self._future = None
+
+    def wake(self):
+        if self._future is not None:
+            self._loop.call_soon_threadsafe(lambda: self._future.done() or self._future.set_result(True))
+        elif self._event is not None:
+            self._event.set()
+
+
+class OllamaScheduler:
+    """
+    Admission control and priority scheduling for upstream Ollama generations.
+
+    At most `max_concurrent` calls run at once. Free slots go to interactive chat
+    before itinerary generation, and generation before background jobs. Within
+    a class, the user with the fewest running calls goes first, then FIFO. A call
+    is refused up front (AdmissionRejected) when its estimated queue wait would
+    exceed its deadline, so clients get a 503/429 with Retry-After rather than
+    holding a connection until the server times out. Works from threads and
+    coroutines alike.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, per_user_limit=PER_USER_LIMIT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user_limit = max(1, per_user_limit)
+        self.deadlines = {CHAT: CHAT_DEADLINE, GENERATION: GENERATION_DEADLINE, BACKGROUND: None}
+        # Moving average of how long each class holds a slot; seeds are rough first guesses
+        self.service_seconds = {CHAT: 5.0, GENERATION: 90.0, BACKGROUND: 90.0}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._running = []
+        self._rejected = {429: 0, 503: 0}
+
+    def _priority(self, kind, background):
+        if kind == "chat":
+            return CHAT
+        return BACKGROUND if background else GENERATION
+
+    def _estimate_wait(self, priority):
+        # Work queued ahead of (or level with) this call, spread over all slots
+        ahead = sum(self.service_seconds[t.priority] for t in self._waiting if t.priority <= priority)
+        if len(self._running) >= self.max_concurrent:
+            now = time.monotonic()
+            remaining = [max(0.0, self.service_seconds[t.priority] - (now - t.started)) for t in self._running]
+            ahead += min(remaining)
+        return ahead / self.max_concurrent
+
+    def _admit(self, priority, user, request):
+        """Create a waiting ticket or raise AdmissionRejected. Caller holds the lock."""
+        if priority != BACKGROUND:
+            mine = {t.request for t in self._running + self._waiting if user is not None and t.user == user and t.priority != BACKGROUND}
+            if request not in mine and len(mine) >= self.per_user_limit:
+                self._rejected[429] += 1
+                raise AdmissionRejected("Too many requests in progress for this user.", 429, self.service_seconds[priority])
+
+            deadline = self.deadlines[priority]
+            estimate = self._estimate_wait(priority)
+            if deadline is not None and estimate > deadline:
+                self._rejected[503] += 1
+                raise AdmissionRejected("The travel model is busy. Please try again shortly.", 503, estimate)
+
+        ticket = _Ticket(priority, user, request, next(self._seq))
+        self._waiting.append(ticket)
+        return ticket
+
+    def _grant(self):
+        """Hand free slots to waiting tickets. Caller holds the lock."""
+        while self._waiting and len(self._running) < self.max_concurrent:
+            running_per_user = {}
+            for t in self._running:
+                running_per_user[t.user] = running_per_user.get(t.user, 0) + 1
+            ticket = min(self._waiting, key=lambda t: (t.priority, running_per_user.get(t.user, 0), t.seq))
+            self._waiting.remove(ticket)
+            ticket.granted = True
+            ticket.started = time.monotonic()
+            self._running.append(ticket)
+            ticket.wake()
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if ticket.granted:
+                self._release_locked(ticket, record=False)
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+    def _release_locked(self, ticket, record=True):
+        self._running.remove(ticket)
+        if record:
+            held = time.monotonic() - ticket.started
+            self.service_seconds[ticket.priority] = 0.8 * self.service_seconds[ticket.priority] + 0.2 * held
+        self._grant()
+
+    def _release(self, ticket):
+        with self._lock:
+            self._release_locked(ticket)
+
+    def _timeout(self, ticket):
+        deadline = self.deadlines[ticket.priority]
+        # Allow slack over the estimate before giving up on a queued call
+        return None if deadline is None else deadline * 1.5
+
+    @contextmanager
+    def slot(self, kind):
+        """Hold one upstream slot for the duration of the block (blocking wait)."""
+        user, background, request = _caller.get()
+        with self._lock:
+            ticket = self._admit(self._priority(kind, background), user, request)
+            ticket._event = threading.Event()
+            self._grant()
+
+        if not ticket._event.wait(self._timeout(ticket)):
+            self._abandon(ticket)
+            raise AdmissionRejected("Timed out waiting for the travel model.", 503, self.service_seconds[ticket.priority])
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, kind):
+        """slot() for coroutines: waits on a future instead of blocking the event loop."""
+        user, background, request = _caller.get()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            ticket = self._admit(self._priority(kind, background), user, request)
+            ticket._loop = loop
+            ticket._future = loop.create_future()
+            self._grant()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket._future), self._timeout(ticket))
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            raise AdmissionRejected("Timed out waiting for the travel model.", 503, self.service_seconds[ticket.priority])
+        except asyncio.CancelledError:
+            # Client went away while queued; give the slot (if any) to the next caller
+            self._abandon(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "per_user_limit": self.per_user_limit,
+                "running": {name: sum(1 for t in self._running if t.priority == p) for p, name in CLASS_NAMES.items()},
+                "waiting": {name: sum(1 for t in self._waiting if t.priority == p) for p, name in CLASS_NAMES.items()},
+                "avg_service_seconds": {CLASS_NAMES[p]: round(s, 1) for p, s in self.service_seconds.items()},
+                "rejected": dict(self._rejected),
+            }
+
+
+ollama_scheduler = OllamaScheduler()
@@ -0,0 +1,80 @@
+import threading
+from contextlib import contextmanager
+
+
+class ServiceRegistry:
+    """
+    Per-process registry of long-lived service objects.
+
+    Services are built lazily on first use (thread-safe double-checked init) and
+    then reused by every request the worker serves. Tests can swap in fakes with
+    `override()`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._factories = {}
+        self._instances = {}
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._factories[name]()
+                    self._instances[name] = instance
+        return instance
+
+    def reset(self, name=None):
+        """Drop cached instances so the next get() rebuilds them."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    @contextmanager
+    def override(self, name, instance):
+        """Temporarily replace a service (e.g. with a fake in tests)."""
+        with self._lock:
+            previous = self._instances.get(name)
+            self._instances[name] = instance
+        try:
+            yield instance
+        finally:
+            with self._lock:
+                if previous is None:
+                    self._instances.pop(name, None)
+                else:
+                    self._instances[name] = previous
+
+
+registry = ServiceRegistry()
+
+
+def _build_llama_service():
+    from .llama_service import LLaMAService
+    return LLaMAService()
+
+
+def _build_trip_assistant():
+    from .trip_assistant import TripAssistantService
+    return TripAssistantService(llama_agent=get_llama_service())
+
+
+registry.register("llama", _build_llama_service)
+registry.register("trip_assistant", _build_trip_assistant)
+
+
+def get_llama_service():
+    return registry.get("llama")
+
+
+def get_trip_assistant():
+    return registry.get("trip_assistant")
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from asgiref.sync import sync_to_async, ThreadSensitiveContext
+from django.db import connection
+
+# How long a request waits for another worker's identical generation before doing its own
+LEASE_WAIT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_WAIT_SECONDS", "300"))
+LEASE_POLL_SECONDS = float(os.environ.get("SINGLE_FLIGHT_POLL_SECONDS", "1"))
+
+
+def normalise_key(text):
+    """Collapse case and whitespace so trivially different payloads coalesce."""
+    return " ".join(str(text).lower().split())
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    In-process request coalescing.
+
+    The first caller for a key runs the function; concurrent callers with the same
+    key block until it finishes and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another thread did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines: concurrent awaiters of the same key on one event
+    loop share a single run of `fn` instead of each starting a generation.
+
+    The work runs as a detached task that every caller (the first one included)
+    awaits through a shield, so a client disconnect cancels only that caller's
+    wait. The task itself is cancelled once nobody is waiting for it any more.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Await fn() once per key; returns (result, shared) like SingleFlight.do."""
+        loop = asyncio.get_running_loop()
+        call = self._calls.get((loop, key))
+        shared = call is not None
+        if not shared:
+            call = _AsyncCall(loop.create_task(self._run(fn)))
+            self._calls[(loop, key)] = call
+            call.task.add_done_callback(lambda task: self._finished(loop, key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    async def _run(self, fn):
+        # Own thread-sensitive context: the work can outlive the request that started it,
+        # and its ORM calls (advisory lock and unlock) must stay on one thread and connection
+        async with ThreadSensitiveContext():
+            try:
+                return await fn()
+            finally:
+                await sync_to_async(_close_connection)()
+
+    def _finished(self, loop, key, call):
+        if self._calls.get((loop, key)) is call:
+            del self._calls[(loop, key)]
+        if not call.task.cancelled():
+            call.task.exception() # Mark retrieved; the awaiters (if any) re-raise it
+
+
+def _close_connection():
+    connection.close()
+
+
+def _advisory_key(key):
+    # pg advisory locks take a signed bigint
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def _try_lock(lock_id):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+        return cursor.fetchone()[0]
+
+
+def _unlock(lock_id):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+@contextmanager
+def advisory_lease(key, wait_seconds=LEASE_WAIT_SECONDS, poll_seconds=LEASE_POLL_SECONDS):
+    """
+    Cross-process lease on `key` using a Postgres session-level advisory lock.
+
+    Yields True if the lock was free (this process should do the work) and False if
+    another worker or replica held it and we waited for it to finish (or gave up
+    after `wait_seconds`). Falls back to yielding True on non-Postgres databases.
+    """
+    if connection.vendor != "postgresql":
+        yield True
+        return
+
+    lock_id = _advisory_key(key)
+    held = False
+    waited = False
+    deadline = time.monotonic() + wait_seconds
+    try:
+        while True:
+            held = _try_lock(lock_id)
+            if held or time.monotonic() >= deadline:
+                break
+            waited = True
+            time.sleep(poll_seconds)
+    except Exception as e:
+        print(f"Advisory Lock Error: {e}")
+
+    try:
+        yield not waited
+    finally:
+        if held:
+            try:
+                _unlock(lock_id)
+            except Exception as e:
+                print(f"Advisory Unlock Error: {e}")
+
+
+@asynccontextmanager
+async def async_advisory_lease(key, wait_seconds=LEASE_WAIT_SECONDS, poll_seconds=LEASE_POLL_SECONDS):
+    """
+    advisory_lease for coroutines: polls without blocking the event loop.
+
+    The lock is session-level, so lock and unlock must run on the same connection;
+    thread-sensitive sync_to_async keeps both on the request's single sync thread.
+    """
+    if connection.vendor != "postgresql":
+        yield True
+        return
+
+    lock_id = _advisory_key(key)
+    held = False
+    waited = False
+    deadline = time.monotonic() + wait_seconds
+    try:
+        while True:
+            held = await sync_to_async(_try_lock)(lock_id)
+            if held or time.monotonic() >= deadline:
+                break
+            waited = True
+            await asyncio.sleep(poll_seconds)
+    except Exception as e:
+        print(f"Advisory Lock Error: {e}")
+
+    try:
+        yield not waited
+    finally:
+        if held:
+            try:
+                await sync_to_async(_unlock)(lock_id)
+            except Exception as e:
+                print(f"Advisory Unlock Error: {e}")
+
+
+itinerary_flights = SingleFlight()
+itinerary_async_flights = AsyncSingleFlight()
@@ -0,0 +1,176 @@
+import os
+import math
+import threading
+from collections import deque
+
+# Tokenizer for prompt counting: the base model's tokenizer.json on local disk (the LoRA
+# adapters are trained on Llama 3.2 3B), e.g. fetched once at deploy time with
+# `huggingface-cli download mlx-community/Llama-3.2-3B-Instruct-4bit tokenizer.json`.
+# It is read at startup (TravelApiConfig.ready); nothing is downloaded while serving.
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH", "")
+# Characters per token when no tokenizer can be loaded (conservative for English prompts)
+CHARS_PER_TOKEN = 3.5
+
+# num_ctx is rounded up to one of these. Ollama reloads a model whenever num_ctx
+# changes, so a few coarse buckets keep reloads rare while still shrinking small requests.
+CTX_BUCKETS = sorted(int(b) for b in os.environ.get("OLLAMA_CTX_BUCKETS", "4096,8192,16384").split(","))
+MAX_PREDICT = int(os.environ.get("OLLAMA_MAX_PREDICT", "8192"))
+# Output estimate = p90 of recent tokens-per-unit x units x headroom
+HEADROOM = float(os.environ.get("TOKEN_BUDGET_HEADROOM", "1.2"))
+# KV cache per context token; Llama 3.2 3B at f16: 28 layers x 8 KV heads x 128 dims x 2 (K, V) x 2 bytes
+KV_BYTES_PER_TOKEN = int(os.environ.get("MODEL_KV_BYTES_PER_TOKEN", "114688"))
+# Chat template tokens per message plus the assistant header
+MESSAGE_OVERHEAD = 8
+HISTORY = 200
+
+# kind: (seed tokens per unit, fixed output overhead, context the call used before budgeting)
+KINDS = {
+    "itinerary": (450, 200, 8192),      # unit = trip day
+    "continuation": (450, 100, 8192),   # unit = missing day
+    "skeleton": (40, 200, 4096),        # unit = trip day
+    "batch": (450, 200, 4096),          # unit = day in the batch
+    "chat": (350, 0, 2048),             # unit = request (Ollama's default context)
+    "advice": (90, 0, 2048),
+    "batch_advice": (70, 150, 8192),    # unit = activity
+}
+
+
+class _Tokenizer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._loaded = False
+        self.source = None
+
+    def _load(self):
+        if TOKENIZER_PATH:
+            try:
+                from tokenizers import Tokenizer
+                self._tokenizer, self.source = Tokenizer.from_file(TOKENIZER_PATH), TOKENIZER_PATH
+            except Exception as e:
+                print(f"⚠️ Tokenizer unavailable ({e}); estimating {CHARS_PER_TOKEN} chars per token.")
+        if self._tokenizer is None:
+            self.source = "estimate"
+
+    def load(self):
+        """Read the local tokenizer once; later calls are no-ops."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+
+    def count(self, text):
+        # Normally loaded at startup; this only covers code that skipped app loading
+        self.load()
+        if self._tokenizer is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class TokenBudget:
+    """
+    Per-request num_ctx / num_predict planner for Ollama calls.
+
+    The prompt is counted with the model's tokenizer; the output is estimated
+    from the p90 of recent eval_count per unit (trip day, activity, request) for
+    the same kind of call, seeded with the previous fixed limits. A 2-day trip
+    then runs in a 4K context instead of 8K, and a 14-day trip gets a 16K one
+    instead of being cut off. Completed responses feed the history, and the
+    snapshot reports planned KV-cache size and latency against the old fixed
+    settings.
+    """
+
+    def __init__(self, kinds=KINDS, buckets=CTX_BUCKETS):
+        self.kinds = kinds
+        self.buckets = buckets
+        self.tokenizer = _Tokenizer()
+        self._lock = threading.Lock()
+        self._samples = {kind: deque(maxlen=HISTORY) for kind in kinds}
+        self._stats = {kind: {"planned": 0, "ctx_sum": 0, "truncated": 0, "responses": 0, "seconds_sum": 0.0, "load_seconds_sum": 0.0, "eval_tokens": 0, "eval_seconds": 0.0} for kind in kinds}
+
+    def count_messages(self, messages):
+        return sum(self.tokenizer.count(m.get("content", "")) + MESSAGE_OVERHEAD for m in messages) + MESSAGE_OVERHEAD
+
+    def per_unit(self, kind):
+        seed = self.kinds[kind][0]
+        with self._lock:
+            samples = list(self._samples[kind])
+        return _percentile(samples, 0.9) if len(samples) >= 5 else seed
+
+    def plan(self, kind, messages, units=1):
+        """Options {"num_ctx", "num_predict"} for a call of this kind producing `units` units."""
+        _, overhead, _ = self.kinds[kind]
+        units = max(1, units)
+        prompt = self.count_messages(messages)
+        predict = min(MAX_PREDICT, math.ceil((overhead + self.per_unit(kind) * units) * HEADROOM))
+
+        needed = prompt + predict
+        ctx = next((b for b in self.buckets if b >= needed), self.buckets[-1])
+        if needed > ctx:
+            # Largest bucket is too small; keep the whole prompt and shorten the answer
+            predict = max(256, ctx - prompt)
+            print(f"⚠️ {kind}: {needed} tokens needed, capped at num_ctx {ctx} (num_predict {predict}).")
+
+        with self._lock:
+            stats = self._stats[kind]
+            stats["planned"] += 1
+            stats["ctx_sum"] += ctx
+        return {"num_ctx": ctx, "num_predict": predict}
+
+    def record(self, kind, units, body):
+        """Learn from an Ollama /api/chat response body (or the final streamed chunk)."""
+        if not isinstance(body, dict) or not body.get("eval_count"):
+            return
+        per_unit = body["eval_count"] / max(1, units)
+        truncated = body.get("done_reason") == "length"
+        if truncated:
+            # The answer was cut off, so the true length is higher than what we saw
+            per_unit *= 1.25
+        with self._lock:
+            self._samples[kind].append(per_unit)
+            stats = self._stats[kind]
+            stats["responses"] += 1
+            stats["truncated"] += truncated
+            stats["seconds_sum"] += body.get("total_duration", 0) / 1e9
+            stats["load_seconds_sum"] += body.get("load_duration", 0) / 1e9
+            stats["eval_tokens"] += body["eval_count"]
+            stats["eval_seconds"] += body.get("eval_duration", 0) / 1e9
+
+    def snapshot(self):
+        report = {"tokenizer": self.tokenizer.source or "not loaded", "ctx_buckets": self.buckets, "kinds": {}}
+        for kind, (seed, _, fixed_ctx) in self.kinds.items():
+            with self._lock:
+                stats = dict(self._stats[kind])
+                samples = list(self._samples[kind])
+            if not stats["planned"] and not stats["responses"]:
+                continue
+            avg_ctx = stats["ctx_sum"] / stats["planned"] if stats["planned"] else None
+            responses = stats["responses"] or 1
+            report["kinds"][kind] = {
+                "planned": stats["planned"],
+                "responses": stats["responses"],
+                "tokens_per_unit": {
+                    "p50": round(_percentile(samples, 0.5)) if samples else None,
+                    "p90": round(_percentile(samples, 0.9)) if samples else None,
+                    "seed": seed,
+                },
+                "truncated": stats["truncated"],
+                "avg_num_ctx": round(avg_ctx) if avg_ctx else None,
+                "fixed_num_ctx": fixed_ctx,
+                "avg_kv_cache_mib": round(avg_ctx * KV_BYTES_PER_TOKEN / 2 ** 20) if avg_ctx else None,
+                "fixed_kv_cache_mib": round(fixed_ctx * KV_BYTES_PER_TOKEN / 2 ** 20),
+                "avg_seconds": round(stats["seconds_sum"] / responses, 2),
+                # High load time means num_ctx changes are forcing model reloads
+                "avg_load_seconds": round(stats["load_seconds_sum"] / responses, 2),
+                "tokens_per_second": round(stats["eval_tokens"] / stats["eval_seconds"], 1) if stats["eval_seconds"] else None,
+            }
+        return report
+
+
+token_budget = TokenBudget()
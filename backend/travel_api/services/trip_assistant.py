@@ -1,57 +1,66 @@
 import os
-import requests
+import re
 import json
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from .llama_service import LLaMAService
+from .http_client import http_client, async_http_client, OPEN_METEO
+from .ollama_scheduler import AdmissionRejected
+from .weather_cache import weather_cache, grid_cell
+from .holiday_calendar import holiday_calendar
+from .advice_rules import advice_rules
+from .token_budget import token_budget
+from . import locations
+
+# Open-Meteo serves hourly forecasts for today plus the next 15 days
+FORECAST_HORIZON_DAYS = 16
+# Upper bound on activities reviewed in one batched LLM call
+BATCH_MAX_ACTIVITIES = int(os.environ.get("BATCH_ADVICE_MAX_ACTIVITIES", "60"))
+SLOT_HOURS = {"early morning": 7, "morning": 9, "midday": 12, "noon": 12, "lunch": 12, "afternoon": 14, "sunset": 17, "evening": 18, "night": 20}
+
+
+class BatchAdviceError(ValueError):
+    """The itinerary cannot be reviewed in one batch (empty or too many activities)."""
+
 
 class TripAssistantService:
-    def __init__(self):
-        self.llama_agent = LLaMAService()
+    def __init__(self, llama_agent=None, calendar=None):
+        # Share the worker's LLaMAService when built through the service registry
+        self.llama_agent = llama_agent or LLaMAService()
         self.weather_api_url = "https://api.open-meteo.com/v1/forecast"
-        
-        # Determine current year and load correct holiday file
-        current_year = datetime.now().year
-        self.holidays_file = os.path.join(
-            os.path.dirname(__file__), 
-            f"srilanka_holidays/json/{current_year}.json"
-        )
-        self.holidays = self._load_holidays()
-
-    def _load_holidays(self):
-        """Load holiday data from the cloned srilanka-holidays repo."""
-        if not os.path.exists(self.holidays_file):
-            print(f"Warning: Holiday file not found at {self.holidays_file}. Using empty list.")
-            return []
-            
-        try:
-            with open(self.holidays_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading holiday data: {e}")
-            return []
+        # Multi-year, date-indexed holiday calendar shared with itinerary generation
+        self.calendar = calendar or holiday_calendar
+
+    def _weather_params(self, lat, lon):
+        return {
+            "latitude": lat,
+            "longitude": lon,
+            "current": "temperature_2m,precipitation,weather_code,wind_speed_10m",
+            "timezone": "auto"
+        }
+
+    def _current_weather(self, response):
+        response.raise_for_status()
+        return response.json().get("current", {})
+
+    def _fetch_weather(self, lat, lon):
+        return self._current_weather(http_client.get(OPEN_METEO, self.weather_api_url, params=self._weather_params(lat, lon)))
+
+    async def _afetch_weather(self, lat, lon):
+        return self._current_weather(await async_http_client.get(OPEN_METEO, self.weather_api_url, params=self._weather_params(lat, lon)))
 
     def get_live_weather(self, lat, lon):
         """
-        Fetch current weather from OpenMeteo (Free API).
+        Current weather from OpenMeteo (Free API), cached per ~5 km grid cell.
+        May be the last known reading marked "stale" while the API is failing.
         """
         if not lat or not lon:
             return None
-            
-        try:
-            params = {
-                "latitude": lat,
-                "longitude": lon,
-                "current": "temperature_2m,precipitation,weather_code,wind_speed_10m",
-                "timezone": "auto"
-            }
-            response = requests.get(self.weather_api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            return data.get("current", {})
-        except Exception as e:
-            print(f"Weather API Error: {e}")
+        return weather_cache.get(lat, lon, self._fetch_weather)
+
+    async def aget_live_weather(self, lat, lon):
+        if not lat or not lon:
             return None
+        return await weather_cache.aget(lat, lon, self._afetch_weather)
 
     def interpret_weather_code(self, code):
         """Simple mapping for WMO Weather Codes"""
@@ -64,17 +73,8 @@ class TripAssistantService:
         if code >= 95: return "Thunderstorm"
         return "Overcast"
         
-    def _check_if_holiday(self, date_str):
-        """Checks if a given 'YYYY-MM-DD' string is a holiday and returns its summary."""
-        for holiday in self.holidays:
-            if holiday.get("start") == date_str:
-                return holiday.get("summary")
-        return None
-
-    def get_advice(self, query, location_name, lat=None, lon=None, activity=None, description=None, theme=None):
-        """
-        Generate advice based on User Query + Real-time Context (Weather + Holidays) + Current Activity.
-        """
+    def _base_context(self, location_name, activity=None, description=None, theme=None):
+        """Location, time, activity and holiday context for the advice prompt."""
         current_time = datetime.now()
         date_str = current_time.strftime("%Y-%m-%d")
         day_of_week = current_time.strftime("%A")
@@ -90,24 +90,36 @@ class TripAssistantService:
              if theme: context_str += f"Overall Trip Theme: {theme}\n"
         
         # 2. Add Holiday Context
-        holiday_name = self._check_if_holiday(date_str)
-        if holiday_name:
+        today = self.calendar.day(current_time.date())
+        holiday_name = ", ".join(today["holidays"])
+        if today["is_poya"]:
+             context_str += f"Holiday Status: TODAY IS A POYA DAY ({holiday_name}). Expect very heavy crowds at temples. Alcohol sales are banned and many shops close.\n"
+        elif holiday_name:
              context_str += f"Holiday Status: TODAY IS A PUBLIC HOLIDAY ({holiday_name}). Expect heavy crowds at tourist spots and temples. Banks and mercantile sectors may be closed.\n"
         elif day_of_week in ["Saturday", "Sunday"]:
              context_str += "Holiday Status: Weekend. Expect moderate-to-high crowds at popular destinations.\n"
         else:
              context_str += "Holiday Status: Regular weekday. Crowds should be manageable.\n"
+        if today["reasons"]:
+             context_str += f"Crowd Level: {today['crowd_level'].replace('_', ' ')} ({'; '.join(today['reasons'])})\n"
+        return context_str
 
+    def _weather_context(self, weather):
         # 3. Add Weather Context
-        weather = self.get_live_weather(lat, lon)
         if weather:
             condition = self.interpret_weather_code(weather.get("weather_code"))
             temp = weather.get("temperature_2m", "N/A")
             precip = weather.get("precipitation", 0)
-            context_str += f"Current Weather: {temp}°C, {condition}. Precipitation: {precip}mm.\n"
-        else:
-            context_str += "Current Weather: Data temporarily unavailable.\n"
+            if weather.get("stale"):
+                observed = weather.get("time") or weather.get("observed_at", "")[:16]
+                return f"Last Known Weather (live data unavailable, observed {observed}): {temp}°C, {condition}. Precipitation: {precip}mm.\n"
+            return f"Current Weather: {temp}°C, {condition}. Precipitation: {precip}mm.\n"
+        return "Current Weather: Data temporarily unavailable.\n"
 
+    def _advice_payload(self, query, location_name, weather, activity, description, theme):
+        """LLM advice payload grounded in the location, activity, holiday and weather context."""
+        context_str = self._base_context(location_name, activity, description, theme)
+        context_str += self._weather_context(weather)
         print(f"--- RAG Context Provided ---\n{context_str}\n---------------------------")
 
         # 4. Prompt LLaMA with Context
@@ -125,24 +137,316 @@ CRITICAL: Keep your answer to 1-2 short, actionable sentences maximum. Do not li
 {context_str}
 -------------------------
 """
-        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ]
         payload = {
             "model": self.llama_agent.fallback_model, # Use the base model which follows formatting instructions better
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
+            "messages": messages,
             "stream": False,
             "options": {
-                "temperature": 0.3 # Keep it grounded in the context provided
+                "temperature": 0.3, # Keep it grounded in the context provided
+                **token_budget.plan("advice", messages)
             }
         }
-        
+        advice_rules.record("llm")
+        print(f"Sending RAG request to Ollama ({payload['model']})...")
+        return payload
+
+    def _advice_result(self, response):
+        response.raise_for_status()
+        body = response.json()
+        token_budget.record("advice", 1, body)
+        return {"advice": body.get("message", {}).get("content", "").strip(), "source": "llm"}
+
+    def _advice_failed(self, error):
+        return {"advice": f"I couldn't check the live status right now. Please try again later. ({str(error)})", "source": "llm"}
+
+    def _rule_advice(self, query, weather, activity, description, theme):
+        """Templated answer for predictable cases, or None to ask the LLM."""
+        today = self.calendar.day(datetime.now().date())
+        result = advice_rules.evaluate(query, weather, today, activity, description, theme)
+        if result is None:
+            return None
+        advice_rules.record("rules", result["rule"])
+        print(f"Answered from rule {result['rule']} (confidence {result['confidence']})")
+        return {"source": "rules", **result}
+
+    def get_advice(self, query, location_name, lat=None, lon=None, activity=None, description=None, theme=None):
+        """
+        Generate advice based on User Query + Real-time Context (Weather + Holidays) + Current Activity.
+        Returns {"advice", "source"}; source is "rules" when the rule engine answered without the LLM.
+        """
+        weather = self.get_live_weather(lat, lon)
+        ruled = self._rule_advice(query, weather, activity, description, theme)
+        if ruled:
+            return ruled
+
+        payload = self._advice_payload(query, location_name, weather, activity, description, theme)
+        try:
+            return self._advice_result(self.llama_agent._ollama_chat("chat", payload))
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            return self._advice_failed(e)
+
+    async def aget_advice(self, query, location_name, lat=None, lon=None, activity=None, description=None, theme=None):
+        """get_advice for the ASGI path; the weather and LLM calls are awaited rather than blocking."""
+        weather = await self.aget_live_weather(lat, lon)
+        ruled = self._rule_advice(query, weather, activity, description, theme)
+        if ruled:
+            return ruled
+
+        payload = self._advice_payload(query, location_name, weather, activity, description, theme)
+        try:
+            return self._advice_result(await self.llama_agent._aollama_chat("chat", payload))
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            return self._advice_failed(e)
+
+    # --- Whole-itinerary review: one forecast request and one LLM call per trip ---
+
+    def _activity_hour(self, time_label):
+        """Hour of day for "Morning", "2:30 PM" or "14:00"; midday when unknown."""
+        text = str(time_label or "").lower()
+        match = re.search(r"(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m", text) or re.search(r"\b(\d{1,2}):(\d{2})\b", text)
+        if match:
+            hour = int(match.group(1)) % 24
+            if match.lastindex == 3 and match.group(3):
+                hour = hour % 12 + (12 if match.group(3) == "p" else 0)
+            return hour
+        for label, hour in SLOT_HOURS.items():
+            if label in text:
+                return hour
+        return 12
+
+    def _plan_batch(self, itinerary, start_date):
+        """Flatten the itinerary into days with dates, coordinates and activity ids."""
+        days = itinerary.get("days") or []
+        plan, count = [], 0
+        for index, day in enumerate(days):
+            if not isinstance(day, dict):
+                continue
+            number = day.get("day") if isinstance(day.get("day"), int) and day.get("day") > 0 else index + 1
+            coords = (day["lat"], day["lon"]) if day.get("lat") and day.get("lon") else locations.resolve(day.get("location"))
+            activities = [a for a in day.get("activities") or [] if isinstance(a, dict)]
+            count += len(activities)
+            plan.append({
+                "day": number,
+                "date": start_date + timedelta(days=number - 1),
+                "location": day.get("location") or "Sri Lanka",
+                "coords": coords,
+                "activities": [
+                    {"id": f"{number}.{i + 1}", "hour": self._activity_hour(a.get("time")), **a}
+                    for i, a in enumerate(activities)
+                ],
+            })
+        if count == 0:
+            raise BatchAdviceError("The itinerary has no activities to review.")
+        if count > BATCH_MAX_ACTIVITIES:
+            raise BatchAdviceError(f"At most {BATCH_MAX_ACTIVITIES} activities can be reviewed at once.")
+        return plan
+
+    def _forecast_request(self, plan):
+        """Open-Meteo params covering every forecastable day, or None; tags each such day with its "cell" column."""
+        today = date.today()
+        horizon = today + timedelta(days=FORECAST_HORIZON_DAYS - 1)
+        in_range = [d for d in plan if d["coords"] and today <= d["date"] <= horizon]
+        if not in_range:
+            return None
+        # One column per distinct grid cell; Open-Meteo answers comma-separated coordinates in one call
+        cells, index = [], {}
+        for d in in_range:
+            cell = grid_cell(*d["coords"])
+            if cell[0] not in index:
+                index[cell[0]] = len(cells)
+                cells.append(cell)
+            d["cell"] = index[cell[0]]
+        params = {
+            "latitude": ",".join(str(c[1]) for c in cells),
+            "longitude": ",".join(str(c[2]) for c in cells),
+            "hourly": "temperature_2m,precipitation_probability,precipitation,weather_code,wind_speed_10m",
+            "start_date": min(d["date"] for d in in_range).isoformat(),
+            "end_date": max(d["date"] for d in in_range).isoformat(),
+            "timezone": "Asia/Colombo",
+        }
+        return params
+
+    def _index_forecasts(self, data):
+        # A single location comes back as an object, several as a list in request order
+        results = data if isinstance(data, list) else [data]
+        indexed = []
+        for result in results:
+            hourly = (result or {}).get("hourly") or {}
+            times = hourly.get("time") or []
+            indexed.append({t: {k: v[i] for k, v in hourly.items() if k != "time" and i < len(v)} for i, t in enumerate(times)})
+        return indexed
+
+    def _fetch_forecasts(self, plan):
+        params = self._forecast_request(plan)
+        if params is None or not weather_cache.breaker.allow():
+            return []
+        try:
+            return self._forecast_result(http_client.get(OPEN_METEO, self.weather_api_url, params=params))
+        except Exception as e:
+            return self._forecast_failed(e)
+
+    async def _afetch_forecasts(self, plan):
+        params = self._forecast_request(plan)
+        if params is None or not weather_cache.breaker.allow():
+            return []
+        try:
+            return self._forecast_result(await async_http_client.get(OPEN_METEO, self.weather_api_url, params=params))
+        except Exception as e:
+            return self._forecast_failed(e)
+
+    def _forecast_result(self, response):
+        response.raise_for_status()
+        forecasts = self._index_forecasts(response.json())
+        weather_cache.breaker.record_success()
+        return forecasts
+
+    def _forecast_failed(self, error):
+        weather_cache.breaker.record_failure()
+        print(f"Weather Forecast API Error: {error}")
+        return []
+
+    def _attach_context(self, plan, forecasts):
+        """Add the forecast for each activity's hour and the crowd outlook for each day."""
+        for d in plan:
+            d["calendar"] = self.calendar.day(d["date"])
+            hours = forecasts[d["cell"]] if "cell" in d and d["cell"] < len(forecasts) else {}
+            for a in d["activities"]:
+                reading = hours.get(f"{d['date'].isoformat()}T{a['hour']:02d}:00")
+                a["forecast"] = {
+                    "temperature": reading.get("temperature_2m"),
+                    "condition": self.interpret_weather_code(reading.get("weather_code")),
+                    "weather_code": reading.get("weather_code"),
+                    "precipitation_probability": reading.get("precipitation_probability"),
+                    "precipitation": reading.get("precipitation"),
+                    "wind_speed": reading.get("wind_speed_10m"),
+                } if reading else None
+
+    def _batch_payload(self, plan, theme):
+        lines = []
+        for d in plan:
+            cal = d["calendar"]
+            crowd = cal["crowd_level"].replace("_", " ")
+            if cal["reasons"]:
+                crowd += f" ({'; '.join(cal['reasons'])})"
+            lines.append(f"Day {d['day']} - {d['date'].isoformat()} ({cal['weekday']}) in {d['location']}. Crowds: {crowd}.")
+            for a in d["activities"]:
+                f = a["forecast"]
+                weather = (
+                    f"{f['temperature']}°C, {f['condition']}, {f['precipitation_probability']}% chance of rain, wind {f['wind_speed']} km/h"
+                    if f else "no forecast available"
+                )
+                details = str(a.get("description") or "")[:200]
+                lines.append(f"  [{a['id']}] {a.get('time', '')} (~{a['hour']:02d}:00): {a.get('activity', 'Activity')}. {details} Forecast: {weather}.")
+        context_str = "\n".join(lines)
+        print(f"--- Batch Advice Context ---\n{context_str}\n---------------------------")
+
+        system_prompt = f"""You are a Travel Assistant for Sri Lanka reviewing a whole itinerary before the trip.
+For EVERY activity id below, give 1-2 short, actionable sentences based ONLY on its forecast and the day's crowd outlook.
+1. If the forecast is BAD for the activity (rain on a beach day, thunderstorms on a hike), say so and suggest an indoor/safe ALTERNATIVE that fits the trip theme ({theme or "general sightseeing"}).
+2. If the forecast is GOOD, confirm the plan.
+3. Warn when holidays, Poya days or weekends will make the activity crowded.
+If no forecast is available, give crowd and timing advice only.
+
+Respond with JSON only, in the form {{"advice": {{"1.1": "...", "1.2": "..."}}}} with one entry per activity id.
+
+--- ITINERARY ---
+{context_str}
+-----------------
+"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "Review every activity in my itinerary."}
+        ]
+        payload = {
+            "model": self.llama_agent.fallback_model,
+            "messages": messages,
+            "stream": False,
+            "format": "json",
+            "options": {
+                "temperature": 0.3,
+                **token_budget.plan("batch_advice", messages, sum(len(d["activities"]) for d in plan))
+            }
+        }
+        print(f"Sending BATCH advice request to Ollama ({payload['model']})...")
+        return payload
+
+    def _batch_result(self, plan, response):
+        advice = {}
+        if response is not None:
+            try:
+                response.raise_for_status()
+                body = response.json()
+                token_budget.record("batch_advice", sum(len(d["activities"]) for d in plan), body)
+                content = body.get("message", {}).get("content", "").replace("```json", "").replace("```", "").strip()
+                advice = json.loads(content).get("advice") or {}
+            except Exception as e:
+                print(f"Batch Advice Parse Error: {e}")
+        if not isinstance(advice, dict):
+            advice = {}
+
+        days, missing = [], 0
+        for d in plan:
+            activities = []
+            for a in d["activities"]:
+                text = advice.get(a["id"])
+                if not isinstance(text, str) or not text.strip():
+                    missing += 1
+                    text = None
+                activities.append({
+                    "id": a["id"],
+                    "time": a.get("time"),
+                    "activity": a.get("activity"),
+                    "forecast": a["forecast"],
+                    "advice": text.strip() if text else None,
+                })
+            days.append({
+                "day": d["day"],
+                "date": d["date"].isoformat(),
+                "location": d["location"],
+                "crowd_level": d["calendar"]["crowd_level"],
+                "holidays": d["calendar"]["holidays"],
+                "activities": activities,
+            })
+        return {"days": days, "advice_missing": missing}
+
+    def get_batch_advice(self, itinerary, start_date=None):
+        """
+        Advice for every activity of an itinerary from one hourly forecast request
+        (all day locations at once) and one LLM call. Raises BatchAdviceError for
+        itineraries that cannot be reviewed.
+        """
+        plan = self._plan_batch(itinerary, start_date or date.today())
+        self._attach_context(plan, self._fetch_forecasts(plan))
+        payload = self._batch_payload(plan, itinerary.get("trip_theme"))
+
+        response = None
+        try:
+            response = self.llama_agent._ollama_chat("generation", payload)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            print(f"Batch Advice Error: {e}")
+        return self._batch_result(plan, response)
+
+    async def aget_batch_advice(self, itinerary, start_date=None):
+        """get_batch_advice for the ASGI path."""
+        plan = self._plan_batch(itinerary, start_date or date.today())
+        self._attach_context(plan, await self._afetch_forecasts(plan))
+        payload = self._batch_payload(plan, itinerary.get("trip_theme"))
+
+        response = None
         try:
-            print(f"Sending RAG request to Ollama ({payload['model']})...")
-            response = requests.post(self.llama_agent.ollama_url, json=payload)
-            response.raise_for_status()
-            content = response.json().get("message", {}).get("content", "")
-            return content.strip()
+            response = await self.llama_agent._aollama_chat("generation", payload)
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            return f"I couldn't check the live status right now. Please try again later. ({str(e)})"
+            print(f"Batch Advice Error: {e}")
+        return self._batch_result(plan, response)
@@ -0,0 +1,216 @@
+import os
+import time
+import threading
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from cachetools import LRUCache
+from django.utils import timezone
+from travel_api.models import WeatherSnapshot
+from .single_flight import SingleFlight, AsyncSingleFlight
+
+# Cell size for snapping coordinates; 0.05° is roughly 5.5 km in Sri Lanka
+GRID_DEGREES = float(os.environ.get("WEATHER_GRID_DEGREES", "0.05"))
+# Open-Meteo refreshes `current` every 15 minutes
+TTL_SECONDS = float(os.environ.get("WEATHER_CACHE_TTL_SECONDS", "900"))
+# Never serve a reading older than this, even while the API is down
+STALE_MAX_SECONDS = float(os.environ.get("WEATHER_STALE_MAX_SECONDS", "21600"))
+BREAKER_FAILURES = int(os.environ.get("WEATHER_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("WEATHER_BREAKER_COOLDOWN_SECONDS", "60"))
+
+
+def grid_cell(lat, lon, grid=GRID_DEGREES):
+    """Snap coordinates to the grid. Returns (key, lat, lon) or None for unusable input."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    lat = round(round(lat / grid) * grid, 4)
+    lon = round(round(lon / grid) * grid, 4)
+    return f"{lat:.4f},{lon:.4f}", lat, lon
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failures` consecutive errors; after `cooldown` seconds one
+    probe request is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class WeatherCache:
+    """
+    Grid-keyed cache for live weather.
+
+    Readings are stored per grid cell in memory and in the WeatherSnapshot table,
+    so users near the same town share one Open-Meteo call per TTL across all
+    workers. While the circuit breaker is open (or a fetch fails) the last known
+    reading is served with "stale": True instead of calling the API again.
+    """
+
+    def __init__(self, ttl_seconds=TTL_SECONDS, max_entries=2000):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.stale_max = timedelta(seconds=STALE_MAX_SECONDS)
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._memory = LRUCache(maxsize=max_entries)
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self._counts = {"hit": 0, "miss": 0, "stale": 0, "unavailable": 0}
+
+    def _incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _load(self, key):
+        """(payload, fetched_at) from memory, falling back to the shared table."""
+        with self._lock:
+            entry = self._memory.get(key)
+        if self._is_fresh(entry):
+            return entry
+        # Another worker may have refreshed the cell since we last saw it
+        try:
+            row = WeatherSnapshot.objects.filter(grid_key=key).values_list('payload', 'fetched_at').first()
+        except Exception as e:
+            print(f"Weather Cache Read Error: {e}")
+            row = None
+        if row and (entry is None or row[1] > entry[1]):
+            entry = row
+            with self._lock:
+                self._memory[key] = row
+        return entry
+
+    def _store(self, key, lat, lon, payload):
+        fetched_at = timezone.now()
+        with self._lock:
+            self._memory[key] = (payload, fetched_at)
+        try:
+            WeatherSnapshot.objects.update_or_create(
+                grid_key=key,
+                defaults={"latitude": lat, "longitude": lon, "payload": payload, "fetched_at": fetched_at}
+            )
+        except Exception as e:
+            print(f"Weather Cache Write Error: {e}")
+
+    def _is_fresh(self, entry):
+        return entry is not None and timezone.now() - entry[1] < self.ttl
+
+    def _fallback(self, entry):
+        if entry is None or timezone.now() - entry[1] > self.stale_max:
+            self._incr("unavailable")
+            return None
+        self._incr("stale")
+        return {**entry[0], "stale": True, "observed_at": entry[1].isoformat()}
+
+    def get(self, lat, lon, fetch):
+        """Current weather near (lat, lon); `fetch(lat, lon)` is called with the cell centre on a miss."""
+        cell = grid_cell(lat, lon)
+        if cell is None:
+            return None
+        key, cell_lat, cell_lon = cell
+
+        entry = self._load(key)
+        if self._is_fresh(entry):
+            self._incr("hit")
+            return entry[0]
+        if not self.breaker.allow():
+            return self._fallback(entry)
+
+        self._incr("miss")
+
+        # Only the caller that actually hits the API updates the breaker and the cache
+        def lead():
+            try:
+                payload = fetch(cell_lat, cell_lon)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            self._store(key, cell_lat, cell_lon, payload)
+            return payload
+
+        try:
+            payload, _ = self._flights.do(key, lead)
+        except Exception as e:
+            print(f"Weather API Error: {e}")
+            return self._fallback(entry)
+        return payload
+
+    async def aget(self, lat, lon, afetch):
+        """get() for the ASGI path; `afetch` is a coroutine function."""
+        cell = grid_cell(lat, lon)
+        if cell is None:
+            return None
+        key, cell_lat, cell_lon = cell
+
+        entry = await sync_to_async(self._load)(key)
+        if self._is_fresh(entry):
+            self._incr("hit")
+            return entry[0]
+        if not self.breaker.allow():
+            return self._fallback(entry)
+
+        self._incr("miss")
+
+        async def lead():
+            try:
+                payload = await afetch(cell_lat, cell_lon)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            await sync_to_async(self._store)(key, cell_lat, cell_lon, payload)
+            return payload
+
+        try:
+            payload, _ = await self._async_flights.do(key, lead)
+        except Exception as e:
+            print(f"Weather API Error: {e}")
+            return self._fallback(entry)
+        return payload
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hit"] + counts["miss"]
+        counts["hit_rate"] = round(counts["hit"] / lookups, 4) if lookups else None
+        counts["breaker"] = self.breaker.state
+        return counts
+
+
+weather_cache = WeatherCache()
@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import io
+import os
+import json
+import math
+import time
+import asyncio
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from .models import SavedTrip, TripListVersion, ItineraryJob, ItineraryCache
+from .views import ItineraryStreamView, ItineraryJobView
+from .pagination import encode_cursor, decode_cursor, PaginationError
+from .services import job_queue
+from .services.embedding_cache import EmbeddingCache
+from .services.itinerary_codec import compress_itinerary, decompress_itinerary, itinerary_fields, CURRENT_VERSION
+from .services.cache_eviction import CacheEvictor
+from .management.commands.run_itinerary_worker import Command as ItineraryWorkerCommand
+from .services.single_flight import SingleFlight, AsyncSingleFlight, normalise_key
+from .services.ollama_scheduler import OllamaScheduler, AdmissionRejected, ollama_caller
+from .services.json_stream import IncrementalItineraryParser
+from .services.itinerary_repair import salvage, index_days
+from .services.http_client import http_client, async_http_client
+from .services.advice_rules import AdviceRuleEngine
+from .services.weather_cache import weather_cache, WeatherCache, CircuitBreaker, grid_cell
+from .services.trip_assistant import BATCH_MAX_ACTIVITIES
+from .services.token_budget import TokenBudget, HEADROOM, MESSAGE_OVERHEAD
+from .services.llama_service import LLaMAService, MAX_TRIP_DAYS, PROMPT_VERSION
+from .services.itinerary_store import ItineraryStore
+from .services.holiday_calendar import HolidayCalendar, holiday_calendar
+from .services.chunked_itinerary import ChunkedItineraryGenerator
+from .services.locations import town
+from .services.destinations_index import city_key, location_key
+from .services.intent_router import IntentRouter, ITINERARY, CHAT, ADVICE
+from .services.registry import ServiceRegistry, registry, get_trip_assistant
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_run(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        runs, results = [], []
+
+        def work():
+            runs.append(1)
+            started.set()
+            release.wait(5)
+            return "itinerary"
+
+        leader = threading.Thread(target=lambda: results.append(flights.do("k", work)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flights.do("k", work))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.1)  # let the followers reach the in-flight call
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(sorted(results), [("itinerary", False)] + [("itinerary", True)] * 3)
+
+    def test_error_reaches_every_waiter_and_key_is_released(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError("ollama down")
+
+        def call():
+            try:
+                flights.do("k", fail)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(errors, ["ollama down", "ollama down"])
+        self.assertEqual(flights.do("k", lambda: "fresh"), ("fresh", False))
+
+    def test_normalise_key_ignores_case_and_whitespace(self):
+        self.assertEqual(normalise_key("  5 Days in\tKANDY "), normalise_key("5 days in kandy"))
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    async def test_concurrent_awaiters_share_one_run(self):
+        flights = AsyncSingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "itinerary"
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(3)))
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(results, [("itinerary", False), ("itinerary", True), ("itinerary", True)])
+
+    async def test_leader_disconnect_does_not_cancel_followers(self):
+        flights = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "itinerary"
+
+        leader = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, ("itinerary", True))
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+    async def test_work_is_cancelled_when_every_awaiter_leaves(self):
+        flights = AsyncSingleFlight()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flights.do("k", work)) for _ in range(2)]
+        await started.wait()
+        (call,) = flights._calls.values()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.wait([call.task], timeout=5)
+
+        self.assertTrue(cancelled.is_set())
+        self.assertTrue(call.task.cancelled())
+        self.assertEqual(flights._calls, {})
+        self.assertEqual(await flights.do("k", self._fresh), ("fresh", False))
+
+    async def test_error_is_shared(self):
+        flights = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("ollama down")
+
+        results = await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+        self.assertEqual([str(r) for r in results], ["ollama down", "ollama down"])
+
+    @staticmethod
+    async def _fresh():
+        return "fresh"
+
+
+class OllamaSchedulerTests(SimpleTestCase):
+    @staticmethod
+    async def _hold(scheduler, kind, user, order, release):
+        with ollama_caller(user):
+            async with scheduler.aslot(kind):
+                order.append(user)
+                await release.wait()
+
+    async def test_chat_is_served_before_queued_generation(self):
+        scheduler = OllamaScheduler(max_concurrent=1, per_user_limit=5)
+        # Short enough that the chat is admitted behind a running generation
+        scheduler.service_seconds = dict.fromkeys(scheduler.service_seconds, 1.0)
+        gate, open_ = asyncio.Event(), asyncio.Event()
+        open_.set()
+        order = []
+        first = asyncio.ensure_future(self._hold(scheduler, "generation", "a", order, gate))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(self._hold(scheduler, "generation", "b", order, open_))]
+        await asyncio.sleep(0)
+        queued.append(asyncio.ensure_future(self._hold(scheduler, "chat", "c", order, open_)))
+        await asyncio.sleep(0)
+
+        gate.set()
+        await asyncio.gather(first, *queued)
+        self.assertEqual(order, ["a", "c", "b"])
+
+    async def test_user_with_fewest_running_calls_goes_first(self):
+        scheduler = OllamaScheduler(max_concurrent=2, per_user_limit=5)
+        gate_a, gate_b, open_ = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        open_.set()
+        order = []
+        holders = [
+            asyncio.ensure_future(self._hold(scheduler, "generation", "a", order, gate_a)),
+            asyncio.ensure_future(self._hold(scheduler, "generation", "b", order, gate_b)),
+        ]
+        await asyncio.sleep(0)
+        # "a" queues first, but already has a call running
+        queued = [asyncio.ensure_future(self._hold(scheduler, "generation", "a", order, open_))]
+        await asyncio.sleep(0)
+        queued.append(asyncio.ensure_future(self._hold(scheduler, "generation", "c", order, open_)))
+        await asyncio.sleep(0)
+
+        gate_b.set()
+        await asyncio.gather(holders[1], *queued)
+        gate_a.set()
+        await holders[0]
+        self.assertEqual(order, ["a", "b", "c", "a"])
+
+    def test_per_user_limit_counts_requests_not_calls(self):
+        scheduler = OllamaScheduler(max_concurrent=2, per_user_limit=1)
+        with ollama_caller("a"):
+            with scheduler.slot("generation"):
+                # A chunked generation's batches belong to the same request
+                with scheduler.slot("generation"):
+                    pass
+                with ollama_caller("a"):
+                    with self.assertRaises(AdmissionRejected) as raised:
+                        with scheduler.slot("generation"):
+                            pass
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(scheduler.snapshot()["rejected"], {429: 1, 503: 0})
+
+    def test_call_that_would_miss_its_deadline_is_refused(self):
+        scheduler = OllamaScheduler(max_concurrent=1)
+        with ollama_caller("a"):
+            with scheduler.slot("generation"):
+                with ollama_caller("b"):
+                    with self.assertRaises(AdmissionRejected) as raised:
+                        with scheduler.slot("chat"):
+                            pass
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertGreater(raised.exception.retry_after, 1)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = OllamaScheduler(max_concurrent=1, per_user_limit=5)
+        gate, open_ = asyncio.Event(), asyncio.Event()
+        order = []
+        holder = asyncio.ensure_future(self._hold(scheduler, "generation", "a", order, gate))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(self._hold(scheduler, "generation", "b", order, open_))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.snapshot()["waiting"]["generation"], 1)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(scheduler.snapshot()["waiting"]["generation"], 0)
+        gate.set()
+        await holder
+        self.assertEqual(order, ["a"])
+        self.assertEqual(scheduler.snapshot()["running"]["generation"], 0)
+
+
+def _day(number, location):
+    return {
+        "day": number, "location": location, "theme": "Culture",
+        "activities": [{"time": "Morning", "activity": f"Visit {location}", "description": "A {walk}, \"guided\"."}],
+        "suggested_restaurants": ["Ministry of Crab"], "narrative": "A full day.",
+    }
+
+
+class _OllamaReply:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"message": {"content": self.content}, "eval_count": 400, "done_reason": "stop"}
+
+
+class IncrementalItineraryParserTests(SimpleTestCase):
+    def test_emits_meta_and_each_day_as_it_closes(self):
+        document = "```json\n" + json.dumps({"title": "Hill Country {Loop}", "summary": "Tea and trains", "days": [_day(1, "Kandy"), _day(2, "Ella")]})
+        parser = IncrementalItineraryParser()
+        events = []
+        for start in range(0, len(document), 7):
+            events.extend(parser.feed(document[start:start + 7]))
+
+        self.assertEqual(events[0], ("meta", {"title": "Hill Country {Loop}"}))
+        self.assertEqual(events[1], ("meta", {"summary": "Tea and trains"}))
+        self.assertEqual([data["location"] for event, data in events if event == "day"], ["Kandy", "Ella"])
+        self.assertEqual(parser.days_emitted, 2)
+
+    def test_open_day_is_not_emitted(self):
+        document = json.dumps({"title": "T", "days": [_day(1, "Kandy"), _day(2, "Ella")]})
+        parser = IncrementalItineraryParser()
+        events = parser.feed(document[:document.index('"Ella"')])
+        self.assertEqual([data["day"] for event, data in events if event == "day"], [1])
+
+
+class ItineraryRepairTests(SimpleTestCase):
+    def setUp(self):
+        self.llama = LLaMAService()
+        self.prefs = {"duration": "4", "trip_type": "Culture", "query_text": "4 days of temples", "start_loc": "Kandy", "calendar": []}
+
+    def test_salvage_keeps_days_closed_before_truncation(self):
+        document = json.dumps({"title": "T", "days": [_day(1, "Kandy"), _day(2, "Ella")]})
+        data, salvaged = salvage(document[:document.index('"Ella"')])
+        self.assertTrue(salvaged)
+        self.assertEqual(data["title"], "T")
+        self.assertEqual([day["day"] for day in data["days"]], [1])
+        self.assertEqual(salvage(document), (json.loads(document), False))
+
+    def test_index_days_drops_invalid_days_and_renumbers_by_position(self):
+        days = [_day(1, "Kandy"), {"day": 2, "location": "Ella", "activities": []}, _day("three", "Galle")]
+        self.assertEqual(sorted(index_days(days, 4)), [1, 3])
+
+    def test_continuation_requests_only_the_missing_days(self):
+        first = json.dumps({"title": "Temples", "days": [_day(1, "Kandy"), _day(2, "Dambulla"), _day(3, "Sigiriya")]})
+        truncated = first[:first.index('"Sigiriya"')]
+        prompts = []
+
+        def reply(upstream, url, **kwargs):
+            prompts.append(kwargs["json"]["messages"][-1]["content"])
+            return _OllamaReply(json.dumps({"days": [_day(3, "Sigiriya"), _day(4, "Polonnaruwa")]}))
+
+        with mock.patch.object(http_client, "post", side_effect=reply):
+            itinerary = self.llama._repair_itinerary(self.prefs, truncated)
+
+        self.assertEqual(len(prompts), 1)
+        self.assertIn("Write ONLY day(s) 3, 4", prompts[0])
+        self.assertEqual([day["location"] for day in itinerary["days"]], ["Kandy", "Dambulla", "Sigiriya", "Polonnaruwa"])
+        self.assertTrue(self.llama._is_complete(itinerary, self.prefs))
+
+    def test_failed_continuation_returns_the_partial_itinerary(self):
+        content = json.dumps({"title": "Temples", "days": [_day(1, "Kandy")]})
+        with mock.patch.object(http_client, "post", side_effect=ConnectionError("ollama down")):
+            itinerary = self.llama._repair_itinerary(self.prefs, content)
+        self.assertEqual([day["day"] for day in itinerary["days"]], [1])
+        self.assertFalse(self.llama._is_complete(itinerary, self.prefs))
+
+    def test_output_without_any_valid_day_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.llama._repair_itinerary(self.prefs, '{"title": "T", "days": [{"day": 1')
+
+
+class ChunkedContinuationTests(SimpleTestCase):
+    def setUp(self):
+        self.llama = LLaMAService()
+        self.prefs = {"duration": "6", "trip_type": "Culture", "query_text": "6 days", "start_loc": "Sri Lanka", "calendar": []}
+        self.route = {"title": "Loop", "summary": "S", "route": [{"day": n, "location": f"Town{n}", "theme": "Culture"} for n in range(1, 7)]}
+        self.prompts = []
+        patcher = mock.patch.object(self.llama, "_grounding_rule", return_value="")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _reply(self, continuation):
+        def reply(upstream, url, **kwargs):
+            prompt = kwargs["json"]["messages"][-1]["content"]
+            self.prompts.append(prompt)
+            if "Plan the day-by-day route" in prompt:
+                return _OllamaReply(json.dumps(self.route))
+            if "Write ONLY these days" in prompt:
+                first = int(prompt.split("- Day ")[1].split(":")[0])
+                batch = json.dumps({"days": [_day(n, f"Town{n}") for n in range(first, first + 3)]})
+                # The second batch is cut off after its first day
+                return _OllamaReply(batch if first == 1 else batch[:batch.index('"Town5"')])
+            return continuation(prompt)
+        return reply
+
+    def test_truncated_batch_is_continued_at_its_planned_stops(self):
+        reply = self._reply(lambda prompt: _OllamaReply(json.dumps({"days": [_day(5, "Town5"), _day(6, "Town6")]})))
+        with mock.patch.object(http_client, "post", side_effect=reply):
+            itinerary = ChunkedItineraryGenerator(self.llama, chunk_days=3, concurrency=1).generate(self.prefs)
+
+        self.assertIn("planned stop: Day 5: Town5 (Culture); Day 6: Town6 (Culture)", self.prompts[-1])
+        self.assertEqual([day["location"] for day in itinerary["days"]], [f"Town{n}" for n in range(1, 7)])
+        self.assertTrue(self.llama._is_complete(itinerary, self.prefs))
+
+    def test_placeholders_only_after_continuation_fails(self):
+        def fail(prompt):
+            raise ConnectionError("ollama down")
+
+        with mock.patch.object(http_client, "post", side_effect=self._reply(fail)):
+            itinerary = ChunkedItineraryGenerator(self.llama, chunk_days=3, concurrency=1).generate(self.prefs)
+
+        self.assertEqual(len(itinerary["days"]), 6)
+        self.assertEqual([bool(day["activities"]) for day in itinerary["days"]], [True] * 4 + [False] * 2)
+        self.assertFalse(self.llama._is_complete(itinerary, self.prefs))
+
+
+
+
+class ChunkedAssemblyTests(SimpleTestCase):
+    def setUp(self):
+        self.generator = ChunkedItineraryGenerator(mock.Mock(), chunk_days=2, concurrency=1)
+        self.prefs = {"start_loc": "Colombo", "trip_type": "Culture"}
+
+    def _route(self, skeleton, total_days, **prefs):
+        return self.generator._normalise_route(skeleton, {**self.prefs, **prefs}, total_days)
+
+    def test_route_is_truncated_and_starts_at_the_requested_town(self):
+        skeleton = {"title": "Loop", "summary": "S", "route": [{"day": 7, "location": f"Town{n}", "theme": "T"} for n in range(5)]}
+        route = self._route(skeleton, 3)["route"]
+        self.assertEqual([(stop["day"], stop["location"]) for stop in route], [(1, "Colombo"), (2, "Town1"), (3, "Town2")])
+
+    def test_short_route_is_padded_from_its_last_stop(self):
+        result = self._route({"route": [{"location": "Kandy"}, "Ella"]}, 3, start_loc="Sri Lanka")
+        self.assertEqual(result["route"], [{"day": n, "location": "Kandy", "theme": "Culture"} for n in (1, 2, 3)])
+        self.assertEqual((result["title"], result["summary"]), ("3-Day Sri Lanka Culture Trip", ""))
+        self.assertEqual([stop["location"] for stop in self._route({}, 2)["route"]], ["Colombo", "Colombo"])
+
+    def test_batch_days_are_renumbered_onto_the_route(self):
+        batch = [{"day": 4, "location": "Ella", "theme": "T"}, {"day": 5, "location": "Yala", "theme": "T"}, {"day": 6, "location": "Galle", "theme": "T"}]
+        invalid = {**_day(3, "Yala"), "activities": []}
+        generated = {}
+        self.generator._collect(generated, batch, [_day(1, "Ella"), "junk", invalid, _day(3, "Galle")])
+
+        # Non-dicts are dropped before matching; a day failing the schema leaves its slot empty
+        self.assertEqual(sorted(generated), [4, 6])
+        self.assertEqual((generated[4]["day"], generated[6]["day"]), (4, 6))
+
+    def test_batch_errors_are_dropped_but_admission_rejections_propagate(self):
+        batch = [{"day": 1, "location": "Kandy", "theme": "T"}]
+        generated = {}
+        self.generator._collect(generated, batch, [], error=ConnectionError("ollama down"))
+        self.assertEqual(generated, {})
+        with self.assertRaises(AdmissionRejected):
+            self.generator._collect(generated, batch, [], error=AdmissionRejected("busy", 503, 5))
+
+    def test_merge_fills_missing_days_with_placeholders(self):
+        skeleton = self._route({"title": "Loop", "summary": "S", "route": [{"location": loc, "theme": "T"} for loc in ("Colombo", "Kandy", "Ella")]}, 3)
+        merged = self.generator._merge({**self.prefs}, skeleton, {2: {**_day(9, "Somewhere"), "theme": "Temples"}}, 3)
+
+        self.assertEqual([(day["day"], day["location"]) for day in merged["days"]], [(1, "Colombo"), (2, "Kandy"), (3, "Ella")])
+        self.assertEqual(merged["days"][1]["theme"], "Temples")
+        self.assertEqual((merged["days"][0]["activities"], merged["days"][2]["theme"]), ([], "T"))
+        self.assertEqual((merged["title"], merged["trip_theme"], merged["total_days"]), ("Loop", "Culture", 3))
+        with self.assertRaises(RuntimeError):
+            self.generator._merge(self.prefs, skeleton, {}, 3)
+
+class TripCalendarTests(SimpleTestCase):
+    def setUp(self):
+        self.llama = LLaMAService()
+
+    def _prefs(self, start_date, duration="5"):
+        return self.llama._parse_preferences({"duration": duration, "startLocation": "Colombo", "startDate": start_date})
+
+    def test_flight_key_covers_the_trip_calendar(self):
+        info = {"date": "2026-12-25", "weekday": "Friday", "crowd_level": "very_high", "reasons": ["Christmas Day"]}
+
+        def busy_days(start, days):
+            return [(2, info)] if start.startswith("2026-12") else []
+
+        with mock.patch.object(holiday_calendar, "busy_days", side_effect=busy_days):
+            festive, quiet, other_quiet = self._prefs("2026-12-24"), self._prefs("2026-06-08"), self._prefs("2026-06-15")
+
+        self.assertNotEqual(self.llama._flight_key(festive, None), self.llama._flight_key(quiet, None))
+        # Quiet weeks plan the same trip, so they still coalesce
+        self.assertEqual(self.llama._flight_key(quiet, None), self.llama._flight_key(other_quiet, None))
+        self.assertNotEqual(self.llama._flight_key(quiet, None), self.llama._flight_key(quiet, "chunked"))
+
+    def test_oversized_durations_are_clamped(self):
+        self.assertEqual(self.llama._clamp_duration("1" * 40), str(MAX_TRIP_DAYS))
+        self.assertEqual(self.llama._clamp_duration("0"), "1")
+        self.assertEqual(self.llama._clamp_duration("a week"), "a week")
+        self.assertIsInstance(self._prefs("2026-06-08", duration=10 ** 30)["calendar"], list)
+
+    def test_calendar_past_the_last_date_is_dropped(self):
+        self.assertEqual(self.llama._calendar_notes("9999-12-30", "30"), [])
+        self.assertEqual(self.llama._calendar_notes("not a date", "5"), [])
+
+    def test_calendar_reloads_when_the_year_rolls_over(self):
+        with tempfile.TemporaryDirectory() as holidays_dir:
+            def add_year(year):
+                with open(os.path.join(holidays_dir, f"{year}.json"), "w") as f:
+                    json.dump([{"summary": "Vesak Full Moon Poya Day", "start": f"{year}-05-01"}], f)
+
+            add_year(2026)
+            calendar = HolidayCalendar(holidays_dir)
+            self.assertTrue(calendar.covers("2026-05-01"))
+            add_year(2027)
+            self.assertFalse(calendar.covers("2027-05-01"))
+            # A worker that was up over New Year
+            calendar._loaded_year -= 1
+            self.assertTrue(calendar.covers("2027-05-01"))
+            self.assertEqual(calendar.holiday_name("2027-05-01"), "Vesak Full Moon Poya Day")
+
+
+class LocationKeyTests(SimpleTestCase):
+    def test_streets_named_after_towns_stay_in_their_city(self):
+        self.assertEqual(city_key("Galle Road, Colombo 03"), "colombo")
+        self.assertEqual(city_key("Galle Face Court 02, Colombo"), "colombo")
+        self.assertEqual(city_key("Kandy Road", "No 12, Kandy Road, Kelaniya"), "kelaniya")
+
+    def test_aliases_match_whole_words_only(self):
+        self.assertEqual(town("Mt Lavinia beach"), "mount lavinia")
+        self.assertEqual(town("Negambo lagoon"), "negombo")
+        self.assertIsNone(town("Colombage"))
+
+    def test_unknown_cities_keep_their_own_key(self):
+        self.assertEqual(city_key("Ruwanwella."), "ruwanwella")
+        self.assertEqual(city_key("", None), "unknown")
+
+    def test_a_days_location_is_keyed_on_where_it_starts(self):
+        self.assertEqual(location_key("Kandy to Nuwara Eliya"), "kandy")
+        self.assertEqual(town("Kandy to Nuwara Eliya", last=True), "nuwara eliya")
+
+class IntentRouterTests(SimpleTestCase):
+    EXAMPLES = {ITINERARY: ["plan a trip", "build a route"], CHAT: ["what is kottu"], ADVICE: ["will it rain"]}
+    AXES = {ITINERARY: [1, 0, 0, 0], CHAT: [0, 1, 0, 0], ADVICE: [0, 0, 1, 0]}
+
+    def setUp(self):
+        self.vectors = {text: self.AXES[intent] for intent, texts in self.EXAMPLES.items() for text in texts}
+        self.calls = 0
+
+    def _embed_many(self, texts):
+        self.calls += 1
+        return [self.vectors.get(text) for text in texts]
+
+    def _router(self):
+        return IntentRouter(self.EXAMPLES, min_confidence=0.55, min_margin=0.02)
+
+    def test_confident_match_routes_by_embedding(self):
+        self.vectors["any trains to ella tomorrow"] = [0.1, 0.2, 0.97, 0]
+        self.assertEqual(self._router().route("any trains to ella tomorrow", self._embed_many)[::2], (ADVICE, "embedding"))
+
+    def test_low_confidence_falls_back_to_keywords(self):
+        # Mostly off every intent axis: the nearest centroid is about 0.4 similar
+        self.vectors["plan something fun"] = [0.4, 0.3, 0.2, 0.85]
+        intent, confidence, method = self._router().route("plan something fun", self._embed_many)
+        self.assertEqual((intent, method), (ITINERARY, "keyword"))
+        self.assertLess(confidence, 0.55)
+
+    def test_narrow_margin_falls_back_to_keywords(self):
+        self.vectors["ella"] = [0.7, 0.71, 0, 0]
+        self.assertEqual(self._router().route("ella", self._embed_many)[::2], (CHAT, "keyword"))
+
+    def test_unavailable_embedder_uses_keywords_and_backs_off(self):
+        router = self._router()
+        self.vectors = {}
+        self.assertEqual(router.route("plan a 5 day trip", self._embed_many), (ITINERARY, None, "keyword"))
+        self.assertEqual(router.route("what is kottu", self._embed_many), (CHAT, None, "keyword"))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(router.snapshot()["routed"], {"embedding": 0, "fallback": 2})
+
+    async def test_async_route_matches_sync(self):
+        async def aembed_many(texts):
+            return self._embed_many(texts)
+
+        self.vectors["shall we take the train"] = [0.96, 0.1, 0.1, 0]
+        self.assertEqual((await self._router().aroute("shall we take the train", aembed_many))[::2], (ITINERARY, "embedding"))
+
+
+class ServiceRegistryTests(SimpleTestCase):
+    def test_service_is_built_once_and_reused(self):
+        services = ServiceRegistry()
+        built = []
+        services.register("llama", lambda: built.append(object()) or built[-1])
+        threads = [threading.Thread(target=services.get, args=("llama",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(built), 1)
+        self.assertIs(services.get("llama"), built[0])
+
+    def test_override_restores_the_built_instance(self):
+        services = ServiceRegistry()
+        services.register("llama", object)
+        real, fake = services.get("llama"), object()
+        with services.override("llama", fake) as swapped:
+            self.assertIs(swapped, fake)
+            self.assertIs(services.get("llama"), fake)
+        self.assertIs(services.get("llama"), real)
+
+    def test_override_before_first_use_leaves_nothing_behind(self):
+        services = ServiceRegistry()
+        services.register("llama", lambda: "real")
+        with services.override("llama", "fake"):
+            self.assertEqual(services.get("llama"), "fake")
+        self.assertEqual(services.get("llama"), "real")
+
+    def test_dependent_service_is_built_on_the_override(self):
+        fake = LLaMAService()
+        registry.reset("trip_assistant")
+        self.addCleanup(registry.reset, "trip_assistant")
+        with registry.override("llama", fake):
+            self.assertIs(get_trip_assistant().llama_agent, fake)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        owner = User.objects.create_user("owner", "owner@example.com", "pw")
+        now = timezone.now()
+        # Trips 2 and 3 share a timestamp, so the id tie-breaker decides their order
+        for n, minutes_ago in enumerate([5, 4, 3, 3, 2, 1]):
+            trip = SavedTrip.objects.create(user=owner, title=f"Trip {n}")
+            SavedTrip.objects.filter(pk=trip.pk).update(created_at=now - timedelta(minutes=minutes_ago))
+        self.newest_first = list(SavedTrip.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def _walk(self, url):
+        ids, pages, cursor = [], [], None
+        while True:
+            response = self.client.get(url, {"page_size": 2, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            ids += [row["id"] for row in response.data["results"]]
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                return ids, pages
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        ids, pages = self._walk("/api/v1/admin/trips/")
+        self.assertEqual(ids, self.newest_first)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[0]["count"], 6)
+        self.assertNotIn("count", pages[1])
+
+    def test_rows_are_projections_without_payloads(self):
+        response = self.client.get("/api/v1/admin/trips/", {"page_size": 1})
+        self.assertEqual(set(response.data["results"][0]), {"id", "title", "summary", "day_count", "created_at", "user_email"})
+
+    def test_filters_apply_before_paging(self):
+        response = self.client.get("/api/v1/admin/trips/", {"q": "trip 3", "user": "OWNER@example.com"})
+        self.assertEqual([row["title"] for row in response.data["results"]], ["Trip 3"])
+
+    def test_bad_cursor_or_date_is_a_400(self):
+        self.assertEqual(self.client.get("/api/v1/admin/trips/", {"cursor": "not-a-cursor"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/admin/trips/", {"cursor": encode_cursor({"t": "x", "id": 1})}).status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/admin/trips/", {"created_after": "yesterday"}).status_code, 400)
+
+    def test_user_list_pages_on_the_date_joined_index(self):
+        ids, _ = self._walk("/api/v1/admin/users/")
+        self.assertEqual(ids, list(User.objects.order_by("-date_joined", "-id").values_list("id", flat=True)))
+
+        with connection.cursor() as cursor:
+            # The test table is tiny; make the planner show which index it would use
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = User.objects.order_by("-date_joined", "-id").values("id")[:3].explain()
+        self.assertIn("auth_user_date_joined_id", plan)
+        self.assertNotIn("Sort", plan)
+
+
+class CursorTests(SimpleTestCase):
+    def test_cursor_round_trips(self):
+        position = {"t": "2026-01-02T03:04:05+00:00", "id": 42}
+        self.assertEqual(decode_cursor(encode_cursor(position)), position)
+
+    def test_garbage_cursor_is_rejected(self):
+        with self.assertRaises(PaginationError):
+            decode_cursor("%%%")
+
+
+class SavedTripConditionalGetTests(TestCase):
+    ITINERARY = {"summary": "Temples and tea", "days": [{"day": 1, "location": "Kandy"}, {"day": 2, "location": "Ella"}]}
+
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", "traveller@example.com", "pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post("/api/v1/trips/", {"title": "Hill Country", "itinerary_json": self.ITINERARY}, format="json")
+        self.trip = SavedTrip.objects.get(user=self.user)
+
+    def test_list_is_summaries_only(self):
+        response = self.client.get("/api/v1/trips/")
+        self.assertEqual(response.status_code, 200)
+        (row,) = response.data["results"]
+        self.assertEqual((row["summary"], row["day_count"], row["cities"]), ("Temples and tea", 2, ["Kandy", "Ella"]))
+        self.assertNotIn("itinerary_json", row)
+
+    def test_repeat_request_is_not_modified(self):
+        first = self.client.get("/api/v1/trips/")
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+        again = self.client.get("/api/v1/trips/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+        self.assertEqual(self.client.get("/api/v1/trips/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+    def test_saving_a_trip_changes_the_etag(self):
+        etag = self.client.get("/api/v1/trips/")["ETag"]
+        self.client.post("/api/v1/trips/", {"title": "Coast", "itinerary_json": self.ITINERARY}, format="json")
+        response = self.client.get("/api/v1/trips/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_deleting_a_trip_changes_the_etag(self):
+        etag = self.client.get("/api/v1/trips/")["ETag"]
+        self.client.delete(f"/api/v1/trips/{self.trip.pk}/")
+        response = self.client.get("/api/v1/trips/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data["results"]), (200, []))
+
+    def test_admin_delete_changes_the_owners_etag(self):
+        etag = self.client.get("/api/v1/trips/")["ETag"]
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        self.assertEqual(admin.delete(f"/api/v1/admin/trips/{self.trip.pk}/").status_code, 200)
+        self.assertEqual(self.client.get("/api/v1/trips/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_is_conditional_too(self):
+        first = self.client.get(f"/api/v1/trips/{self.trip.pk}/")
+        self.assertEqual(first.data["itinerary_json"], self.ITINERARY)
+        self.assertEqual(self.client.get(f"/api/v1/trips/{self.trip.pk}/", HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+    def test_other_users_lists_are_independent(self):
+        TripListVersion.bump(User.objects.create_user("other", "other@example.com", "pw"))
+        etag = self.client.get("/api/v1/trips/")["ETag"]
+        self.assertEqual(self.client.get("/api/v1/trips/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", "traveller@example.com", "pw")
+
+    def _job(self, **fields):
+        job = job_queue.enqueue(self.user, {"query": "5 days in Kandy"})
+        if fields:
+            ItineraryJob.objects.filter(pk=job.pk).update(**fields)
+        return ItineraryJob.objects.get(pk=job.pk)
+
+    def test_claim_takes_the_oldest_ready_job(self):
+        later = self._job(run_after=timezone.now() + timedelta(minutes=5))
+        first, second = self._job(), self._job()
+
+        job = job_queue.claim("w1")
+        self.assertEqual((job.pk, job.status, job.attempts, job.locked_by), (first.pk, ItineraryJob.RUNNING, 1, "w1"))
+        self.assertEqual(job_queue.claim("w2").pk, second.pk)
+        self.assertIsNone(job_queue.claim("w3"))
+        self.assertEqual(ItineraryJob.objects.get(pk=later.pk).status, ItineraryJob.QUEUED)
+
+    def test_failure_backs_off_then_gives_up(self):
+        self._job(max_attempts=2)
+        job = job_queue.claim("w1")
+        self.assertEqual(job_queue.fail(job, "ollama down"), ItineraryJob.QUEUED)
+        self.assertIsNone(job_queue.claim("w1"))  # still backing off
+
+        ItineraryJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = job_queue.claim("w1")
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job_queue.fail(job, "ollama down"), ItineraryJob.FAILED)
+        self.assertEqual(ItineraryJob.objects.get(pk=job.pk).error, "ollama down")
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        stale = timezone.now() - timedelta(hours=1)
+        retry = self._job(status=ItineraryJob.RUNNING, attempts=1, locked_by="dead", locked_at=stale)
+        exhausted = self._job(status=ItineraryJob.RUNNING, attempts=3, locked_by="dead", locked_at=stale)
+        alive = self._job(status=ItineraryJob.RUNNING, attempts=1, locked_by="busy", locked_at=timezone.now())
+
+        self.assertEqual(job_queue.requeue_stale(lease_seconds=60), (1, 1))
+        statuses = dict(ItineraryJob.objects.values_list("pk", "status"))
+        self.assertEqual(statuses, {retry.pk: ItineraryJob.QUEUED, exhausted.pk: ItineraryJob.FAILED, alive.pk: ItineraryJob.RUNNING})
+
+    def test_heartbeat_renews_only_the_holders_lease(self):
+        self._job()
+        job = job_queue.claim("w1")
+        ItineraryJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(job_queue.heartbeat(job))
+        self.assertEqual(job_queue.requeue_stale(lease_seconds=60), (0, 0))
+
+        ItineraryJob.objects.filter(pk=job.pk).update(locked_by="w2")
+        self.assertFalse(job_queue.heartbeat(job))
+
+    def test_run_job_records_the_outcome(self):
+        llama = mock.Mock()
+        llama.generate_itinerary.return_value = {"title": "Kandy", "days": []}
+        self._job()
+        self.assertEqual(job_queue.run_job(job_queue.claim("w1"), llama), ItineraryJob.SUCCEEDED)
+
+        llama.generate_itinerary.return_value = {"error": "ollama down"}
+        failing = self._job()
+        self.assertEqual(job_queue.run_job(job_queue.claim("w1"), llama), ItineraryJob.QUEUED)
+        self.assertEqual(ItineraryJob.objects.get(pk=failing.pk).error, "ollama down")
+        self.assertEqual(ItineraryJob.objects.filter(status=ItineraryJob.SUCCEEDED).values_list("result", flat=True).get(), {"title": "Kandy", "days": []})
+
+
+class JobQueueLockingTests(TransactionTestCase):
+    def test_claim_skips_a_row_another_worker_has_locked(self):
+        user = User.objects.create_user("traveller", "traveller@example.com", "pw")
+        first = job_queue.enqueue(user, {"query": "a"})
+        second = job_queue.enqueue(user, {"query": "b"})
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_first():
+            try:
+                with transaction.atomic():
+                    ItineraryJob.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_first)
+        holder.start()
+        locked.wait(5)
+        try:
+            self.assertEqual(job_queue.claim("w2").pk, second.pk)
+            self.assertIsNone(job_queue.claim("w3"))
+        finally:
+            release.set()
+            holder.join(5)
+        self.assertEqual(job_queue.claim("w4").pk, first.pk)
+
+
+
+class ItineraryWorkerCommandTests(TransactionTestCase):
+    def test_stopping_waits_for_in_flight_jobs_without_sweeping(self):
+        job = job_queue.enqueue(User.objects.create_user("traveller", "traveller@example.com", "pw"), {"query": "Kandy"})
+        command = ItineraryWorkerCommand()
+        connections_closed = []
+        wrapper_class = type(connections["default"])
+        close = wrapper_class.close
+
+        def record_close(wrapper):
+            connections_closed.append(threading.current_thread().name)
+            close(wrapper)
+
+        class SlowLlama:
+            def generate_itinerary(self, preferences, mode=None, use_cache=True):
+                command._stop()  # SIGTERM mid-generation
+                time.sleep(0.5)
+                return {"title": "Kandy", "days": []}
+
+        with registry.override("llama", SlowLlama()), mock.patch("signal.signal"), \
+                mock.patch.object(job_queue, "requeue_stale", return_value=(0, 0)) as sweep, \
+                mock.patch.object(wrapper_class, "close", autospec=True, side_effect=record_close):
+            command.handle(concurrency=1, poll_interval=0.01, once=False)
+
+        self.assertEqual(ItineraryJob.objects.get(pk=job.pk).status, ItineraryJob.SUCCEEDED)
+        self.assertLessEqual(sweep.call_count, 1)
+        self.assertIn("itinerary-worker-0", connections_closed)
+
+class StreamingViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", "traveller@example.com", "pw")
+        self.factory = APIRequestFactory()
+
+    async def _events(self, view, request, **kwargs):
+        force_authenticate(request, user=self.user)
+        response = await view.as_view()(request, **kwargs)
+        # An async iterator is what lets ASGI send each frame as it is produced
+        self.assertTrue(response.is_async)
+        return [frame.decode().split("\n")[0].removeprefix("event: ") async for frame in response.streaming_content]
+
+    async def test_itinerary_stream_is_an_async_event_stream(self):
+        class FakeLlama:
+            async def astream_itinerary(self, preferences, use_cache=True):
+                yield "meta", {"title": "Hill Country"}
+                yield "day", {"day": 1, "location": "Kandy"}
+                yield "done", {"title": "Hill Country", "days": [{"day": 1}]}
+
+        request = self.factory.post("/api/v1/plan/stream/", {"preferences": "2 days in Kandy"}, format="json")
+        with registry.override("llama", FakeLlama()):
+            self.assertEqual(await self._events(ItineraryStreamView, request), ["meta", "day", "done"])
+
+    async def test_job_stream_ends_with_the_result(self):
+        job = await sync_to_async(ItineraryJob.objects.create)(
+            user=self.user, preferences="Kandy", status=ItineraryJob.SUCCEEDED, result={"days": []})
+        request = self.factory.get(f"/api/v1/plan/jobs/{job.pk}/", {"stream": "1"})
+        self.assertEqual(await self._events(ItineraryJobView, request, pk=job.pk), ["status", "done"])
+
+    async def test_job_stream_times_out_on_an_unfinished_job(self):
+        job = await sync_to_async(ItineraryJob.objects.create)(user=self.user, preferences="Kandy")
+        request = self.factory.get(f"/api/v1/plan/jobs/{job.pk}/", {"stream": "1"})
+        with mock.patch.multiple(ItineraryJobView, poll_seconds=0.01, max_stream_seconds=0.05):
+            self.assertEqual(await self._events(ItineraryJobView, request, pk=job.pk), ["status", "timeout"])
+
+
+class CacheEvictionTests(TestCase):
+    def _entry(self, n, **fields):
+        return ItineraryCache.objects.create(query_text=f"trip {n}", embedding=[0.0] * 768, itinerary_json={"title": "x" * 200}, **fields)
+
+    def test_byte_budget_is_met_once(self):
+        for n in range(20):
+            self._entry(n)
+        evictor = CacheEvictor(max_rows=0, max_bytes=1)
+        evictor.max_bytes = evictor._live_bytes() // 2
+
+        self.assertEqual(evictor.evict(), 10)
+        # The table files do not shrink until VACUUM FULL; the next run must not read that as still over budget
+        self.assertEqual(evictor.evict(), 0)
+        self.assertEqual(ItineraryCache.objects.count(), 10)
+
+    def test_lru_counts_generation_as_a_use(self):
+        now = timezone.now()
+        hit_long_ago = self._entry(1, hit_count=1, last_hit_at=now - timedelta(days=60))
+        fresh = self._entry(2)
+        ItineraryCache.objects.filter(pk=hit_long_ago.pk).update(created_at=now - timedelta(days=90))
+
+        CacheEvictor(policy="lru", max_rows=1).evict()
+        self.assertEqual(list(ItineraryCache.objects.values_list("pk", flat=True)), [fresh.pk])
+
+
+
+def _calendar_day(**fields):
+    day = {"is_poya": False, "is_public_holiday": False, "is_weekend": False, "holidays": [],
+           "crowd_score": 0, "crowd_level": "low", "reasons": []}
+    day.update(fields)
+    return day
+
+
+class AdviceRuleEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.rules = AdviceRuleEngine(min_confidence=0.8, enabled=True)
+
+    def test_weather_verdict_for_the_planned_activity(self):
+        storm = self.rules.evaluate("Should I go now?", {"weather_code": 95}, _calendar_day(), "Surfing lesson", theme="Beach")
+        self.assertIn("isn't safe", storm["advice"])
+        self.assertIn("spa", storm["advice"])
+        self.assertEqual(storm["rule"], "go:storm:water:low")
+
+        clear = self.rules.evaluate("Is the weather ok?", {"weather_code": 0, "temperature_2m": 29}, _calendar_day(), "Galle Fort walk")
+        self.assertIn("great for Galle Fort walk", clear["advice"])
+
+    def test_crowd_note_comes_from_the_calendar(self):
+        poya = _calendar_day(is_poya=True, holidays=["Vesak Full Moon Poya Day"], crowd_score=3, crowd_level="very_high")
+        answer = self.rules.evaluate("Will the temple be crowded?", None, poya, "Temple of the Tooth")
+        self.assertIn("Poya day", answer["advice"])
+        self.assertEqual((answer["rule"], answer["confidence"]), ("crowd:any:temple:poya", 1.0))
+
+        weekend = self.rules.evaluate("Is it a good time to go?", {"weather_code": 1}, _calendar_day(is_weekend=True), "Beach afternoon")
+        self.assertIn("weekend", weekend["advice"])
+
+    def test_unsure_answers_fall_through_to_the_llm(self):
+        day = _calendar_day()
+        # Hiking in the rain (0.85) is below a stricter threshold
+        strict = AdviceRuleEngine(min_confidence=0.9, enabled=True)
+        self.assertIsNotNone(self.rules.evaluate("Should I go now?", {"weather_code": 61}, day, "Ella Rock hike"))
+        self.assertIsNone(strict.evaluate("Should I go now?", {"weather_code": 61}, day, "Ella Rock hike"))
+        self.assertIsNone(self.rules.evaluate("Where should we eat tonight?", {"weather_code": 0}, day, "Beach"))
+        self.assertIsNone(self.rules.evaluate("Should I go now?", {"weather_code": 0, "stale": True}, day, "Beach"))
+        self.assertIsNone(self.rules.evaluate("Should I go now?", {"weather_code": 0}, day, "Something unusual"))
+        self.assertIsNone(AdviceRuleEngine(enabled=False).evaluate("Should I go now?", {"weather_code": 0}, day, "Beach"))
+
+
+class TripAssistantViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("traveller", "traveller@example.com", "pw"))
+        patchers = [
+            mock.patch.object(holiday_calendar, "day", return_value=_calendar_day()),
+            mock.patch.object(weather_cache, "aget", new=mock.AsyncMock(return_value={"weather_code": 0, "temperature_2m": 28})),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _ask(self, query, activity):
+        body = {"location": "Mirissa", "query": query, "lat": 5.94, "lon": 80.45, "activity": activity}
+        return self.client.post("/api/v1/chat/", body, format="json")
+
+    def test_predictable_question_is_answered_by_the_rules(self):
+        with mock.patch.object(async_http_client, "post") as ollama:
+            response = self._ask("Should I still go?", "Whale watching")
+        ollama.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"advice", "source", "rule", "confidence"})
+        self.assertEqual(response.json()["source"], "rules")
+
+    def test_open_question_goes_to_the_llm(self):
+        with mock.patch.object(async_http_client, "post", new=mock.AsyncMock(return_value=_OllamaReply(" Try the crab curry. "))):
+            response = self._ask("Where can we eat nearby?", "Whale watching")
+        self.assertEqual(response.json(), {"advice": "Try the crab curry.", "source": "llm"})
+
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("travel_api.services.weather_cache.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failures=3, cooldown=60)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()  # Resets the run
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 60
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        # A failed probe re-opens it for a full cooldown
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.now += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+
+class WeatherCacheTests(TestCase):
+    def test_nearby_coordinates_share_a_cell(self):
+        self.assertEqual(grid_cell(6.9271, 79.8612)[0], grid_cell(6.9301, 79.8589)[0])
+        self.assertNotEqual(grid_cell(6.9271, 79.8612)[0], grid_cell(7.2906, 80.6337)[0])
+        self.assertIsNone(grid_cell("north", None))
+
+        cache = WeatherCache()
+        fetch = mock.Mock(return_value={"weather_code": 0})
+        cache.get(6.9271, 79.8612, fetch)
+        self.assertEqual(cache.get(6.9301, 79.8589, fetch), {"weather_code": 0})
+        fetch.assert_called_once()
+
+    def test_stale_reading_is_served_while_the_breaker_is_open(self):
+        cache = WeatherCache(ttl_seconds=0)
+        cache.breaker = CircuitBreaker(failures=1, cooldown=60)
+        cache.get(6.9271, 79.8612, mock.Mock(return_value={"weather_code": 3}))
+
+        failing = mock.Mock(side_effect=ConnectionError("open-meteo down"))
+        first = cache.get(6.9271, 79.8612, failing)
+        second = cache.get(6.9271, 79.8612, failing)
+
+        self.assertEqual(failing.call_count, 1)  # The open breaker stops the second call
+        self.assertEqual(cache.breaker.state, "open")
+        for reading in (first, second):
+            self.assertEqual((reading["weather_code"], reading["stale"]), (3, True))
+
+
+
+class ItineraryCodecTests(SimpleTestCase):
+    itinerary = {
+        "title": "Hill Country & Coast", "summary": "Tea, temples and the south coast – ශ්‍රී ලංකා",
+        "days": [_day(1, "Kandy"), _day(2, "Nuwara Eliya"), _day(3, "Galle")],
+    }
+
+    def test_round_trip(self):
+        blob = compress_itinerary(self.itinerary)
+        self.assertEqual(blob[0], CURRENT_VERSION)
+        self.assertEqual(decompress_itinerary(memoryview(blob)), self.itinerary)
+        self.assertLess(len(blob), len(json.dumps(self.itinerary)))
+
+    def test_fields_follow_the_configured_representation(self):
+        self.assertEqual(itinerary_fields(self.itinerary, compress=False), {"itinerary_json": self.itinerary, "itinerary_blob": None})
+        fields = itinerary_fields(self.itinerary, compress=True)
+        self.assertIsNone(fields["itinerary_json"])
+        self.assertEqual(decompress_itinerary(fields["itinerary_blob"]), self.itinerary)
+
+
+class SavedTripPayloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", "traveller@example.com", "pw")
+
+    def _trip(self, itinerary, compress):
+        trip = SavedTrip(user=self.user, title="Loop")
+        with mock.patch("travel_api.services.itinerary_codec.COMPRESSION_ENABLED", compress):
+            trip.set_itinerary(itinerary)
+        trip.save()
+        return trip
+
+    def test_set_itinerary_fills_the_listing_projection(self):
+        itinerary = {"summary": "Temples and tea", "days": [_day(1, "Kandy"), _day(2, "Kandy"), _day(3, "Ella"), "junk"]}
+        trip = SavedTrip.objects.get(pk=self._trip(itinerary, compress=True).pk)
+        self.assertEqual((trip.summary, trip.day_count, trip.cities), ("Temples and tea", 4, ["Kandy", "Ella"]))
+        self.assertIsNone(trip.itinerary_json)
+        self.assertEqual(trip.get_itinerary(), itinerary)
+
+        trip.set_itinerary(None)
+        self.assertEqual((trip.summary, trip.day_count, trip.cities), ("", 0, []))
+
+    def test_compress_command_round_trips_jsonb(self):
+        itineraries = [{"title": f"Trip {n}", "days": [_day(1, "Galle")]} for n in range(3)]
+        trips = [self._trip(itinerary, compress=False) for itinerary in itineraries]
+
+        call_command("compress_itineraries", "--table", "trips", "--batch-size", "2", stdout=io.StringIO())
+        self.assertFalse(SavedTrip.objects.filter(itinerary_blob__isnull=True).exists())
+
+        call_command("compress_itineraries", "--table", "trips", "--decompress", stdout=io.StringIO())
+        restored = {trip.pk: (trip.itinerary_json, trip.itinerary_blob) for trip in SavedTrip.objects.all()}
+        self.assertEqual(restored, {trip.pk: (itinerary, None) for trip, itinerary in zip(trips, itineraries)})
+
+
+
+class _JsonReply:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class TripBatchAdviceViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("traveller", "traveller@example.com", "pw"))
+        self.today = timezone.localdate()
+        patchers = [
+            mock.patch.object(holiday_calendar, "day", return_value=_calendar_day(weekday="Monday", crowd_level="moderate")),
+            mock.patch.object(weather_cache, "breaker", CircuitBreaker()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _hourly(self, code):
+        day = self.today.isoformat()
+        return {"hourly": {"time": [f"{day}T09:00", f"{day}T14:00"], "temperature_2m": [27, 31], "weather_code": [code, code],
+                           "precipitation_probability": [10, 80], "precipitation": [0, 4], "wind_speed_10m": [8, 12]}}
+
+    def test_whole_trip_reviewed_from_one_forecast_and_one_llm_call(self):
+        itinerary = {"trip_theme": "Beach", "days": [
+            {"day": 1, "location": "Galle", "activities": [{"time": "Morning", "activity": "Fort walk"}, {"time": "2:30 PM", "activity": "Beach"}]},
+            {"day": 2, "location": "Kandy", "activities": [{"time": "9:00 AM", "activity": "Temple of the Tooth"}]},
+        ]}
+        # Galle and Kandy are separate grid cells: one request, one result per cell
+        forecast = mock.AsyncMock(return_value=_JsonReply([self._hourly(0), self._hourly(61)]))
+        advice = json.dumps({"advice": {"1.1": "Great morning for the fort.", "1.2": "  "}})
+        ollama = mock.AsyncMock(return_value=_OllamaReply(advice))
+        with mock.patch.object(async_http_client, "get", new=forecast), mock.patch.object(async_http_client, "post", new=ollama):
+            response = self.client.post("/api/v1/chat/batch/", {"itinerary": itinerary, "start_date": self.today.isoformat()}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        forecast.assert_awaited_once()
+        ollama.assert_awaited_once()
+        self.assertEqual(len(forecast.call_args.kwargs["params"]["latitude"].split(",")), 2)
+        self.assertIn("[2.1]", ollama.call_args.kwargs["json"]["messages"][0]["content"])
+
+        body = response.json()
+        galle = body["days"][0]["activities"]
+        self.assertEqual([a["id"] for a in galle], ["1.1", "1.2"])
+        self.assertEqual((galle[0]["forecast"]["temperature"], galle[1]["forecast"]["precipitation_probability"]), (27, 80))
+        self.assertEqual([a["advice"] for a in galle], ["Great morning for the fort.", None])
+        # The stub only has hours for today, and day 2 is tomorrow
+        self.assertIsNone(body["days"][1]["activities"][0]["forecast"])
+        self.assertEqual((body["days"][1]["crowd_level"], body["advice_missing"]), ("moderate", 2))
+
+    def test_itineraries_that_cannot_be_batched_are_rejected(self):
+        too_many = {"days": [{"location": "Galle", "activities": [{"activity": "Walk"}] * (BATCH_MAX_ACTIVITIES + 1)}]}
+        empty = {"days": [{"location": "Galle", "activities": []}]}
+        for itinerary in (too_many, empty):
+            response = self.client.post("/api/v1/chat/batch/", {"itinerary": itinerary}, format="json")
+            self.assertEqual(response.status_code, 400)
+
+
+
+class TokenBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.budget = TokenBudget(kinds={"itinerary": (100, 0, 8192)}, buckets=[1024, 2048, 4096])
+        # One token per character keeps the arithmetic visible
+        self.budget.tokenizer = mock.Mock(count=len)
+
+    def _messages(self, prompt_tokens):
+        return [{"content": "x" * (prompt_tokens - 2 * MESSAGE_OVERHEAD)}]
+
+    def test_context_is_rounded_up_to_a_bucket(self):
+        self.assertEqual(self.budget.plan("itinerary", self._messages(100), units=2),
+                         {"num_ctx": 1024, "num_predict": math.ceil(200 * HEADROOM)})
+        self.assertEqual(self.budget.plan("itinerary", self._messages(100), units=10)["num_ctx"], 2048)
+
+    def test_p90_replaces_the_seed_after_five_samples(self):
+        for eval_count in (200, 200, 200, 200):
+            self.budget.record("itinerary", 1, {"eval_count": eval_count})
+        self.assertEqual(self.budget.per_unit("itinerary"), 100)
+        self.budget.record("itinerary", 1, {"eval_count": 1000})
+        self.assertEqual(self.budget.per_unit("itinerary"), 1000)
+        # Bodies without eval_count (errors, aborted streams) teach nothing
+        self.budget.record("itinerary", 1, {"error": "model not found"})
+        self.assertEqual(len(self.budget._samples["itinerary"]), 5)
+
+    def test_truncated_answers_count_as_longer(self):
+        for _ in range(5):
+            self.budget.record("itinerary", 2, {"eval_count": 400, "done_reason": "length"})
+        self.assertEqual(self.budget.per_unit("itinerary"), 250)
+        self.assertEqual(self.budget.snapshot()["kinds"]["itinerary"]["truncated"], 5)
+
+    def test_oversized_requests_are_capped_at_the_largest_bucket(self):
+        options = self.budget.plan("itinerary", self._messages(3800), units=10)
+        # The whole prompt stays; the answer gets what is left, but never less than 256 tokens
+        self.assertEqual(options, {"num_ctx": 4096, "num_predict": 4096 - 3800})
+        self.assertEqual(self.budget.plan("itinerary", self._messages(4000), units=1), {"num_ctx": 4096, "num_predict": 256})
+
+
+
+def _unit_vector(axis, dimensions=768):
+    vector = [0.0] * dimensions
+    vector[axis] = 1.0
+    return vector
+
+
+class ItineraryCacheTierTests(TestCase):
+    def setUp(self):
+        self.llama = LLaMAService()
+        self.store = self.llama.store
+        patcher = mock.patch("travel_api.services.itinerary_store.hit_recorder")
+        self.hits = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _structured(self, **overrides):
+        return self.llama._parse_preferences({"duration": "5", "startLocation": "Colombo", "groupSize": "Couple", "tripType": "Beach", **overrides})
+
+    def test_key_is_versioned_by_prompt_and_model(self):
+        key = self._structured()["cache_key"]
+        self.assertEqual(self._structured(startLocation=" colombo ", tripType="BEACH")["cache_key"], key)
+        with mock.patch("travel_api.services.llama_service.PROMPT_VERSION", PROMPT_VERSION + "-next"):
+            self.assertNotEqual(self._structured()["cache_key"], key)
+        self.llama.model = "srilanka-llama-v2"
+        self.assertNotEqual(self._structured()["cache_key"], key)
+
+    def test_structured_request_is_served_from_the_key_tier(self):
+        prefs = self._structured()
+        self.store.save("older wording", _unit_vector(0), {"title": "Beach week"}, cache_key=prefs["cache_key"],
+                        prompt_version=PROMPT_VERSION, model_name=self.llama.model)
+        with mock.patch.object(self.llama, "get_embedding") as embed:
+            cached, embedding = self.llama._lookup_cache(prefs)
+        # A key hit needs no embedding call
+        embed.assert_not_called()
+        self.assertEqual((cached, embedding), ({"title": "Beach week"}, None))
+        self.hits.record.assert_called_once()
+
+    def test_semantic_hit_must_agree_on_the_numbers(self):
+        self.store.save("5 days in Kandy", _unit_vector(0), {"title": "Five days"}, prompt_version=PROMPT_VERSION, model_name=self.llama.model)
+
+        def find(query_text, **versions):
+            versions = {"prompt_version": PROMPT_VERSION, "model_name": self.llama.model, **versions}
+            return self.store.find_similar(query_text, _unit_vector(0), **versions)
+
+        self.assertEqual(find("5 days in Kandy please"), {"title": "Five days"})
+        # Same vector, different day count: a near-miss, not a hit
+        self.assertIsNone(find("7 days in Kandy"))
+        self.assertIsNone(find("5 days in Kandy please", prompt_version="itinerary-v0"))
+        self.assertIsNone(find("5 days in Kandy please", model_name="llama3.2"))
+        self.assertEqual(self.hits.record.call_count, 1)
+
+
+
+class EmbeddingCacheTests(TestCase):
+    def test_memory_is_filled_from_the_shared_table(self):
+        EmbeddingCache().put_many({"Kandy": _unit_vector(0), "Ella": _unit_vector(1)}, "nomic-embed-text")
+
+        # A fresh worker: nothing in memory yet
+        cache = EmbeddingCache()
+        with self.assertNumQueries(1):
+            found = cache.get_many(["Kandy", "Ella", "Galle"], "nomic-embed-text")
+        self.assertEqual(found, {"Kandy": _unit_vector(0), "Ella": _unit_vector(1)})
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_many(["Kandy"], "nomic-embed-text"), {"Kandy": _unit_vector(0)})
+
+    def test_vectors_are_kept_apart_by_model(self):
+        cache = EmbeddingCache()
+        cache.put_many({"Kandy": _unit_vector(0)}, "nomic-embed-text")
+        self.assertEqual(cache.get_many(["Kandy"], "mxbai-embed-large"), {})
+        self.assertEqual(EmbeddingCache().get_many(["Kandy"], "mxbai-embed-large"), {})
+
+        cache.put_many({"Kandy": _unit_vector(2)}, "mxbai-embed-large")
+        self.assertEqual(EmbeddingCache().get_many(["Kandy"], "nomic-embed-text"), {"Kandy": _unit_vector(0)})
+        self.assertEqual(EmbeddingCache().get_many(["Kandy"], "mxbai-embed-large"), {"Kandy": _unit_vector(2)})
+
+
+
+class CompactVectorSearchTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            version = tuple(int(part) for part in cursor.fetchone()[0].split(".")[:2])
+        if version < (0, 7):
+            self.skipTest("halfvec and binary_quantize need pgvector >= 0.7")
+
+        # Nearly parallel vectors whose float32 distances are not representable in half precision
+        self.store = ItineraryStore()
+        for n in range(1, 6):
+            vector = [0.1 + 0.000123 * n * (i % 7) for i in range(768)]
+            ItineraryCache.objects.create(query_text=f"trip {n}", embedding=vector, itinerary_json={"n": n})
+        self.query = [0.1 + 0.000125 * (i % 7) for i in range(768)]
+
+    def test_compact_modes_rerank_on_the_exact_distance(self):
+        exact = self.store._nearest(ItineraryCache.objects.all(), self.query, mode="full")
+        for mode in ("halfvec", "binary"):
+            with self.subTest(mode=mode):
+                match = self.store._nearest(ItineraryCache.objects.all(), self.query, mode=mode)
+                self.assertEqual((match.pk, match.distance), (exact.pk, exact.distance))
+                self.assertEqual(match.get_itinerary(), {"n": 1})
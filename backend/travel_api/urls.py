@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import ItineraryAgentView, TripAssistantView, RegisterView, SavedTripView
+from .views import ItineraryAgentView, ItineraryStreamView, ItineraryJobView, TripAssistantView, TripBatchAdviceView, CrowdCalendarView, RegisterView, SavedTripView
 from .serializers import CustomTokenObtainPairView
 from .admin_views import (
     AdminStatsView, AdminUserListView, AdminUserDetailView,
@@ -9,7 +9,11 @@ from .admin_views import (
 
 urlpatterns = [
     path('plan/', ItineraryAgentView.as_view(), name='plan_itinerary'),
+    path('plan/stream/', ItineraryStreamView.as_view(), name='plan_itinerary_stream'),
+    path('plan/jobs/<int:pk>/', ItineraryJobView.as_view(), name='plan_itinerary_job'),
     path('chat/', TripAssistantView.as_view(), name='trip_chat'),
+    path('chat/batch/', TripBatchAdviceView.as_view(), name='trip_chat_batch'),
+    path('calendar/', CrowdCalendarView.as_view(), name='crowd_calendar'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', RegisterView.as_view(), name='auth_register'),
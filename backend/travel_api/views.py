@@ -1,10 +1,30 @@
+import json
+import time
+import asyncio
+from datetime import datetime
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .services.llama_service import LLaMAService
-from .services.trip_assistant import TripAssistantService
+from .services.registry import get_llama_service, get_trip_assistant
+from .async_views import AsyncAPIView
+from .services import job_queue
+from .services.ollama_scheduler import ollama_caller, AdmissionRejected
+from .services.holiday_calendar import holiday_calendar
+from .services.trip_assistant import BatchAdviceError
+
+def _rejected_response(e):
+    """429/503 with Retry-After for calls the Ollama scheduler refused to queue."""
+    return Response(
+        {"error": str(e), "retry_after": e.retry_after},
+        status=e.status_code,
+        headers={"Retry-After": str(e.retry_after)}
+    )
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -25,23 +45,75 @@ class RegisterView(APIView):
         user.save()
         return Response({'message': 'User created successfully', 'user_id': user.id}, status=status.HTTP_201_CREATED)
 
-from .models import SavedTrip
+from .models import SavedTrip, TripListVersion, ItineraryJob
+from .pagination import keyset_paginate, PaginationError
 
 class SavedTripView(APIView):
+    """
+    GET /api/v1/trips/?cursor=&page_size=   summary list (no itinerary payloads)
+    GET /api/v1/trips/<pk>/                 full itinerary for one trip
+    Both honour If-None-Match / If-Modified-Since against the user's trip-list version.
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        """Retrieve all saved trips for the authenticated user"""
-        trips = SavedTrip.objects.filter(user=request.user).order_by('-created_at')
-        data = [
-            {
-                "id": trip.id,
-                "title": trip.title,
-                "itinerary_json": trip.itinerary_json,
-                "created_at": trip.created_at
-            } for trip in trips
-        ]
-        return Response(data, status=status.HTTP_200_OK)
+    def _validators(self, request, *parts):
+        version, updated_at = TripListVersion.current(request.user)
+        etag = '"' + "-".join(str(p) for p in ("trips", request.user.id, version, *parts)) + '"'
+        return etag, updated_at
+
+    def _not_modified(self, request, etag, updated_at):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        return bool(since and updated_at and int(updated_at.timestamp()) <= since)
+
+    def _conditional(self, request, etag, updated_at, build):
+        if self._not_modified(request, etag, updated_at):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(build(), status=status.HTTP_200_OK)
+        response["ETag"] = etag
+        if updated_at:
+            response["Last-Modified"] = http_date(updated_at.timestamp())
+        # Let the browser cache it but always revalidate, so repeat loads become 304s
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def get(self, request, pk=None):
+        """Retrieve saved trip summaries (or one full trip) for the authenticated user"""
+        if pk is not None:
+            return self._get_detail(request, pk)
+
+        cursor = request.query_params.get("cursor", "")
+        etag, updated_at = self._validators(request, cursor, request.query_params.get("page_size", ""))
+
+        def build():
+            trips = SavedTrip.objects.filter(user=request.user).values("id", "title", "summary", "day_count", "cities", "created_at")
+            rows, next_cursor = keyset_paginate(trips, request)
+            return {"results": rows, "next_cursor": next_cursor}
+
+        try:
+            return self._conditional(request, etag, updated_at, build)
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def _get_detail(self, request, pk):
+        etag, updated_at = self._validators(request, "trip", pk)
+        if self._not_modified(request, etag, updated_at):
+            return self._conditional(request, etag, updated_at, None)
+
+        try:
+            trip = SavedTrip.objects.get(pk=pk, user=request.user)
+        except SavedTrip.DoesNotExist:
+            return Response({"error": "Trip not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return self._conditional(request, etag, updated_at, lambda: {
+            "id": trip.id,
+            "title": trip.title,
+            "itinerary_json": trip.get_itinerary(),
+            "created_at": trip.created_at
+        })
 
     def post(self, request):
         """Save a new trip to the user's profile"""
@@ -51,11 +123,10 @@ class SavedTripView(APIView):
         if not title or not itinerary_json:
             return Response({"error": "Title and itinerary JSON are required"}, status=status.HTTP_400_BAD_REQUEST)
             
-        trip = SavedTrip.objects.create(
-            user=request.user,
-            title=title,
-            itinerary_json=itinerary_json
-        )
+        trip = SavedTrip(user=request.user, title=title)
+        trip.set_itinerary(itinerary_json)
+        trip.save()
+        TripListVersion.bump(request.user)
         return Response({"message": "Trip saved successfully", "id": trip.id}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk):
@@ -63,30 +134,50 @@ class SavedTripView(APIView):
         try:
             trip = SavedTrip.objects.get(pk=pk, user=request.user)
             trip.delete()
+            TripListVersion.bump(request.user)
             return Response({"message": "Trip deleted successfully"}, status=status.HTTP_200_OK)
         except SavedTrip.DoesNotExist:
             return Response({"error": "Trip not found"}, status=status.HTTP_404_NOT_FOUND)
 
-class ItineraryAgentView(APIView):
+class ItineraryAgentView(AsyncAPIView):
     """
     POST /api/v1/plan/
     Body: { "preferences": "I want a 7 day honeymoon in the hill country" }
+    Optional: "mode": "single" | "chunked" (defaults to chunked for long trips)
+              "use_cache": false to force a fresh generation
+              "background": true to enqueue a job and get 202 + job id (poll /api/v1/plan/jobs/<id>/)
     """
     permission_classes = [IsAuthenticated]
 
-    def post(self, request):
+    async def post(self, request):
         preferences = request.data.get("preferences")
         
         if not preferences:
             return Response({"error": "Preferences are required."}, status=status.HTTP_400_BAD_REQUEST)
 
+        if request.data.get("background") is True:
+            job = await sync_to_async(job_queue.enqueue)(
+                request.user, preferences,
+                mode=request.data.get("mode"),
+                use_cache=request.data.get("use_cache", True) is not False
+            )
+            return Response({
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/api/v1/plan/jobs/{job.id}/"
+            }, status=status.HTTP_202_ACCEPTED)
+
         try:
-            # Initialize Service
-            # Note: In a real app we might inject this or keep a singleton
-            agent = LLaMAService()
+            # Shared per-worker service (see services/registry.py)
+            agent = get_llama_service()
             
             # Generate Logic
-            itinerary_json = agent.generate_itinerary(preferences)
+            with ollama_caller(request.user.pk):
+                itinerary_json = await agent.agenerate_itinerary(
+                    preferences,
+                    mode=request.data.get("mode"),
+                    use_cache=request.data.get("use_cache", True) is not False
+                )
             
             print("\n--- DEBUG: GENERATED ITINERARY ---")
             print(itinerary_json)
@@ -97,20 +188,136 @@ class ItineraryAgentView(APIView):
 
             return Response(itinerary_json, status=status.HTTP_200_OK)
 
+        except AdmissionRejected as e:
+            return _rejected_response(e)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-from .services.trip_assistant import TripAssistantService
+def _sse_event(event, data):
+    """Format a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+class ItineraryStreamView(AsyncAPIView):
+    """
+    POST /api/v1/plan/stream/
+    Body: same as /api/v1/plan/
+    Streams the itinerary as Server-Sent Events: `meta` (title/summary as they close),
+    `day` (each completed day), then `done` with the full itinerary, or `chat` / `error`.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        preferences = request.data.get("preferences")
+
+        if not preferences:
+            return Response({"error": "Preferences are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-class TripAssistantView(APIView):
+        agent = get_llama_service()
+        use_cache = request.data.get("use_cache", True) is not False
+        user_pk = request.user.pk
+
+        # Async generator: under ASGI Django would buffer a sync one to the end before sending
+        async def event_stream():
+            with ollama_caller(user_pk):
+                async for event, data in agent.astream_itinerary(preferences, use_cache=use_cache):
+                    yield _sse_event(event, data)
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no" # Stop nginx-style proxies from buffering the stream
+        return response
+
+class ItineraryJobView(AsyncAPIView):
+    """
+    GET /api/v1/plan/jobs/<id>/            current status (and result once finished)
+    GET /api/v1/plan/jobs/<id>/?stream=1   Server-Sent Events: `status` on every change, then `done` or `error`;
+                                           after `max_stream_seconds` a `timeout` event asks the client to reconnect
+    """
+    permission_classes = [IsAuthenticated]
+    poll_seconds = 1.0
+    max_stream_seconds = 600
+
+    def _payload(self, job):
+        payload = {
+            "job_id": job.id,
+            "status": job.status,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+        if job.status == ItineraryJob.SUCCEEDED:
+            payload["result"] = job.result
+        elif job.error:
+            payload["error"] = job.error
+        return payload
+
+    async def get(self, request, pk):
+        try:
+            job = await sync_to_async(ItineraryJob.objects.get)(pk=pk, user=request.user)
+        except ItineraryJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get("stream") not in ("1", "true"):
+            return Response(self._payload(job), status=status.HTTP_200_OK)
+
+        async def event_stream():
+            # Polls on the event loop, so a watching client holds no worker thread
+            current, last_state = job, None
+            deadline = time.monotonic() + self.max_stream_seconds
+            while True:
+                state = (current.status, current.attempts)
+                if state != last_state:
+                    yield _sse_event("status", {"status": current.status, "attempts": current.attempts})
+                    last_state = state
+                if current.is_finished:
+                    event = "done" if current.status == ItineraryJob.SUCCEEDED else "error"
+                    yield _sse_event(event, self._payload(current))
+                    return
+                if time.monotonic() >= deadline:
+                    yield _sse_event("timeout", {"job_id": pk, "status": current.status})
+                    return
+                await asyncio.sleep(self.poll_seconds)
+                current = await sync_to_async(ItineraryJob.objects.get)(pk=pk)
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+class CrowdCalendarView(APIView):
+    """
+    GET /api/v1/calendar/?start=2026-12-28&end=2027-01-06
+    Holidays, Poya days and precomputed crowd levels for each date in the range (max 366 days).
+    """
+    permission_classes = [IsAuthenticated]
+    max_days = 366
+
+    def get(self, request):
+        try:
+            start = datetime.strptime(request.query_params.get("start", ""), "%Y-%m-%d").date()
+            end = datetime.strptime(request.query_params.get("end", "") or start.isoformat(), "%Y-%m-%d").date()
+        except ValueError:
+            return Response({"error": "start and end must be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if end < start or (end - start).days >= self.max_days:
+            return Response({"error": f"end must be on or after start and within {self.max_days} days."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "days": holiday_calendar.range(start, end),
+            "holiday_data_years": holiday_calendar.years
+        }, status=status.HTTP_200_OK)
+
+class TripAssistantView(AsyncAPIView):
     """
     POST /api/v1/chat/
     Body: { "location": "Kandy", "query": "Should I go now?", "lat": 7.29, "lon": 80.63 }
-    Context-aware Helper (Phase 2)
+    Context-aware Helper (Phase 2). Returns { "advice": ..., "source": "rules" | "llm" }.
     """
     permission_classes = [IsAuthenticated]
     
-    def post(self, request):
+    async def post(self, request):
         location = request.data.get("location")
         query = request.data.get("query")
         lat = request.data.get("lat")
@@ -123,9 +330,52 @@ class TripAssistantView(APIView):
              return Response({"error": "Location and Query are required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            assistant = TripAssistantService()
-            advice = assistant.get_advice(query, location, lat, lon, activity, description, theme)
+            assistant = get_trip_assistant()
+            with ollama_caller(request.user.pk):
+                result = await assistant.aget_advice(query, location, lat, lon, activity, description, theme)
             
-            return Response({"advice": advice}, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_200_OK)
+        except AdmissionRejected as e:
+            return _rejected_response(e)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class TripBatchAdviceView(AsyncAPIView):
+    """
+    POST /api/v1/chat/batch/
+    Body: { "itinerary": {...} } or { "trip_id": 12 }, optional "start_date": "2026-12-28"
+    Advice for every activity of the trip from one forecast request and one LLM call.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        itinerary = request.data.get("itinerary")
+        trip_id = request.data.get("trip_id")
+
+        if trip_id is not None:
+            try:
+                trip = await sync_to_async(SavedTrip.objects.get)(pk=trip_id, user=request.user)
+            except (SavedTrip.DoesNotExist, ValueError, TypeError):
+                return Response({"error": "Trip not found"}, status=status.HTTP_404_NOT_FOUND)
+            itinerary = trip.get_itinerary()
+
+        if not isinstance(itinerary, dict) or not itinerary.get("days"):
+            return Response({"error": "An itinerary with days or a saved trip_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        start_date = request.data.get("start_date") or itinerary.get("start_date") or itinerary.get("startDate")
+        try:
+            start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        except (TypeError, ValueError):
+            return Response({"error": "start_date must be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            assistant = get_trip_assistant()
+            with ollama_caller(request.user.pk):
+                result = await assistant.aget_batch_advice(itinerary, start_date)
+            return Response(result, status=status.HTTP_200_OK)
+        except BatchAdviceError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except AdmissionRejected as e:
+            return _rejected_response(e)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
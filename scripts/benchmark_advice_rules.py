@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import itertools
+from datetime import date, timedelta
+from collections import Counter
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from travel_api.services.advice_rules import AdviceRuleEngine
+from travel_api.services.holiday_calendar import holiday_calendar
+
+# Offline estimate of how many /chat/ requests the rule engine answers without the LLM.
+# Live traffic numbers are under "advice_rules" in /api/v1/admin/stats/.
+
+QUERIES = [
+    "How is the weather right now?",  # ActiveJourneyPanel quick actions
+    "Is it crowded?",
+    "Where can I eat nearby?",
+    "Should I go now?",
+    "Is it safe to go out?",
+    "What is the history of this place?",
+]
+ACTIVITIES = [
+    ("Relax on Unawatuna Beach", "Swim and sunbathe", "Beach Relaxation"),
+    ("Climb Sigiriya Rock", "Early morning hike to the summit", "Adventure"),
+    ("Temple of the Tooth", "Visit the sacred relic", "Culture & Heritage"),
+    ("Yala Safari", "Jeep safari to spot leopards", "Wildlife"),
+    ("Galle Fort Walk", "Stroll the ramparts", "Culture & Heritage"),
+    ("Colombo National Museum", "Explore the galleries", "Culture & Heritage"),
+    ("Whale Watching in Mirissa", "Boat trip", "Beach Relaxation"),
+    ("Free time", "Explore at your own pace", "Relaxed"),
+]
+# Roughly Sri Lanka's mix: mostly fair or cloudy, frequent showers, some storms
+WEATHER = [(0, 0.15), (2, 0.3), (3, 0.1), (61, 0.15), (63, 0.1), (80, 0.1), (95, 0.05), (45, 0.05)]
+
+
+def main():
+    engine = AdviceRuleEngine()
+    start = date.today()
+    days = [holiday_calendar.day(start + timedelta(days=i)) for i in range(365)]
+
+    answered = total = 0.0
+    rules = Counter()
+    elapsed = 0.0
+    for query, (activity, description, theme), (code, weight) in itertools.product(QUERIES, ACTIVITIES, WEATHER):
+        weather = {"weather_code": code, "temperature_2m": 29}
+        for day in days:
+            t0 = time.perf_counter()
+            result = engine.evaluate(query, weather, day, activity, description, theme)
+            elapsed += time.perf_counter() - t0
+            total += weight
+            if result:
+                answered += weight
+                rules[result["rule"].split(":")[0]] += 1
+
+    evaluations = len(QUERIES) * len(ACTIVITIES) * len(WEATHER) * len(days)
+    print(f"\n=== Advice rule engine (min confidence {engine.min_confidence}) ===")
+    print(f"  evaluations:            {evaluations}")
+    print(f"  weighted hit rate:      {answered / total:.1%}")
+    print(f"  mean evaluation time:   {elapsed / evaluations * 1e6:.1f} µs (an LLM answer takes seconds)")
+    print(f"  answered by intent:     {dict(rules)}")
+
+    print("\n  Per query:")
+    for query in QUERIES:
+        hits = sum(
+            1 for (activity, description, theme), (code, _) in itertools.product(ACTIVITIES, WEATHER)
+            if engine.evaluate(query, {"weather_code": code, "temperature_2m": 29}, days[0], activity, description, theme)
+        )
+        print(f"    {query:40s} {hits}/{len(ACTIVITIES) * len(WEATHER)} combinations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from django.db import connection
+from psycopg2.extras import execute_values
+
+# Synthetic copy of travel_api_itinerarycache's lookup columns; never touches the real table
+TABLE = "bench_itinerarycache"
+DIM = 768
+
+
+def vector_literal(vec):
+    return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+
+
+def build_table(cursor, rows, batch=5000, seed=42):
+    rng = np.random.default_rng(seed)
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""
+        CREATE UNLOGGED TABLE {TABLE} (
+            id bigserial PRIMARY KEY,
+            query_text text NOT NULL,
+            query_digest varchar(32) GENERATED ALWAYS AS (md5(query_text)) STORED,
+            embedding vector({DIM}) NOT NULL
+        )
+    """)
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        count = min(batch, rows - offset)
+        vectors = rng.standard_normal((count, DIM), dtype=np.float32)
+        values = [(f"Duration: {(offset + i) % 14 + 1} Days | Query {offset + i}", vector_literal(v)) for i, v in enumerate(vectors)]
+        execute_values(cursor.cursor, f"INSERT INTO {TABLE} (query_text, embedding) VALUES %s", values, template="(%s, %s::vector)")
+    print(f"  loaded {rows} rows in {time.perf_counter() - start:.1f}s")
+
+
+def time_query(cursor, sql, params, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+
+
+def benchmark(rows, repeats, ef_search):
+    print(f"\n=== {rows:,} rows ===")
+    rng = np.random.default_rng(7)
+    probe = vector_literal(rng.standard_normal(DIM, dtype=np.float32))
+    middle = rows // 2
+    probe_text = f"Duration: {middle % 14 + 1} Days | Query {middle}"
+
+    exact_sql = f"SELECT id FROM {TABLE} WHERE query_digest = md5(%s) AND query_text = %s"
+    old_exact_sql = f"SELECT id FROM {TABLE} WHERE query_text = %s LIMIT 1"
+    ann_sql = f"SELECT id, embedding <=> %s::vector AS distance FROM {TABLE} ORDER BY distance LIMIT 1"
+
+    with connection.cursor() as cursor:
+        build_table(cursor, rows)
+
+        # Baseline: what the code did before the indexes existed
+        seq_exact = time_query(cursor, old_exact_sql, [probe_text], repeats)
+        seq_ann = time_query(cursor, ann_sql, [probe], max(1, repeats // 5))
+
+        start = time.perf_counter()
+        cursor.execute(f"CREATE INDEX ON {TABLE} USING hash (query_digest)")
+        cursor.execute(f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)")
+        print(f"  index build: {time.perf_counter() - start:.1f}s")
+        cursor.execute(f"ANALYZE {TABLE}")
+        cursor.execute("SET hnsw.ef_search = %s", [ef_search])
+
+        idx_exact = time_query(cursor, exact_sql, [probe_text, probe_text], repeats)
+        idx_ann = time_query(cursor, ann_sql, [probe], repeats)
+
+        cursor.execute(f"SELECT pg_size_pretty(pg_total_relation_size('{TABLE}'))")
+        size = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {TABLE}")
+
+    print(f"  exact lookup   seq scan p50 {seq_exact[0]:8.2f} ms  p95 {seq_exact[1]:8.2f} ms")
+    print(f"  exact lookup   hash idx p50 {idx_exact[0]:8.2f} ms  p95 {idx_exact[1]:8.2f} ms")
+    print(f"  nearest vector seq scan p50 {seq_ann[0]:8.2f} ms  p95 {seq_ann[1]:8.2f} ms")
+    print(f"  nearest vector hnsw     p50 {idx_ann[0]:8.2f} ms  p95 {idx_ann[1]:8.2f} ms  (ef_search={ef_search})")
+    print(f"  table + indexes: {size}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ItineraryCache lookups with and without the HNSW/hash indexes.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated row counts")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--ef-search", type=int, default=40)
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        benchmark(size, args.repeats, args.ef_search)
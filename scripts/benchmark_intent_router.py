@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+from collections import Counter
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from travel_api.services.llama_service import LLaMAService
+from travel_api.services.intent_router import IntentRouter, keyword_intent, ITINERARY, CHAT, ADVICE, MODIFY_ITINERARY
+
+# Held-out messages (none of these are router seed examples). Needs Ollama running.
+LABELLED = [
+    ("Plan 4 days in the south for a couple", ITINERARY),
+    ("I'd like a 12-day tour of the whole island with my parents", ITINERARY),
+    ("honeymoon in sri lanka, 9 nights, we love beaches", ITINERARY),
+    ("Organise a surf holiday in Arugam Bay for a week", ITINERARY),
+    ("Weekend escape from Colombo for two friends", ITINERARY),
+    ("Route for 5 days through tea country by train", ITINERARY),
+    ("What day of the week is best to visit Pinnawala?", CHAT),
+    ("How many days do I need to see Sri Lanka?", CHAT),
+    ("What is a good trip souvenir to buy?", CHAT),
+    ("Can I visit temples wearing shorts?", CHAT),
+    ("Which vaccinations do I need?", CHAT),
+    ("Is tap water safe to drink?", CHAT),
+    ("Tell me a fun fact about elephants in Sri Lanka", CHAT),
+    ("Thanks, that was helpful!", CHAT),
+    ("Is it raining in Galle right now?", ADVICE),
+    ("Should we still do the safari with these clouds?", ADVICE),
+    ("How crowded will Dalada Maligawa be today?", ADVICE),
+    ("Is the sea too rough for snorkelling this morning?", ADVICE),
+    ("Is it too foggy for the Horton Plains walk now?", ADVICE),
+    ("Change day 5 to somewhere quieter", MODIFY_ITINERARY),
+    ("Can you drop the museum and add more beach time?", MODIFY_ITINERARY),
+    ("Move the Sigiriya visit to the first day of my plan", MODIFY_ITINERARY),
+    ("Make the itinerary cheaper please", MODIFY_ITINERARY),
+    ("Extend my trip by two days in Kandy", MODIFY_ITINERARY),
+]
+
+
+def accuracy(predict):
+    confusion = Counter()
+    correct = 0
+    for text, expected in LABELLED:
+        got = predict(text)
+        confusion[(expected, got)] += 1
+        correct += got == expected
+    return correct / len(LABELLED), confusion
+
+
+def itinerary_decision(intent):
+    # What actually matters for cost: is a full itinerary generation started?
+    return intent == ITINERARY
+
+
+def main():
+    llama = LLaMAService()
+    router = IntentRouter()
+
+    started = time.perf_counter()
+    if not router.ensure_centroids(llama.get_embeddings):
+        print("Could not build centroids; is Ollama running?")
+        return
+    print(f"\nCentroids ready in {(time.perf_counter() - started) * 1000:.0f} ms ({sum(len(v) for v in router.examples.values())} examples)")
+
+    # Keyword heuristic: no I/O
+    t0 = time.perf_counter()
+    kw_acc, _ = accuracy(keyword_intent)
+    kw_ms = (time.perf_counter() - t0) * 1000 / len(LABELLED)
+
+    # Router, cold (embedding fetched from Ollama or the cache table) and warm (in-memory cache)
+    def predict(text):
+        return router.classify(text, llama.get_embeddings([text])[0])[0]
+
+    t0 = time.perf_counter()
+    router_acc, confusion = accuracy(predict)
+    cold_ms = (time.perf_counter() - t0) * 1000 / len(LABELLED)
+    t0 = time.perf_counter()
+    accuracy(predict)
+    warm_ms = (time.perf_counter() - t0) * 1000 / len(LABELLED)
+
+    kw_route = sum(itinerary_decision(keyword_intent(t)) == itinerary_decision(e) for t, e in LABELLED) / len(LABELLED)
+    router_route = sum(itinerary_decision(predict(t)) == itinerary_decision(e) for t, e in LABELLED) / len(LABELLED)
+
+    print(f"\n=== Intent routing ({len(LABELLED)} held-out messages) ===")
+    print(f"{'':28s}{'keyword':>10s}{'router':>10s}")
+    print(f"{'4-way accuracy':28s}{kw_acc:>10.1%}{router_acc:>10.1%}")
+    print(f"{'itinerary vs not':28s}{kw_route:>10.1%}{router_route:>10.1%}")
+    print(f"{'added latency (cold)':28s}{kw_ms:>8.2f}ms{cold_ms:>8.1f}ms")
+    print(f"{'added latency (warm)':28s}{kw_ms:>8.2f}ms{warm_ms:>8.1f}ms")
+    print("  (the router's embedding is reused by the semantic cache lookup for itinerary requests)")
+
+    print("\nRouter misroutes:")
+    for (expected, got), n in sorted(confusion.items()):
+        if expected != got:
+            print(f"  {expected:>16s} -> {got:<16s} x{n}")
+
+
+if __name__ == "__main__":
+    main()
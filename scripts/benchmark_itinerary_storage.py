@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from django.db import connection
+from travel_api.models import ItineraryCache, SavedTrip
+from travel_api.services.itinerary_codec import compress_itinerary
+
+# Run once before and once after `manage.py compress_itineraries` to compare.
+
+
+def table_size(model):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_total_relation_size(%s), pg_size_pretty(pg_total_relation_size(%s))", [model._meta.db_table] * 2)
+        return cursor.fetchone()
+
+
+def timed(fn, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def compression_ratio(model, sample=200):
+    raw_total = packed_total = 0
+    for row in model.objects.only('itinerary_json', 'itinerary_blob').order_by('-pk')[:sample]:
+        data = row.get_itinerary()
+        if not data:
+            continue
+        raw_total += len(json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        packed_total += len(compress_itinerary(data))
+    return raw_total, packed_total
+
+
+def report(model, list_fields):
+    rows = model.objects.count()
+    size_bytes, size_pretty = table_size(model)
+    compressed_rows = model.objects.filter(itinerary_blob__isnull=False).count()
+    print(f"\n=== {model.__name__} ({rows} rows, {compressed_rows} compressed) ===")
+    print(f"  table + toast + indexes: {size_pretty} ({size_bytes} bytes)")
+
+    raw, packed = compression_ratio(model)
+    if raw:
+        print(f"  sample payloads: {raw} bytes JSON -> {packed} bytes compressed (ratio {raw / packed:.1f}x)")
+
+    full_ms = timed(lambda: [r.get_itinerary() for r in model.objects.all()])
+    list_ms = timed(lambda: list(model.objects.values(*list_fields)))
+    print(f"  list with full payloads:  {full_ms:8.1f} ms")
+    print(f"  list projection only:     {list_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    report(SavedTrip, ["id", "title", "created_at"])
+    report(ItineraryCache, ["id", "query_text", "created_at"])
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from django.db import connection
+from psycopg2.extras import execute_values
+
+# Recall, latency and size of the float32 / halfvec / binary HNSW layouts on a synthetic
+# copy of travel_api_itinerarycache's embedding column; never touches the real table. The compact
+# layouts index an expression over `embedding`, as `manage.py vector_index` does.
+# --dim 1536 approximates the Supabase destinations table.
+TABLE = "bench_vector_quant"
+
+LAYOUTS = {
+    # name: (indexed expression, opclass, candidate ORDER BY)
+    "full": ("embedding", "vector_cosine_ops", "embedding <=> %(q)s::vector"),
+    "halfvec": ("(embedding::halfvec({dim}))", "halfvec_cosine_ops", "embedding::halfvec({dim}) <=> %(q)s::halfvec({dim})"),
+    "binary": ("(binary_quantize(embedding)::bit({dim}))", "bit_hamming_ops",
+               "binary_quantize(embedding)::bit({dim}) <~> binary_quantize(%(q)s::vector)::bit({dim})"),
+}
+
+
+def vector_literal(vec):
+    return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+
+
+def clustered_vectors(rng, rows, dim, clusters=200):
+    """Embedding-like data: queries about the same trip land near a shared centroid."""
+    centroids = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centroids[rng.integers(0, clusters, rows)] + 0.6 * rng.standard_normal((rows, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cache_vectors(limit):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT embedding::text FROM travel_api_itinerarycache LIMIT %s", [limit])
+        rows = [np.array(r[0].strip("[]").split(","), dtype=np.float32) for r in cursor.fetchall()]
+    vectors = np.vstack(rows)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_table(cursor, vectors, batch=5000):
+    dim = vectors.shape[1]
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""
+        CREATE UNLOGGED TABLE {TABLE} (
+            id bigserial PRIMARY KEY,
+            embedding vector({dim}) NOT NULL
+        )
+    """)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch):
+        values = [(vector_literal(v),) for v in vectors[offset:offset + batch]]
+        execute_values(cursor.cursor, f"INSERT INTO {TABLE} (embedding) VALUES %s", values, template="(%s::vector)")
+    print(f"  loaded {len(vectors)} rows in {time.perf_counter() - start:.1f}s")
+
+
+def search(cursor, layout, dim, query, k, candidates):
+    order = LAYOUTS[layout][2].format(dim=dim)
+    params = {"q": vector_literal(query), "k": k, "n": candidates}
+    if layout == "full":
+        cursor.execute(f"SELECT id FROM {TABLE} ORDER BY {order} LIMIT %(k)s", params)
+    else:
+        # Candidates from the compact index, re-ranked exactly on the float32 vectors
+        cursor.execute(f"""
+            SELECT id FROM (SELECT id, embedding FROM {TABLE} ORDER BY {order} LIMIT %(n)s) c
+            ORDER BY embedding <=> %(q)s::vector LIMIT %(k)s
+        """, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def benchmark(vectors, queries, k, candidates, ef_search):
+    rows, dim = vectors.shape
+    print(f"\n=== {rows:,} rows x {dim} dims, {len(queries)} queries, top {k}, {candidates} re-rank candidates ===")
+    # Ground truth: exact cosine neighbours (ids are 1-based insertion order)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k] + 1
+
+    results = {}
+    with connection.cursor() as cursor:
+        build_table(cursor, vectors)
+        for layout, (expression, opclass, _) in LAYOUTS.items():
+            start = time.perf_counter()
+            expression = expression.format(dim=dim)
+            cursor.execute(f"CREATE INDEX {TABLE}_{layout} ON {TABLE} USING hnsw ({expression} {opclass}) WITH (m = 16, ef_construction = 64)")
+            build = time.perf_counter() - start
+            cursor.execute(f"ANALYZE {TABLE}")
+            cursor.execute("SET hnsw.ef_search = %s", [max(ef_search, candidates if layout != "full" else k)])
+
+            timings, hits_1, hits_k = [], 0, 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                found = search(cursor, layout, dim, query, k, candidates)
+                timings.append((time.perf_counter() - started) * 1000)
+                hits_1 += bool(found) and found[0] == expected[0]
+                hits_k += len(set(found) & set(expected.tolist()))
+            timings.sort()
+
+            cursor.execute(f"SELECT pg_relation_size('{TABLE}_{layout}')")
+            index_bytes = cursor.fetchone()[0]
+            # Keep only one index at a time so each layout is measured on its own
+            cursor.execute(f"DROP INDEX {TABLE}_{layout}")
+            results[layout] = (hits_1 / len(queries), hits_k / (len(queries) * k), timings[len(timings) // 2],
+                               timings[int(len(timings) * 0.95) - 1], build, index_bytes)
+
+        cursor.execute(f"SELECT pg_size_pretty(pg_total_relation_size('{TABLE}'))")
+        size = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {TABLE}")
+
+    print(f"  {'layout':<8} {'recall@1':>9} {'recall@' + str(k):>10} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'index MiB':>10}")
+    for layout, (r1, rk, p50, p95, build, index_bytes) in results.items():
+        print(f"  {layout:<8} {r1:>9.3f} {rk:>10.3f} {p50:>8.2f} {p95:>8.2f} {build:>8.1f} {index_bytes / 2 ** 20:>10.1f}")
+    print(f"  table (no indexes): {size}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark float32 vs halfvec vs binary-quantized HNSW search with exact re-ranking.")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated row counts (synthetic data)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--from-cache", action="store_true", help="Use real ItineraryCache embeddings instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=40, help="Compact-index candidates re-ranked at full precision")
+    parser.add_argument("--ef-search", type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    datasets = [cache_vectors(max(int(s) for s in args.sizes.split(",")))] if args.from_cache else \
+        [clustered_vectors(rng, int(s), args.dim) for s in args.sizes.split(",")]
+    for vectors in datasets:
+        # Queries are paraphrase-like perturbations of stored rows, as in cache lookups
+        picks = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = picks + 0.05 * rng.standard_normal(picks.shape, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        benchmark(vectors, queries.astype(np.float32), args.k, args.candidates, args.ef_search)
@@ -1,90 +1,294 @@
 import os
-import pandas as pd
+import re
+import csv
+import sys
 import json
-from supabase import create_client, Client
-from openai import OpenAI
+import time
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import requests
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Setup Clients
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DATABASE_URL = os.getenv("DATABASE_URL")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 
-if not all([SUPABASE_URL, SUPABASE_KEY, OPENAI_API_KEY]):
-    print("Error: Missing environment variables. Please check .env file.")
-    exit(1)
+DATA_FILE = "data/SriLanka_Travel_Dataset_Final.csv"
+CHECKPOINT_FILE = "data/.ingest_checkpoint.json"
+REQUIRED_COLS = ['Location_Name', 'Located_City', 'Location', 'Location_Type', 'Avg_Rating', 'AI_Context']
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+CHUNK_SIZE = 256       # CSV rows read, embedded and committed together
+EMBED_BATCH_SIZE = 32  # texts per embedding request
+WORKERS = 4            # embedding requests in flight
+EMBED_ATTEMPTS = 3
 
-DATA_FILE = "data/SriLanka_Travel_Dataset_Final.csv"
+# Streams the dataset into the `destinations` table in chunks:
+#   - rows whose content hash is already stored are skipped without re-embedding,
+#   - the rest are embedded in batches on a bounded worker pool and upserted per chunk,
+#   - a checkpoint is written after each committed chunk, so a rerun resumes there.
+# Usage: python scripts/ingest_data.py [--embedder openai|ollama] [--restart]
+
+
+class OllamaEmbedder:
+    """Local embeddings from Ollama's /api/embed."""
+
+    def __init__(self, model=None):
+        self.name = "ollama"
+        self.model = model or os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+        self.url = f"{OLLAMA_HOST}/api/embed"
+        self.session = requests.Session()
+
+    def embed(self, texts):
+        response = self.session.post(self.url, json={"model": self.model, "input": texts}, timeout=300)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+
+class OpenAIEmbedder:
+    """Hosted embeddings; text-embedding-3-small matches the vector(1536) column."""
+
+    def __init__(self, model=None):
+        from openai import OpenAI
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        self.name = "openai"
+        self.model = model or os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        self.client = OpenAI(api_key=api_key)
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
-def get_embedding(text):
-    text = text.replace("\n", " ")
-    return openai_client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
-
-def ingest_data():
-    if not os.path.exists(DATA_FILE):
-        print(f"Error: Data file {DATA_FILE} not found.")
-        return
-
-    print(f"Loading data from {DATA_FILE}...")
-    df = pd.read_csv(DATA_FILE)
-    
-    # Ensure columns exist
-    required_cols = ['Location_Name', 'Located_City', 'Location', 'Location_Type', 'Avg_Rating', 'AI_Context']
-    if not all(col in df.columns for col in required_cols):
-        print(f"Error: Missing columns. Required: {required_cols}")
-        return
-
-    print(f"Found {len(df)} records. Starting ingestion...")
-    
-    success_count = 0
-    error_count = 0
-
-    for index, row in df.iterrows():
-        try:
-            # Generate Embedding
-            ai_context = row['AI_Context']
-            if pd.isna(ai_context) or str(ai_context).strip() == "":
-                print(f"Skipping row {index}: Empty Context")
-                continue
-                
-            embedding = get_embedding(str(ai_context))
-            
-            # Prepare Payload
-            # Note: Ensure table 'destinations' exists in Supabase with 'embedding' column (vector)
-            data = {
-                "location_name": row['Location_Name'],
-                "located_city": row['Located_City'],
-                "location_address": row['Location'],
-                "location_type": row['Location_Type'],
-                "avg_rating": row['Avg_Rating'] if pd.notnull(row['Avg_Rating']) else None,
-                "ai_context": ai_context,
-                "embedding": embedding
-                # Latitude/Longitude would go here if we had them
-            }
-            
-            # Insert into Supabase
-            response = supabase.table("destinations").insert(data).execute()
-            if response.data:
-                success_count += 1
-                if success_count % 10 == 0:
-                    print(f"Ingested {success_count} records...")
-            else:
-                 print(f"Failed to insert row {index}: No data returned")
-                 error_count += 1
 
+EMBEDDERS = {"openai": OpenAIEmbedder, "ollama": OllamaEmbedder}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_chunks(path, chunk_size, skip=0):
+    """Yield (first row number, rows) chunks from the CSV without loading it whole."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in REQUIRED_COLS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}. Required: {REQUIRED_COLS}")
+        position = skip
+        for _ in itertools.islice(reader, skip):
+            pass
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield position, chunk
+            position += len(chunk)
+
+
+def prepare(record, embedder):
+    """Table row for a CSV record, or None when it has no context to embed."""
+    context = (record.get('AI_Context') or "").strip()
+    name = (record.get('Location_Name') or "").strip()
+    if not context or not name:
+        return None
+    try:
+        rating = float(record.get('Avg_Rating') or "")
+    except ValueError:
+        rating = None
+    row = {
+        "location_name": name,
+        "located_city": (record.get('Located_City') or "").strip() or None,
+        "location_address": (record.get('Location') or "").strip() or None,
+        "location_type": (record.get('Location_Type') or "").strip() or None,
+        "avg_rating": rating,
+        "ai_context": context,
+    }
+    # One table row per place; the content hash also covers the embedding model,
+    # so switching models re-embeds everything on the next run.
+    row["source_key"] = hashlib.sha256(f"{name}\x1f{row['location_address'] or ''}".encode()).hexdigest()
+    row["content_hash"] = hashlib.sha256(json.dumps([row, embedder.name, embedder.model], sort_keys=True).encode()).hexdigest()
+    return row
+
+
+def embed_batch(embedder, texts):
+    for attempt in range(1, EMBED_ATTEMPTS + 1):
+        try:
+            vectors = embedder.embed(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+            return vectors
         except Exception as e:
-            print(f"Error processing row {index} ({row.get('Location_Name')}): {e}")
-            error_count += 1
+            if attempt == EMBED_ATTEMPTS:
+                raise
+            print(f"⚠️ Embedding batch failed ({e}); retrying ({attempt}/{EMBED_ATTEMPTS - 1})...")
+            time.sleep(2 ** attempt)
+
+
+def embed_rows(pool, embedder, rows, batch_size):
+    texts = [row["ai_context"].replace("\n", " ") for row in rows]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    return [vector for vectors in pool.map(lambda batch: embed_batch(embedder, batch), batches) for vector in vectors]
 
+
+def ensure_schema(cur):
+    """Add the ingestion bookkeeping columns to an existing table; returns the embedding dimension."""
+    cur.execute("alter table destinations add column if not exists source_key text")
+    cur.execute("alter table destinations add column if not exists content_hash text")
+    # Rows loaded by the old row-by-row script: key them the same way as prepare() and
+    # drop the duplicates its reruns left behind. Their content_hash stays null, so they
+    # are re-embedded once.
+    cur.execute("""
+        update destinations
+        set source_key = encode(sha256(convert_to(btrim(location_name) || chr(31) || coalesce(btrim(location_address), ''), 'UTF8')), 'hex')
+        where source_key is null
+    """)
+    cur.execute("delete from destinations a using destinations b where a.source_key = b.source_key and a.id < b.id")
+    cur.execute("create unique index if not exists destinations_source_key_idx on destinations (source_key)")
+    cur.execute("""
+        select format_type(atttypid, atttypmod) from pg_attribute
+        where attrelid = 'destinations'::regclass and attname = 'embedding'
+    """)
+    column = cur.fetchone()
+    match = re.search(r"\((\d+)\)", column[0]) if column else None
+    return int(match.group(1)) if match else None
+
+
+def stored_hashes(cur, keys):
+    cur.execute("select source_key, content_hash from destinations where source_key = any(%s)", (keys,))
+    return dict(cur.fetchall())
+
+
+def upsert(cur, rows, vectors):
+    values = [
+        (row["source_key"], row["content_hash"], row["location_name"], row["located_city"], row["location_address"],
+         row["location_type"], row["avg_rating"], row["ai_context"], "[" + ",".join(map(str, vector)) + "]")
+        for row, vector in zip(rows, vectors)
+    ]
+    execute_values(cur, """
+        insert into destinations (source_key, content_hash, location_name, located_city, location_address,
+                                  location_type, avg_rating, ai_context, embedding)
+        values %s
+        on conflict (source_key) do update set
+            content_hash = excluded.content_hash,
+            location_name = excluded.location_name,
+            located_city = excluded.located_city,
+            location_address = excluded.location_address,
+            location_type = excluded.location_type,
+            avg_rating = excluded.avg_rating,
+            ai_context = excluded.ai_context,
+            embedding = excluded.embedding
+    """, values, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s::vector)", page_size=len(values))
+
+
+def load_checkpoint(path, source, embedder):
+    """Rows already committed by an interrupted run over the same file and model, else 0."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    if (checkpoint.get("sha256"), checkpoint.get("embedder"), checkpoint.get("model")) != (source, embedder.name, embedder.model):
+        print("Checkpoint is for a different file or model; starting from the top.")
+        return 0
+    return checkpoint.get("rows_done", 0)
+
+
+def save_checkpoint(path, source, embedder, rows_done):
+    with open(path + ".tmp", "w") as f:
+        json.dump({"sha256": source, "embedder": embedder.name, "model": embedder.model, "rows_done": rows_done}, f)
+    os.replace(path + ".tmp", path)
+
+
+def ingest_data(args):
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL not found in .env")
+        return 1
+    if not os.path.exists(args.file):
+        print(f"Error: Data file {args.file} not found.")
+        return 1
+
+    embedder = EMBEDDERS[args.embedder]()
+    source = file_sha256(args.file)
+    skip = 0 if args.restart else load_checkpoint(args.checkpoint, source, embedder)
+    if skip:
+        print(f"Resuming after row {skip} (checkpoint {args.checkpoint}).")
+    print(f"Ingesting {args.file} with {embedder.name}/{embedder.model}: chunks of {args.chunk_size}, "
+          f"batches of {args.batch_size}, {args.workers} workers.")
+
+    conn = psycopg2.connect(DATABASE_URL)
+    cur = conn.cursor()
+    dim = ensure_schema(cur)
+    conn.commit()
+
+    counts = {"read": 0, "embedded": 0, "unchanged": 0, "empty": 0}
+    started = time.perf_counter()
+    rows_done = skip
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for position, records in read_chunks(args.file, args.chunk_size, skip):
+                prepared = [prepare(record, embedder) for record in records]
+                counts["read"] += len(records)
+                counts["empty"] += prepared.count(None)
+                # Later duplicates of a place win, as they would with row-by-row inserts
+                rows = list({row["source_key"]: row for row in prepared if row}.values())
+
+                stored = stored_hashes(cur, [row["source_key"] for row in rows])
+                todo = [row for row in rows if stored.get(row["source_key"]) != row["content_hash"]]
+                counts["unchanged"] += len(rows) - len(todo)
+
+                if todo:
+                    vectors = embed_rows(pool, embedder, todo, args.batch_size)
+                    if dim and len(vectors[0]) != dim:
+                        raise ValueError(f"{embedder.model} returns {len(vectors[0])} dimensions but destinations.embedding is vector({dim})")
+                    upsert(cur, todo, vectors)
+                    counts["embedded"] += len(todo)
+                conn.commit()
+
+                rows_done = position + len(records)
+                save_checkpoint(args.checkpoint, source, embedder, rows_done)
+                elapsed = time.perf_counter() - started
+                print(f"Row {rows_done}: {counts['embedded']} embedded, {counts['unchanged']} unchanged, "
+                      f"{counts['empty']} empty - {counts['read'] / elapsed:.1f} rows/sec")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Ingestion stopped: {e}")
+        print(f"Rows up to {rows_done} are committed; rerun to resume from there.")
+        return 1
+    finally:
+        cur.close()
+        conn.close()
+
+    if os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    elapsed = time.perf_counter() - started
     print(f"--- Ingestion Complete ---")
-    print(f"Success: {success_count}")
-    print(f"Errors: {error_count}")
+    print(f"Read: {counts['read']} rows in {elapsed:.1f}s ({counts['read'] / max(elapsed, 1e-9):.1f} rows/sec)")
+    print(f"Embedded: {counts['embedded']}  Unchanged: {counts['unchanged']}  Empty context: {counts['empty']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the destinations dataset into Postgres.")
+    parser.add_argument("--file", default=DATA_FILE)
+    parser.add_argument("--embedder", choices=sorted(EMBEDDERS), default=os.getenv("INGEST_EMBEDDER", "openai"))
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and rescan every row")
+    return ingest_data(parser.parse_args())
+
 
 if __name__ == "__main__":
-    ingest_data()
+    sys.exit(main())
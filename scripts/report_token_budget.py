@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.append(os.path.join(os.getcwd(), 'backend'))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'travel_ai_backend.settings')
+import django
+django.setup()
+
+from travel_api.services.llama_service import LLaMAService
+from travel_api.services.http_client import http_client, OLLAMA
+from travel_api.services.token_budget import token_budget, KV_BYTES_PER_TOKEN
+
+# Planned context/output per trip length vs the old fixed num_ctx 8192 / num_predict 4096.
+# Pass --live to also time real generations (needs Ollama) with both settings.
+
+FIXED = {"num_ctx": 8192, "num_predict": 4096}
+
+
+def mib(ctx):
+    return ctx * KV_BYTES_PER_TOKEN / 2 ** 20
+
+
+def prefs_for(llama, days):
+    return llama._parse_preferences({"duration": days, "startLocation": "Colombo", "groupSize": "Couple", "tripType": "Culture"})
+
+
+def run(llama, payload):
+    started = time.perf_counter()
+    response = http_client.post(OLLAMA, llama.ollama_url, json=payload)
+    response.raise_for_status()
+    body = response.json()
+    return time.perf_counter() - started, body.get("eval_count", 0), body.get("load_duration", 0) / 1e9, body.get("done_reason")
+
+
+def main():
+    llama = LLaMAService()
+    print(f"\nTokenizer: {token_budget.tokenizer.source or 'loading...'}")
+    print(f"\n{'days':>4} {'prompt':>7} {'num_predict':>12} {'num_ctx':>8} {'KV MiB':>8} {'fixed KV MiB':>13}")
+    for days in (1, 2, 3, 5, 7, 10, 14):
+        payload = llama._build_itinerary_payload(prefs_for(llama, days))
+        options = payload["options"]
+        prompt = token_budget.count_messages(payload["messages"])
+        print(f"{days:>4} {prompt:>7} {options['num_predict']:>12} {options['num_ctx']:>8} {mib(options['num_ctx']):>8.0f} {mib(FIXED['num_ctx']):>13.0f}")
+    print(f"(tokenizer: {token_budget.tokenizer.source}; KV size assumes {KV_BYTES_PER_TOKEN} bytes per context token)")
+
+    if "--live" not in sys.argv:
+        return
+
+    print(f"\n{'days':>4} {'setting':>9} {'seconds':>8} {'tokens':>7} {'load s':>7} {'stop':>7}")
+    for days in (2, 7, 14):
+        planned = llama._build_itinerary_payload(prefs_for(llama, days))
+        fixed = {**planned, "options": {**planned["options"], **FIXED}}
+        for label, payload in (("fixed", fixed), ("planned", planned)):
+            seconds, tokens, load, reason = run(llama, payload)
+            print(f"{days:>4} {label:>9} {seconds:>8.1f} {tokens:>7} {load:>7.1f} {reason or '':>7}")
+
+
+if __name__ == "__main__":
+    main()
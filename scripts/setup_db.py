@@ -1,11 +1,13 @@
 import os
+import sys
 import psycopg2
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-SCHEMA_FILE = "backend/supabase_schema.sql"
+# Optional argument: another SQL file to run, e.g. backend/supabase_quantize_embeddings.sql
+SCHEMA_FILE = sys.argv[1] if len(sys.argv) > 1 else "backend/supabase_schema.sql"
 
 def setup_database():
     if not DATABASE_URL:
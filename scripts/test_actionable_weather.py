@@ -18,7 +18,7 @@ def test_actionable_advice():
         theme="Beach Relaxation"
     )
     # Note: Live weather might not be rainy in Galle right now, but we will see if the model evaluates it.
-    print(f"Advice: {bad_advice}")
+    print(f"Advice ({bad_advice['source']}): {bad_advice['advice']}")
 
 if __name__ == "__main__":
     test_actionable_advice()
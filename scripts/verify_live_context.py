@@ -25,7 +25,7 @@ def test_live_context():
         lat=colombo_lat, 
         lon=colombo_lon
     )
-    print(f"\nModel Advice:\n{advice1}")
+    print(f"\nModel Advice ({advice1['source']}):\n{advice1['advice']}")
 
     print("\n\n--- TEST 2: Crowd check in Kandy ---")
     advice2 = assistant.get_advice(
@@ -34,7 +34,7 @@ def test_live_context():
         lat=None, 
         lon=None
     )
-    print(f"\nModel Advice:\n{advice2}")
+    print(f"\nModel Advice ({advice2['source']}):\n{advice2['advice']}")
 
 if __name__ == "__main__":
     test_live_context()